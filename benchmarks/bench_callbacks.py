@@ -0,0 +1,74 @@
+"""
+Benchmark callback dispatch cost per update: the old chain of regex
+CallbackQueryHandlers versus the single CallbackRouter.
+
+Usage: python benchmarks/bench_callbacks.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import CallbackQuery, Update, User
+from telegram.ext import CallbackQueryHandler
+
+import callbacks as cb
+
+ESSAY_ID = 2791564293914624000
+
+# Patterns in the order the old main() registered them (conversation state, then globals)
+LEGACY_PATTERNS = [
+    "^create_essay$", "^browse_essays$", "^my_essays$", "^my_joined_essays$", "^back_to_main$",
+    "^join_essay_", "^continue_", "^confirm_write_", "^finish_request_", "^accept_finish_",
+    "^decline_finish_", "^back_to_main$", "^join_essay_", "^join_anon_", "^continue_",
+    "^confirm_write_", "^finish_request_", "^accept_finish_", "^decline_finish_",
+    "^create_essay$", "^my_essays$", "^my_joined_essays$", "^browse_essays$", "^anon_",
+]
+
+SAMPLES = [
+    ("back_to_main", cb.encode(cb.BACK)),
+    ("browse_essays", cb.encode(cb.BROWSE)),
+    (f"continue_{ESSAY_ID}", cb.encode(cb.CONTINUE, ESSAY_ID)),
+    (f"confirm_write_{ESSAY_ID}", cb.encode(cb.CONFIRM, ESSAY_ID)),
+    (f"decline_finish_{ESSAY_ID}", cb.encode(cb.DECLINE, ESSAY_ID)),
+    ("anon_yes", cb.encode(cb.ANON, True)),
+]
+
+
+def make_update(data):
+    user = User(id=1, first_name="bench", is_bot=False)
+    query = CallbackQuery(id="1", from_user=user, chat_instance="bench", data=data)
+    return Update(update_id=1, callback_query=query)
+
+
+async def noop(update, context):
+    return None
+
+
+def legacy_dispatch(update, handlers):
+    for handler in handlers:
+        if handler.check_update(update):
+            # Handlers then re-parsed the data themselves
+            return update.callback_query.data.split("_", 2)
+    return None
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    handlers = [CallbackQueryHandler(noop, pattern=pattern) for pattern in LEGACY_PATTERNS]
+    router = cb.CallbackRouter({action: object() for action in cb.ARG_TYPES})
+
+    print(f"{'callback':<28} {'legacy ns':>10} {'router ns':>10} {'speedup':>8}")
+    for legacy_data, data in SAMPLES:
+        legacy_update = make_update(legacy_data)
+        update = make_update(data)
+        legacy = timeit.timeit(lambda: legacy_dispatch(legacy_update, handlers), number=iterations)
+        routed = timeit.timeit(lambda: router.check_update(update), number=iterations)
+        legacy_ns = legacy / iterations * 1e9
+        routed_ns = routed / iterations * 1e9
+        print(f"{legacy_data[:28]:<28} {legacy_ns:>10.0f} {routed_ns:>10.0f} {legacy_ns / routed_ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Benchmark database.py functions against a seeded local Postgres.
+
+Seeds a configurable volume of essays, partners and sessions, then times each
+database.py function and counts the SQL statements it executes per call.
+Results are written to benchmarks/results/ as JSON so schema and query
+changes can be compared by numbers (--compare <previous.json>).
+
+Usage:
+    python benchmarks/bench_database.py --dsn postgresql://localhost/essay_bot_bench --essays 100000 --reset
+
+Never point --dsn at a production database: --reset truncates all tables.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--essays", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=None, help="distinct users (default: essays / 5)")
+    parser.add_argument("--sessions", type=int, default=None, help="user_session rows (default: users / 10)")
+    parser.add_argument("--repeat", type=int, default=50, help="calls per function")
+    parser.add_argument("--reset", action="store_true", help="truncate and reseed even if the volume matches")
+    parser.add_argument("--include-all", action="store_true", help="also time get_all_essays and iter_essays (slow at scale)")
+    parser.add_argument("--only", nargs="*", help="only run these functions")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+
+# database.py reads its configuration at import time; never let the production .env leak in
+os.environ["ENV_FILE"] = os.devnull
+os.environ["DATABASE_URL"] = ARGS.dsn
+os.environ.setdefault("METRICS_PORT", "0")
+
+import logging  # noqa: E402
+
+import database  # noqa: E402
+import partitions  # noqa: E402
+from ids import ID_EPOCH_MS  # noqa: E402
+
+logging.getLogger("database").setLevel(logging.WARNING)
+
+
+def seed(essays, users, sessions):
+    """Fill the tables server-side with generate_series"""
+    conn = database.get_connection()
+    cur = conn.cursor()
+    started = time.perf_counter()
+    cur.execute("TRUNCATE essays, partners, user_session, join_codes CASCADE")
+    conn.commit()
+    partitions.ensure_partitions(months_back=25)
+    # 20% waiting for a partner, 50% in progress, 30% complete, spread over the last two years;
+    # ids are built from created_at like real essay ids so rows land in their monthly partitions
+    cur.execute("""
+        INSERT INTO essays (id, join_code, creator_id, creator_name, topic, first_content, second_content,
+                            status, created_at, last_writer_id, is_anonymous)
+        SELECT ((extract(epoch FROM ts) * 1000)::bigint - %(epoch)s) << 22 | (g & 4194303),
+               'b' || g, g %% %(users)s, 'user' || (g %% %(users)s), 'Topic number ' || g,
+               repeat('opening words ', 10),
+               CASE WHEN g %% 10 >= 2 THEN repeat('continued words ', 20) END,
+               CASE WHEN g %% 10 < 2 THEN 'waiting_partner' WHEN g %% 10 < 7 THEN 'in_progress' ELSE 'complete' END,
+               ts,
+               CASE WHEN g %% 10 >= 2 THEN g %% %(users)s END,
+               g %% 4 = 0
+        FROM (SELECT g, now() - (random() * interval '730 days') AS ts FROM generate_series(1, %(essays)s) AS g) s
+    """, {"essays": essays, "users": users, "epoch": ID_EPOCH_MS})
+    cur.execute("INSERT INTO join_codes (join_code, essay_id) SELECT join_code, id FROM essays")
+    cur.execute("""
+        INSERT INTO partners (essay_id, partner_id, partner_name, is_anonymous)
+        SELECT id, (creator_id + 1 + (id %% 97)) %% %(users)s, 'partner', id %% 3 = 0
+        FROM essays WHERE status <> 'waiting_partner'
+    """, {"users": users})
+    cur.execute("""
+        INSERT INTO user_session (user_id, current_essay_id)
+        SELECT creator_id, max(id) FROM essays WHERE status = 'in_progress'
+        GROUP BY creator_id LIMIT %(sessions)s
+    """, {"sessions": sessions})
+    conn.commit()
+    cur.execute("ANALYZE essays; ANALYZE partners; ANALYZE user_session; ANALYZE join_codes")
+    conn.commit()
+    cur.close()
+    conn.close()
+    print(f"Seeded {essays} essays in {time.perf_counter() - started:.1f}s")
+
+
+def seeded_volume(essays):
+    """Number of seeded essays present (benchmark-created ones belong to the "bench" user)"""
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM essays WHERE creator_name <> 'bench'")
+    count = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return count
+
+
+def sample(query, params=None, limit=1000):
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.execute(query, params)
+    rows = [row[0] for row in cur.fetchmany(limit)]
+    cur.close()
+    conn.close()
+    return rows
+
+
+def build_cases(users):
+    """Map function name -> callable taking the repetition index"""
+    essay_ids = sample("SELECT id FROM essays TABLESAMPLE SYSTEM (10)") or sample("SELECT id FROM essays")
+    open_ids = sample("SELECT id FROM essays WHERE status = 'waiting_partner'")
+    join_codes = sample("SELECT join_code FROM essays TABLESAMPLE SYSTEM (10)") or sample("SELECT join_code FROM essays")
+    creators = sample("SELECT creator_id FROM essays GROUP BY creator_id ORDER BY count(*) DESC")
+    partners = sample("SELECT partner_id FROM partners GROUP BY partner_id ORDER BY count(*) DESC")
+    pairs = [tuple(row) for row in _rows("SELECT essay_id, partner_id FROM partners LIMIT 1000")]
+    bench_user = users + 1
+
+    created = []
+
+    def create(i):
+        created.append(database.create_essay(bench_user, "bench", f"Bench topic {i}")[0])
+
+    def add_partner(i):
+        # Fresh essays and random partner ids keep reruns clear of UNIQUE(essay_id, partner_id)
+        essay_id = created[i % len(created)] if created else random.choice(open_ids)
+        database.add_partner(essay_id, random.randrange(10**12, 2 * 10**12), "bench")
+
+    cases = {
+        "get_essay": lambda i: database.get_essay(random.choice(essay_ids)),
+        "get_essay_by_join_code": lambda i: database.get_essay_by_join_code(random.choice(join_codes)),
+        "get_available_essays": lambda i: database.get_available_essays(),
+        "get_user_essays": lambda i: database.get_user_essays(creators[i % len(creators)]),
+        "get_user_joined_essays": lambda i: database.get_user_joined_essays(partners[i % len(partners)]),
+        "check_partner_exists": lambda i: database.check_partner_exists(*random.choice(pairs)),
+        "update_essay": lambda i: database.update_essay(random.choice(essay_ids), last_writer_id=bench_user),
+        "create_essay": create,
+        "add_partner": add_partner,
+        "set_user_session": lambda i: database.set_user_session(bench_user, random.choice(essay_ids)),
+        "get_user_session": lambda i: database.get_user_session(bench_user),
+        "clear_user_session": lambda i: database.clear_user_session(bench_user),
+    }
+    if ARGS.include_all:
+        cases["get_all_essays"] = lambda i: database.get_all_essays()
+        cases["iter_essays"] = lambda i: sum(1 for _ in database.iter_essays())
+    if ARGS.only:
+        cases = {name: case for name, case in cases.items() if name in ARGS.only}
+    return cases
+
+
+def _rows(query):
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.execute(query)
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+
+def run_case(case, repeat):
+    timings = []
+    statements_before = database.statements_executed()
+    for i in range(repeat):
+        started = time.perf_counter()
+        case(i)
+        timings.append(time.perf_counter() - started)
+    statements = (database.statements_executed() - statements_before) / repeat
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(0.95 * len(timings)))] * 1000,
+        "min_ms": timings[0] * 1000,
+        "statements_per_call": statements,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    users = ARGS.users or max(ARGS.essays // 5, 10)
+    sessions = ARGS.sessions if ARGS.sessions is not None else users // 10
+
+    database.init_db()
+    if ARGS.reset or seeded_volume(ARGS.essays) != ARGS.essays:
+        seed(ARGS.essays, users, sessions)
+
+    results = {}
+    print(f"\n{'function':<26} {'median ms':>10} {'p95 ms':>10} {'stmts/call':>11}")
+    for name, case in build_cases(users).items():
+        repeat = min(ARGS.repeat, 5) if name in ("get_available_essays", "get_all_essays", "iter_essays") else ARGS.repeat
+        results[name] = run_case(case, repeat)
+        r = results[name]
+        print(f"{name:<26} {r['median_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['statements_per_call']:>11.1f}")
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "volume": {"essays": ARGS.essays, "users": users, "sessions": sessions},
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = ARGS.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{ARGS.essays}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if ARGS.compare:
+        with open(ARGS.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared to {ARGS.compare} (commit {baseline.get('commit')}, volume {baseline.get('volume')}):")
+        print(f"{'function':<26} {'median ms':>18} {'stmts/call':>14}")
+        for name, r in results.items():
+            old = baseline["results"].get(name)
+            if not old:
+                continue
+            change = (r["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0
+            print(f"{name:<26} {old['median_ms']:>7.2f} -> {r['median_ms']:>7.2f} ({change:+.0f}%) "
+                  f"{old['statements_per_call']:>5.1f} -> {r['statements_per_call']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark the cost of the log calls a handler makes on the event loop.
+
+Simulates a confirm_write-style handler (a handful of logger.info calls with
+arguments, one logger.debug) under three setups:
+
+    off    root level WARNING, records are dropped before formatting
+    sync   a StreamHandler writing straight to a file (the old basicConfig path)
+    queue  logging_setup.setup_logging(): enqueue only, JSON written by the listener
+
+Usage:
+    python benchmarks/bench_logging.py --calls 20000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import logging_setup  # noqa: E402
+
+logger = logging.getLogger("bench_handler")
+
+
+def handler(i):
+    """The log calls of one confirm_write update"""
+    user_id, essay_id = 100000 + i, 7000000000000000000 + i
+    logger.info("✍️ User %s confirmed write for essay %s", user_id, essay_id)
+    logger.debug("Pending text for %s: %s", user_id, "words " * 20)
+    logger.info("💾 Saved %s chars to essay %s", 120, essay_id)
+    logger.info("📨 Notified partner of essay %s", essay_id)
+    logger.info("✅ Essay %s is now waiting for %s", essay_id, "partner")
+
+
+def reset_root():
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+        h.close()
+    logging_setup.stop_logging()
+
+
+def configure(mode, path):
+    reset_root()
+    root = logging.getLogger()
+    if mode == "off":
+        root.addHandler(logging.FileHandler(path))
+        root.setLevel(logging.WARNING)
+    elif mode == "sync":
+        h = logging.FileHandler(path)
+        h.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        root.addHandler(h)
+        root.setLevel(logging.INFO)
+    else:
+        os.environ["LOG_FORMAT"] = "json"
+        os.environ["LOG_LEVEL"] = "INFO"
+        # The listener writes to stderr; point it at the file instead
+        saved = sys.stderr
+        sys.stderr = open(path, "a", encoding="utf-8")
+        try:
+            logging_setup.setup_logging()
+        finally:
+            sys.stderr = saved
+
+
+def run(mode, calls):
+    with tempfile.NamedTemporaryFile(suffix=".log", delete=False) as f:
+        path = f.name
+    try:
+        configure(mode, path)
+        for i in range(min(calls, 1000)):
+            handler(i)
+        started = time.perf_counter()
+        for i in range(calls):
+            handler(i)
+        elapsed = time.perf_counter() - started
+        # Include the drain time separately so the writer's cost stays visible
+        drain_started = time.perf_counter()
+        reset_root()
+        drain = time.perf_counter() - drain_started
+    finally:
+        os.unlink(path)
+    return elapsed / calls * 1e6, drain
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20_000, help="simulated handler invocations")
+    args = parser.parse_args()
+
+    print(f"{'setup':<8} {'µs/handler':>11} {'drain s':>9}")
+    for mode in ("off", "sync", "queue"):
+        per_call, drain = run(mode, args.calls)
+        print(f"{mode:<8} {per_call:>11.2f} {drain:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark memory and construction time of essay rows: the old dict per essay
+(plus a dict per partner) versus the slotted models.Essay / models.Partner.
+
+Rows are synthetic tuples shaped like the essays table, so no database is
+needed.  Memory is what tracemalloc sees allocated for the built list.
+
+Usage:
+    python benchmarks/bench_models.py [--essays 10000] [--repeat 5]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Essay, Partner, ESSAY_COLUMNS, PARTNER_COLUMNS  # noqa: E402
+
+
+def make_rows(count):
+    created = datetime(2025, 1, 1)
+    rows, partners = [], []
+    for i in range(count):
+        essay_id = 2791564293914624000 + i
+        rows.append((
+            essay_id, f"Ab{i:06d}", 100000 + i % 5000, f"user{i % 5000}", f"Topic number {i}",
+            "An opening paragraph of a few dozen words " * 2, None if i % 3 else "A continuation " * 10,
+            "in_progress", created, 100000 + i % 5000, {}, bool(i % 7 == 0), created, 0,
+        ))
+        partners.append([(200000 + i % 3000, f"partner{i % 3000}", False)] if i % 4 else [])
+    return rows, partners
+
+
+def build_dicts(rows, partners):
+    essays = []
+    for row, essay_partners in zip(rows, partners):
+        essay = dict(zip(ESSAY_COLUMNS, row))
+        essay['partners'] = [dict(zip(PARTNER_COLUMNS, partner)) for partner in essay_partners]
+        essays.append(essay)
+    return essays
+
+
+def build_models(rows, partners):
+    return [Essay.from_row(row, [Partner(*partner) for partner in essay_partners])
+            for row, essay_partners in zip(rows, partners)]
+
+
+def measure(build, rows, partners, repeat):
+    gc.collect()
+    tracemalloc.start()
+    built = build(rows, partners)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        build(rows, partners)
+        timings.append(time.perf_counter() - started)
+    return size, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows, partners = make_rows(args.essays)
+    per = 10000 / args.essays
+    print(f"{'representation':<16} {'KiB per 10k':>12} {'ms per 10k':>11}")
+    results = {}
+    for name, build in (("dict", build_dicts), ("slotted model", build_models)):
+        size, seconds = measure(build, rows, partners, args.repeat)
+        results[name] = size
+        print(f"{name:<16} {size * per / 1024:>12.0f} {seconds * per * 1000:>11.1f}")
+    print(f"\nslotted models use {results['slotted model'] / results['dict']:.0%} of the dict memory "
+          "(row values themselves are shared and not counted)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,8 @@
+import time
+# Startup is timed from here so the imports below are included
+STARTED_AT = time.perf_counter()
+
+import asyncio
 import os
 from datetime import datetime
 from io import BytesIO
@@ -5,39 +10,62 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
     CommandHandler,
-    CallbackQueryHandler,
+    InlineQueryHandler,
+    TypeHandler,
     MessageHandler,
     filters,
     ContextTypes,
+    CallbackContext,
     ConversationHandler,
 )
 from dotenv import load_dotenv
 from pdf_generator import generate_essay_pdf
+import callbacks as cb
+from persistence import PostgresPersistence
+from metrics import track_handler, InstrumentedRequest, start_metrics_server, STARTUP_SECONDS, MATCHES_MADE
+from tracing import TracedApplication, setup_tracing, shutdown_tracing
+from profiler import profile_for, MAX_SECONDS as MAX_PROFILE_SECONDS
+from eviction import track_activity, sweep_idle_data, data_stats, SWEEP_INTERVAL
+from ids import is_join_code
+import matchmaking
+import inline_search
+from matchmaking import matchmaker
+from inline_search import inline_query, JOIN_LINK_PREFIX
+from invalidation import listen_for_changes, subscribe
+from partitions import ensure_partitions_job
+from expiry import expire_stale_essays, SWEEP_INTERVAL as EXPIRY_SWEEP_INTERVAL
+import reminders
+from reminders import schedule_turn, cancel_turn, load_turns, turn_timer_tick, TICK_SECONDS as TURN_TIMER_TICK
+import workers
 from database import (
     init_db,
     create_essay as db_create_essay,
     get_essay,
+    get_essay_by_join_code,
     update_essay,
-    add_partner,
     get_user_essays,
     get_user_joined_essays,
     get_all_essays,
-    set_user_session,
-    get_user_session,
-    clear_user_session,
     check_partner_exists,
     get_available_essays,
+    claim_essay,
+    get_waiting_essays,
+    enqueue_writer,
+    dequeue_writer,
+    get_queued_writers,
+    start_turn,
+    get_open_turns,
+    search_open_essays,
 )
 import logging
 import json
+from logging_setup import setup_logging
 
 # Load environment variables from .env file
-load_dotenv(override=True)
+# ENV_FILE points at an alternative .env (e.g. os.devnull to use only the process environment)
+load_dotenv(os.getenv("ENV_FILE"), override=True)
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Support both TELEGRAM_BOT_TOKEN and TELEGRAM_TOKEN
@@ -46,18 +74,32 @@ if not TOKEN or TOKEN == "your_telegram_bot_token_here":
     logger.error("❌ No valid Telegram token found. Please set TELEGRAM_TOKEN or TELEGRAM_BOT_TOKEN in environment")
     exit(1)
 
+# Optional Bot API server, e.g. a local Bot API server or the load-test stand-in in loadtest/
+API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
+
+# Set MIGRATE_ON_BOOT=0 to refuse to start on a stale schema instead of migrating (see migrate.py)
+MIGRATE_ON_BOOT = os.getenv("MIGRATE_ON_BOOT", "1") != "0"
+
+# Telegram user ids allowed to use admin commands, comma separated
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_USER_IDS", "").split(",") if x.strip()}
+
 WAITING_FOR_PARTNER = 1
 WRITING_FIRST = 2
 WAITING_FOR_PARTNER_TURN = 3
 WRITING_DEVELOPMENT = 4
 CHOOSE_ANONYMITY = 5
 CHOOSE_JOIN_ANONYMITY = 6
+SEARCHING = 7
+
+SEARCH_PAGE_SIZE = 5
+
+STATUS_EMOJI = {'complete': "✅", 'expired': "⌛"}
 
 async def send_pdf_file(bot, chat_id, pdf_path, filename, caption=None):
     """Helper function to send PDF file properly using BytesIO"""
     try:
         if pdf_path and os.path.exists(pdf_path):
-            logger.info(f"📤 Attempting to send PDF to chat {chat_id}: {filename}")
+            logger.info("📤 Attempting to send PDF to chat %s: %s", chat_id, filename)
             with open(pdf_path, 'rb') as f:
                 pdf_bytes = BytesIO(f.read())
             await bot.send_document(
@@ -66,24 +108,30 @@ async def send_pdf_file(bot, chat_id, pdf_path, filename, caption=None):
                 filename=filename,
                 caption=caption
             )
-            logger.info(f"✅ PDF successfully sent to chat {chat_id}")
+            logger.info("✅ PDF successfully sent to chat %s", chat_id)
             return True
         else:
-            logger.warning(f"⚠️ PDF file not found: {pdf_path}")
+            logger.warning("⚠️ PDF file not found: %s", pdf_path)
     except Exception as e:
-        logger.error(f"❌ Error sending PDF to {chat_id}: {e}")
+        logger.error("❌ Error sending PDF to %s: %s", chat_id, e)
     return False
 
+@track_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command - shows main menu"""
+    # Join links from inline results open the bot with /start join_<code>
+    if context.args and context.args[0].startswith(JOIN_LINK_PREFIX):
+        return await join_essay(update, context)
+    
     user_id = update.effective_user.id
     username = update.effective_user.username or "User"
     
     keyboard = [
-        [InlineKeyboardButton("📝 Create New Essay", callback_data="create_essay")],
-        [InlineKeyboardButton("🔍 Browse Topics", callback_data="browse_essays")],
-        [InlineKeyboardButton("📂 My Created Essays", callback_data="my_essays")],
-        [InlineKeyboardButton("👥 My Joined Essays", callback_data="my_joined_essays")],
+        [InlineKeyboardButton("📝 Create New Essay", callback_data=cb.encode(cb.CREATE))],
+        [InlineKeyboardButton("🎲 Find Me a Partner", callback_data=cb.encode(cb.FIND_PARTNER))],
+        [InlineKeyboardButton("🔍 Browse Topics", callback_data=cb.encode(cb.BROWSE))],
+        [InlineKeyboardButton("📂 My Created Essays", callback_data=cb.encode(cb.MY_ESSAYS))],
+        [InlineKeyboardButton("👥 My Joined Essays", callback_data=cb.encode(cb.MY_JOINED))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -98,6 +146,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return WAITING_FOR_PARTNER
 
+@track_handler
 async def browse_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show available essays looking for partners"""
     query = update.callback_query
@@ -114,7 +163,7 @@ async def browse_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "🔍 No essays available right now!\n\n"
             "Create your own essay or wait for others to post topics.",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+                [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
             ])
         )
         return WAITING_FOR_PARTNER
@@ -125,21 +174,112 @@ async def browse_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for i, essay in enumerate(available, 1):
         creator_info = "🔐 Anonymous" if essay.get('is_anonymous') else f"by {essay['creator_name']}"
         text += f"{i}. 📝 {essay['topic']}\n   {creator_info}\n   {len(essay.get('first_content', '').split())} words\n\n"
-        buttons.append([InlineKeyboardButton(f"Join: {essay['topic'][:30]}", callback_data=f"join_essay_{essay['id']}")])
+        buttons.append([InlineKeyboardButton(f"Join: {essay['topic'][:30]}", callback_data=cb.encode(cb.JOIN, essay['id']))])
     
-    buttons.append([InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")])
+    buttons.append([InlineKeyboardButton("🔎 Search Topics", callback_data=cb.encode(cb.SEARCH))])
+    buttons.append([InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))])
     reply_markup = InlineKeyboardMarkup(buttons)
     
     await query.edit_message_text(text, reply_markup=reply_markup)
     return WAITING_FOR_PARTNER
 
+async def render_search_results(context, search_query, page):
+    """Text and keyboard for one page of /search results"""
+    # One extra row tells whether there is a next page
+    results = search_open_essays(search_query, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE)
+    has_next = len(results) > SEARCH_PAGE_SIZE
+    results = results[:SEARCH_PAGE_SIZE]
+    
+    if not results:
+        text = f"🔎 No open essays match \"{search_query}\"" + (" on this page." if page else ".")
+    else:
+        text = f"🔎 Open essays matching \"{search_query}\" (page {page + 1}):\n\n"
+    buttons = []
+    for i, essay in enumerate(results, page * SEARCH_PAGE_SIZE + 1):
+        creator_info = "🔐 Anonymous" if essay.get('is_anonymous') else f"by {essay['creator_name']}"
+        text += f"{i}. 📝 {essay['topic']}\n   {creator_info}\n   {len((essay.get('first_content') or '').split())} words\n\n"
+        buttons.append([InlineKeyboardButton(f"Join: {essay['topic'][:30]}", callback_data=cb.encode(cb.JOIN, essay['id']))])
+    
+    pager = []
+    if page > 0:
+        pager.append(InlineKeyboardButton("⬅️ Prev", callback_data=cb.encode(cb.SEARCH_PAGE, page - 1)))
+    if has_next:
+        pager.append(InlineKeyboardButton("Next ➡️", callback_data=cb.encode(cb.SEARCH_PAGE, page + 1)))
+    if pager:
+        buttons.append(pager)
+    buttons.append([InlineKeyboardButton("🔎 New Search", callback_data=cb.encode(cb.SEARCH))])
+    buttons.append([InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))])
+    return text, InlineKeyboardMarkup(buttons)
+
+@track_handler
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/search <words> - ranked open essays matching the words"""
+    if not context.args:
+        context.user_data['awaiting_search'] = True
+        await update.message.reply_text("🔎 What topic are you looking for? Send me a few words.")
+        return SEARCHING
+    
+    search_query = " ".join(context.args)
+    context.user_data['search_query'] = search_query
+    text, reply_markup = await render_search_results(context, search_query, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+    return WAITING_FOR_PARTNER
+
+async def clear_search_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Forget an open search prompt on any update other than the words it asks for"""
+    if context.user_data and 'awaiting_search' in context.user_data:
+        message = update.message
+        if not (message and message.text and not message.text.startswith('/')):
+            context.user_data.pop('awaiting_search')
+
+@track_handler
+async def search_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Search box from browse - ask for the words"""
+    query = update.callback_query
+    await query.answer()
+    
+    context.user_data['awaiting_search'] = True
+    await query.edit_message_text(
+        "🔎 What topic are you looking for? Send me a few words.",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
+        ])
+    )
+    return SEARCHING
+
+@track_handler
+async def handle_search_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """The words typed after the search prompt"""
+    context.user_data.pop('awaiting_search', None)
+    search_query = update.message.text
+    context.user_data['search_query'] = search_query
+    text, reply_markup = await render_search_results(context, search_query, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+    return WAITING_FOR_PARTNER
+
+@track_handler
+async def search_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Another page of the last search"""
+    query = update.callback_query
+    await query.answer()
+    
+    search_query = context.user_data.get('search_query')
+    if not search_query:
+        await query.edit_message_text("🔎 That search has expired - try /search again.")
+        return WAITING_FOR_PARTNER
+    
+    text, reply_markup = await render_search_results(context, search_query, max(context.args[0], 0))
+    await query.edit_message_text(text, reply_markup=reply_markup)
+    return WAITING_FOR_PARTNER
+
+@track_handler
 async def join_essay_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ask if user wants to join anonymously"""
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
-    essay_id = query.data.split('_', 2)[2]
+    essay_id = context.args[0]
     
     essay = get_essay(essay_id)
     
@@ -166,9 +306,9 @@ async def join_essay_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     # Ask about anonymity
     keyboard = [
-        [InlineKeyboardButton("👤 Public (Show my name)", callback_data="join_anon_no")],
-        [InlineKeyboardButton("🔐 Anonymous (Hide my name)", callback_data="join_anon_yes")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_main")],
+        [InlineKeyboardButton("👤 Public (Show my name)", callback_data=cb.encode(cb.JOIN_ANON, False))],
+        [InlineKeyboardButton("🔐 Anonymous (Hide my name)", callback_data=cb.encode(cb.JOIN_ANON, True))],
+        [InlineKeyboardButton("⬅️ Back", callback_data=cb.encode(cb.BACK))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -181,6 +321,7 @@ async def join_essay_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     return CHOOSE_JOIN_ANONYMITY
 
+@track_handler
 async def choose_join_anonymity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle join anonymity choice and complete the join"""
     query = update.callback_query
@@ -188,17 +329,19 @@ async def choose_join_anonymity(update: Update, context: ContextTypes.DEFAULT_TY
     
     user_id = update.effective_user.id
     username = update.effective_user.username or "User"
-    is_anonymous = query.data == "join_anon_yes"
+    is_anonymous = context.args[0]
     essay_id = context.user_data.get('joining_essay_id')
+    if essay_id is None:
+        await query.edit_message_text("❌ Essay not found! Use /start to pick it again.")
+        return WAITING_FOR_PARTNER
     
-    essay = get_essay(essay_id)
+    # Add partner with anonymity setting, unless someone else got there first
+    essay = claim_essay(essay_id, user_id, username, is_anonymous=is_anonymous)
     if not essay:
-        await query.edit_message_text("❌ Essay not found!")
+        await query.edit_message_text("❌ This essay already has a partner!")
         return WAITING_FOR_PARTNER
-    
-    # Add partner with anonymity setting
-    add_partner(essay_id, user_id, username, is_anonymous=is_anonymous)
-    update_essay(essay_id, status='in_progress')
+    matchmaker.discard_essay(essay_id)
+    schedule_turn(essay_id)
     
     creator_info = "🔐 Anonymous" if essay.get('is_anonymous') else f"by {essay['creator_name']}"
     partner_mode = "🔐 Anonymously" if is_anonymous else "👤 Publicly"
@@ -219,7 +362,7 @@ async def choose_join_anonymity(update: Update, context: ContextTypes.DEFAULT_TY
         "---\n\n"
         "Ready to write your contribution (less than 50 words)?",
         reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
         ])
     )
     
@@ -231,25 +374,26 @@ async def choose_join_anonymity(update: Update, context: ContextTypes.DEFAULT_TY
         f"📝 {partner_display} joined your essay: {essay['topic']}\n\n"
         f"Waiting for {partner_display} to write their part...",
         reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
         ])
     )
     
-    # Store partner's user_id for the next turn
-    set_user_session(user_id, essay_id)
+    # Remember the essay for the partner's next turn (kept in persisted user_data)
+    context.user_data['current_essay_id'] = essay_id
     
     context.user_data.pop('joining_essay_id', None)
     return WRITING_DEVELOPMENT
 
+@track_handler
 async def create_essay(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start essay creation process - ask about anonymity"""
     query = update.callback_query
     await query.answer()
     
     keyboard = [
-        [InlineKeyboardButton("👤 Public (Show my name)", callback_data="anon_no")],
-        [InlineKeyboardButton("🔐 Anonymous (Hide my name)", callback_data="anon_yes")],
-        [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+        [InlineKeyboardButton("👤 Public (Show my name)", callback_data=cb.encode(cb.ANON, False))],
+        [InlineKeyboardButton("🔐 Anonymous (Hide my name)", callback_data=cb.encode(cb.ANON, True))],
+        [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -272,16 +416,17 @@ async def create_essay(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return CHOOSE_ANONYMITY
 
+@track_handler
 async def choose_anonymity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle anonymity choice and ask for topic"""
     query = update.callback_query
     await query.answer()
     
-    is_anonymous = query.data == "anon_yes"
+    is_anonymous = context.args[0]
     context.user_data['is_anonymous'] = is_anonymous
     
     keyboard = [
-        [InlineKeyboardButton("⬅️ Cancel", callback_data="back_to_main")],
+        [InlineKeyboardButton("⬅️ Cancel", callback_data=cb.encode(cb.BACK))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -303,6 +448,7 @@ async def choose_anonymity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return WRITING_FIRST
 
+@track_handler
 async def handle_first_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle topic and first paragraph"""
     user_id = update.effective_user.id
@@ -334,16 +480,24 @@ async def handle_first_write(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return WRITING_FIRST
         
         # Create essay in database
-        essay_id = f"essay_{user_id}_{datetime.now().timestamp()}"
         is_anonymous = context.user_data.get('is_anonymous', False)
-        db_create_essay(essay_id, user_id, username, topic)
+        essay_id, join_code = db_create_essay(user_id, username, topic)
         update_essay(essay_id, first_content=text, status='waiting_partner', is_anonymous=is_anonymous)
         
         context.user_data.clear()
         
+        # Hand the essay straight to a writer waiting in the matchmaking queue, if any
+        if await match_new_essay(context, essay_id, user_id):
+            await update.message.reply_text(
+                f"✅ Great opening paragraph! ({word_count} words)\n\n"
+                f"📝 Topic: {topic}\n\n"
+                "🎲 A writer from the matchmaking queue picked it up!"
+            )
+            return WAITING_FOR_PARTNER
+        
         keyboard = [
-            [InlineKeyboardButton("📋 Share Essay Link", callback_data=f"share_{essay_id}")],
-            [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+            [InlineKeyboardButton("📋 Share Essay Link", callback_data=cb.encode(cb.SHARE, essay_id))],
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -351,26 +505,30 @@ async def handle_first_write(update: Update, context: ContextTypes.DEFAULT_TYPE)
             f"✅ Great opening paragraph! ({word_count} words)\n\n"
             f"📝 Topic: {topic}\n"
             f"Opening: {text}\n\n"
-            f"🔐 Join Code: `{essay_id}`\n"
-            f"📝 Tell your partner to message: `/join {essay_id}`\n\n"
+            f"🔐 Join Code: `{join_code}`\n"
+            f"📝 Tell your partner to message: `/join {join_code}`\n\n"
             "Or share the essay link with your partner so they can join!",
             reply_markup=reply_markup
         )
         
         return WAITING_FOR_PARTNER
 
+@track_handler
 async def join_essay(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Join an essay as a partner"""
     user_id = update.effective_user.id
     username = update.effective_user.username or "User"
-    essay_id = update.message.text.split()[-1] if ' ' in update.message.text else update.message.text
+    join_code = update.message.text.split()[-1] if ' ' in update.message.text else update.message.text
+    join_code = join_code.removeprefix(JOIN_LINK_PREFIX)
     
-    essay = get_essay(essay_id)
+    essay = get_essay_by_join_code(join_code) if is_join_code(join_code) else None
     
     if not essay:
         await update.message.reply_text("❌ Essay not found!")
         return WAITING_FOR_PARTNER
     
+    essay_id = essay['id']
+    
     if essay['status'] not in ['waiting_partner', 'in_progress']:
         await update.message.reply_text("❌ This essay is no longer accepting partners!")
         return WAITING_FOR_PARTNER
@@ -385,9 +543,12 @@ async def join_essay(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ This essay already has a partner!")
         return WAITING_FOR_PARTNER
     
-    # Add partner
-    add_partner(essay_id, user_id, username)
-    update_essay(essay_id, status='in_progress')
+    # Add partner, unless someone else got there first
+    if not claim_essay(essay_id, user_id, username):
+        await update.message.reply_text("❌ This essay already has a partner!")
+        return WAITING_FOR_PARTNER
+    matchmaker.discard_essay(essay_id)
+    schedule_turn(essay_id)
     
     await update.message.reply_text(
         f"✅ Successfully joined!\n\n"
@@ -404,7 +565,7 @@ async def join_essay(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "---\n\n"
         "Ready to write your contribution (less than 50 words)?",
         reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
         ])
     )
     
@@ -415,15 +576,157 @@ async def join_essay(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"📝 {username} joined your essay: {essay['topic']}\n\n"
         f"Waiting for {username} to write their part...",
         reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
         ])
     )
     
-    # Store partner's user_id for the next turn
-    set_user_session(user_id, essay_id)
+    # Remember the essay for the partner's next turn (kept in persisted user_data)
+    context.user_data['current_essay_id'] = essay_id
     
     return WRITING_DEVELOPMENT
 
+async def notify_matched(bot, essay, writer_id, writer_name, writer_anonymous):
+    """Tell both sides of a matchmaking pair that the essay has started"""
+    creator_info = "🔐 Anonymous" if essay.get('is_anonymous') else f"by {essay['creator_name']}"
+    await bot.send_message(
+        chat_id=writer_id,
+        text=f"🎲 PARTNER FOUND!\n\n"
+        f"📝 Topic: {essay['topic']}\n"
+        f"   {creator_info}\n\n"
+        f"📝 Current Essay ({len(essay['first_content'].split())} words):\n\n"
+        f"{essay['first_content']}\n\n"
+        "---\n\n"
+        "👉 Now write your contribution (less than 50 words)!",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
+        ])
+    )
+    
+    writer_display = "Someone" if writer_anonymous else writer_name
+    await bot.send_message(
+        chat_id=essay['creator_id'],
+        text=f"🔔 PARTNER JOINED!\n\n"
+        f"📝 {writer_display} joined your essay: {essay['topic']}\n\n"
+        f"Waiting for {writer_display} to write their part...",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
+        ])
+    )
+    MATCHES_MADE.inc()
+    schedule_turn(essay['id'])
+
+async def match_new_essay(context, essay_id, creator_id):
+    """Pair a freshly posted essay with the longest-waiting writer; False if nobody is queued"""
+    while True:
+        writer = matchmaker.pop_writer_for(creator_id)
+        if writer is None:
+            matchmaker.add_essay(essay_id, creator_id)
+            return False
+        writer_id, writer_name, writer_anonymous = writer
+        # Removing the queue row is what reserves the writer (another replica may hold them too)
+        queued_at = dequeue_writer(writer_id)
+        if queued_at is None:
+            continue
+        essay = claim_essay(essay_id, writer_id, writer_name, is_anonymous=writer_anonymous)
+        if not essay:
+            # The essay was joined by code in the meantime - put the writer back in their original place
+            matchmaker.add_writer(writer_id, writer_name, writer_anonymous,
+                                  enqueue_writer(writer_id, writer_name, writer_anonymous, queued_at))
+            return True
+        
+        logger.info("🎲 Matched essay %s with queued writer %s", essay_id, writer_id)
+        # The writer's next text message goes to this essay (see handle_external_text)
+        context.application.user_data[writer_id]['current_essay_id'] = essay_id
+        context.application.mark_data_for_update_persistence(user_ids=writer_id)
+        await notify_matched(context.bot, essay, writer_id, writer_name, writer_anonymous)
+        return True
+
+@track_handler
+async def find_partner(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Matchmaking entry point - ask about anonymity, or show queue status"""
+    query = update.callback_query
+    await query.answer()
+    
+    if matchmaker.is_queued(update.effective_user.id):
+        await query.edit_message_text(
+            "⏳ You're already in the queue!\n\n"
+            "We'll message you as soon as a new essay needs a partner.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🚪 Leave Queue", callback_data=cb.encode(cb.LEAVE_QUEUE))],
+                [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
+            ])
+        )
+        return WAITING_FOR_PARTNER
+    
+    keyboard = [
+        [InlineKeyboardButton("👤 Public (Show my name)", callback_data=cb.encode(cb.MATCH, False))],
+        [InlineKeyboardButton("🔐 Anonymous (Hide my name)", callback_data=cb.encode(cb.MATCH, True))],
+        [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
+    ]
+    await query.edit_message_text(
+        "🎲 We'll pair you with the oldest essay waiting for a partner.\n\n"
+        "Would you like to join anonymously?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return WAITING_FOR_PARTNER
+
+@track_handler
+async def queue_for_partner(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Join the oldest open essay, or wait in the matchmaking queue for the next one"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = update.effective_user.id
+    username = update.effective_user.username or "User"
+    is_anonymous = context.args[0]
+    
+    while True:
+        essay_id = matchmaker.pop_essay_for(user_id)
+        if essay_id is None:
+            break
+        essay = claim_essay(essay_id, user_id, username, is_anonymous=is_anonymous)
+        if not essay:
+            # Joined through /join or browse since it was indexed
+            continue
+        
+        logger.info("🎲 Matched writer %s with essay %s", user_id, essay_id)
+        dequeue_writer(user_id)
+        matchmaker.remove_writer(user_id)
+        await query.edit_message_text("🎲 Partner found!")
+        await notify_matched(context.bot, essay, user_id, username, is_anonymous)
+        context.user_data['current_essay_id'] = essay_id
+        return WRITING_DEVELOPMENT
+    
+    matchmaker.add_writer(user_id, username, is_anonymous, enqueue_writer(user_id, username, is_anonymous))
+    await query.edit_message_text(
+        "⏳ No essays are waiting right now - you're in the queue!\n\n"
+        "We'll message you as soon as someone posts a new essay.",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("🚪 Leave Queue", callback_data=cb.encode(cb.LEAVE_QUEUE))],
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
+        ])
+    )
+    return WAITING_FOR_PARTNER
+
+@track_handler
+async def leave_queue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Leave the matchmaking queue"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = update.effective_user.id
+    dequeue_writer(user_id)
+    matchmaker.remove_writer(user_id)
+    
+    await query.edit_message_text(
+        "🚪 You left the queue.",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
+        ])
+    )
+    return WAITING_FOR_PARTNER
+
+@track_handler
 async def my_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user's created essays"""
     query = update.callback_query
@@ -437,24 +740,25 @@ async def my_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📂 No essays created yet!\n\n"
             "Create your first essay to get started.",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+                [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
             ])
         )
         return WAITING_FOR_PARTNER
     
     text = "📂 **My Created Essays:**\n\n"
     for i, essay in enumerate(essays, 1):
-        status_emoji = "✅" if essay['status'] == 'complete' else "⏳"
+        status_emoji = STATUS_EMOJI.get(essay['status'], "⏳")
         text += f"{i}. {essay['topic']}\n   Status: {status_emoji} {essay['status'].replace('_', ' ').title()}\n\n"
     
     keyboard = [
-        [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+        [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(text, reply_markup=reply_markup)
     return WAITING_FOR_PARTNER
 
+@track_handler
 async def my_joined_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show essays where user is a partner"""
     query = update.callback_query
@@ -468,7 +772,7 @@ async def my_joined_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "👥 You haven't joined any essays yet!\n\n"
             "Ask a friend to share an essay link or use /join command.",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+                [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
             ])
         )
         return WAITING_FOR_PARTNER
@@ -481,6 +785,8 @@ async def my_joined_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
         last_writer = essay.get('last_writer_id')
         if essay['status'] == 'complete':
             turn_text = "✅ Complete"
+        elif essay['status'] == 'expired':
+            turn_text = "⌛ Expired"
         elif last_writer == user_id:
             turn_text = "⏳ Waiting for creator..."
         elif last_writer == essay['creator_id'] or last_writer is None:
@@ -488,52 +794,56 @@ async def my_joined_essays(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             turn_text = "⏳ Waiting..."
         
-        status_emoji = "✅" if essay['status'] == 'complete' else "⏳"
+        status_emoji = STATUS_EMOJI.get(essay['status'], "⏳")
         text += f"{i}. {essay['topic']}\n   by {essay['creator_name']} - {status_emoji} {essay['status'].replace('_', ' ').title()}\n   Turn: {turn_text}\n\n"
         
         # Add continue button only if it's user's turn and essay is not complete
         if turn_text == "🎯 Your Turn!" and essay['status'] != 'complete':
-            buttons.append([InlineKeyboardButton(f"✍️ Continue: {essay['topic']}", callback_data=f"continue_{essay['id']}")])
+            buttons.append([InlineKeyboardButton(f"✍️ Continue: {essay['topic']}", callback_data=cb.encode(cb.CONTINUE, essay['id']))])
     
-    buttons.append([InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")])
+    buttons.append([InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))])
     reply_markup = InlineKeyboardMarkup(buttons)
     
     await query.edit_message_text(text, reply_markup=reply_markup)
     return WAITING_FOR_PARTNER
 
+@track_handler
 async def continue_writing(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Display essay for partner to continue writing"""
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
-    essay_id = query.data.split('_', 1)[1]
+    essay_id = context.args[0]
     
-    logger.info(f"✍️ Continue writing: user_id={user_id}, essay_id={essay_id}")
+    logger.info("✍️ Continue writing: user_id=%s, essay_id=%s", user_id, essay_id)
     
     essay = get_essay(essay_id)
     if not essay:
-        logger.error(f"❌ Essay not found: {essay_id}")
+        logger.error("❌ Essay not found: %s", essay_id)
         await query.edit_message_text("❌ Essay not found!")
         return WAITING_FOR_PARTNER
     
-    logger.info(f"✍️ Essay found: {essay['topic']}, last_writer={essay.get('last_writer_id')}")
+    logger.info("✍️ Essay found: %s, last_writer=%s", essay['topic'], essay.get('last_writer_id'))
+    
+    if essay['status'] == 'expired':
+        await query.edit_message_text("⌛ This essay expired after a long time without a new turn.")
+        return WAITING_FOR_PARTNER
     
     # Check authorization
     partner_ids = [str(p['id']) for p in essay.get('partners', [])]
     if str(user_id) not in partner_ids and essay['creator_id'] != user_id:
-        logger.error(f"❌ Authorization failed for user {user_id}")
+        logger.error("❌ Authorization failed for user %s", user_id)
         await query.edit_message_text("❌ You don't have permission to write this essay!")
         return WAITING_FOR_PARTNER
     
     # Check if it's user's turn
     last_writer = essay.get('last_writer_id')
     if str(last_writer) == str(user_id):
-        logger.warning(f"⚠️ Not user's turn: last_writer={last_writer}, current_user={user_id}")
+        logger.warning("⚠️ Not user's turn: last_writer=%s, current_user=%s", last_writer, user_id)
         await query.edit_message_text("❌ It's not your turn yet! Wait for your partner.")
         return WAITING_FOR_PARTNER
     
-    set_user_session(user_id, essay_id)
     context.user_data['current_essay_id'] = essay_id
     
     content = essay.get('first_content', '')
@@ -542,10 +852,10 @@ async def continue_writing(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     word_count = len(content.split())
     
-    logger.info(f"✍️ Showing essay for writing: {word_count} words")
+    logger.info("✍️ Showing essay for writing: %s words", word_count)
     
     keyboard = [
-        [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+        [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -559,19 +869,24 @@ async def continue_writing(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return WRITING_DEVELOPMENT
 
+@track_handler
 async def handle_development(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle essay continuation"""
     user_id = update.effective_user.id
     text = update.message.text
-    # Try to get essay_id from context first, then from database session
-    essay_id = context.user_data.get('current_essay_id') or get_user_session(user_id)
+    essay_id = context.user_data.get('current_essay_id')
     
     essay = get_essay(essay_id)
     if not essay:
-        logger.error(f"❌ Essay not found: {essay_id}")
+        logger.error("❌ Essay not found: %s", essay_id)
         await update.message.reply_text("❌ Essay not found!")
         return WAITING_FOR_PARTNER
     
+    if essay['status'] == 'expired':
+        context.user_data.pop('current_essay_id', None)
+        await update.message.reply_text("⌛ This essay expired after a long time without a new turn.")
+        return WAITING_FOR_PARTNER
+    
     # Validate authorization
     partner_ids = [str(p['id']) for p in essay.get('partners', [])]
     if str(user_id) not in partner_ids and essay['creator_id'] != user_id:
@@ -600,9 +915,9 @@ async def handle_development(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Show preview and confirm
     keyboard = [
-        [InlineKeyboardButton("✅ Confirm & Submit", callback_data=f"confirm_write_{essay_id}")],
-        [InlineKeyboardButton("✏️ Edit", callback_data=f"continue_{essay_id}")],
-        [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+        [InlineKeyboardButton("✅ Confirm & Submit", callback_data=cb.encode(cb.CONFIRM, essay_id))],
+        [InlineKeyboardButton("✏️ Edit", callback_data=cb.encode(cb.CONTINUE, essay_id))],
+        [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -615,6 +930,7 @@ async def handle_development(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     return WRITING_DEVELOPMENT
 
+@track_handler
 async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Confirm and save the written text"""
     query = update.callback_query
@@ -622,9 +938,9 @@ async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     username = update.effective_user.username or "User"
-    essay_id = query.data.split('_', 2)[2]
+    essay_id = context.args[0]
     
-    logger.info(f"📝 Confirm write started: user_id={user_id}, essay_id={essay_id}")
+    logger.info("📝 Confirm write started: user_id=%s, essay_id=%s", user_id, essay_id)
     
     # Get pending text from context
     pending_text = context.user_data.get('pending_text')
@@ -636,18 +952,18 @@ async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     essay = get_essay(essay_id)
     if not essay:
-        logger.error(f"❌ Essay not found: {essay_id}")
+        logger.error("❌ Essay not found: %s", essay_id)
         await query.edit_message_text("❌ Essay not found!")
         return WAITING_FOR_PARTNER
     
-    logger.info(f"📝 Essay found: {essay['topic']}, creator_id={essay['creator_id']}")
+    logger.info("📝 Essay found: %s, creator_id=%s", essay['topic'], essay['creator_id'])
     
     # Update essay - append the text
     if essay['creator_id'] == user_id and not essay.get('second_content'):
-        logger.info(f"📝 Updating first_content for essay {essay_id}")
+        logger.info("📝 Updating first_content for essay %s", essay_id)
         update_essay(essay_id, first_content=essay['first_content'] + ' ' + pending_text)
     else:
-        logger.info(f"📝 Updating second_content for essay {essay_id}")
+        logger.info("📝 Updating second_content for essay %s", essay_id)
         second_content = essay.get('second_content', '')
         if second_content:
             second_content += ' ' + pending_text
@@ -655,11 +971,12 @@ async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
             second_content = pending_text
         update_essay(essay_id, second_content=second_content)
     
-    update_essay(essay_id, last_writer_id=user_id, finish_requests='{}')
+    start_turn(essay_id, user_id)
+    schedule_turn(essay_id)
     
     # Refresh essay from database
     essay = get_essay(essay_id)
-    logger.info(f"📝 Essay refreshed, partners count: {len(essay.get('partners', []))}")
+    logger.info("📝 Essay refreshed, partners count: %s", len(essay.get('partners', [])))
     
     # Determine next writer
     if essay['creator_id'] == user_id:
@@ -670,7 +987,7 @@ async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Hide name if partner is anonymous
             next_writer_name = "Someone" if partner.get('is_anonymous') else partner['name']
         else:
-            logger.error(f"❌ No partners found for essay {essay_id}")
+            logger.error("❌ No partners found for essay %s", essay_id)
             next_writer_id = None
             next_writer_name = "Unknown"
     else:
@@ -679,10 +996,10 @@ async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Hide creator name if essay was created anonymously
         next_writer_name = "Someone" if essay.get('is_anonymous') else essay['creator_name']
     
-    logger.info(f"🔔 Next writer: {next_writer_name} (ID: {next_writer_id})")
+    logger.info("🔔 Next writer: %s (ID: %s)", next_writer_name, next_writer_id)
     
     keyboard = [
-        [InlineKeyboardButton("🏁 Request to Finish", callback_data=f"finish_request_{essay_id}")],
+        [InlineKeyboardButton("🏁 Request to Finish", callback_data=cb.encode(cb.FINISH, essay_id))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -704,7 +1021,7 @@ async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Send notification to partner EVERY TIME - THIS IS MANDATORY
     if next_writer_id:
         try:
-            logger.info(f"🔔 Sending notification to {next_writer_id}...")
+            logger.info("🔔 Sending notification to %s...", next_writer_id)
             message = await context.bot.send_message(
                 chat_id=next_writer_id,
                 text=f"🔔 YOUR TURN!\n\n"
@@ -713,19 +1030,19 @@ async def confirm_write(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"Ready to add your part?\n\n"
                 f"⏰ Update at {datetime.now().strftime('%H:%M:%S')}",
                 reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("✍️ Continue Writing", callback_data=f"continue_{essay_id}")],
+                    [InlineKeyboardButton("✍️ Continue Writing", callback_data=cb.encode(cb.CONTINUE, essay_id))],
                 ])
             )
-            logger.info(f"✅ Turn notification successfully sent to {next_writer_name} (ID: {next_writer_id})")
+            logger.info("✅ Turn notification successfully sent to %s (ID: %s)", next_writer_name, next_writer_id)
         except Exception as e:
-            logger.error(f"❌ Error sending notification to {next_writer_id}: {type(e).__name__}: {e}")
+            logger.error("❌ Error sending notification to %s: %s: %s", next_writer_id, type(e).__name__, e)
     else:
-        logger.warning(f"⚠️  No valid next_writer_id to send notification")
+        logger.warning("⚠️  No valid next_writer_id to send notification")
     
-    clear_user_session(user_id)
     context.user_data.clear()
     return WAITING_FOR_PARTNER
 
+@track_handler
 async def finish_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Request to finish essay"""
     query = update.callback_query
@@ -733,7 +1050,7 @@ async def finish_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     username = update.effective_user.username or "User"
-    essay_id = query.data.split('_', 2)[2]
+    essay_id = context.args[0]
     
     essay = get_essay(essay_id)
     if not essay:
@@ -752,13 +1069,14 @@ async def finish_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if both accepted
     if len(finish_requests) == 2 and all(finish_requests.values()):
         update_essay(essay_id, status='complete')
+        cancel_turn(essay_id)
         
         # Generate PDF
         try:
             pdf_file = generate_essay_pdf(essay)
-            logger.info(f"✅ PDF generated: {pdf_file}")
+            logger.info("✅ PDF generated: %s", pdf_file)
         except Exception as e:
-            logger.error(f"❌ Error generating PDF: {e}")
+            logger.error("❌ Error generating PDF: %s", e)
             pdf_file = None
         
         await query.edit_message_text(
@@ -813,14 +1131,14 @@ async def finish_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"🏁 Finish Request Sent!\n\n"
             f"Waiting for {other_username} to accept...",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+                [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
             ])
         )
         
         # Send request to other partner
         keyboard = [
-            [InlineKeyboardButton("✅ Accept & Finish", callback_data=f"accept_finish_{essay_id}")],
-            [InlineKeyboardButton("❌ Decline", callback_data=f"decline_finish_{essay_id}")],
+            [InlineKeyboardButton("✅ Accept & Finish", callback_data=cb.encode(cb.ACCEPT, essay_id))],
+            [InlineKeyboardButton("❌ Decline", callback_data=cb.encode(cb.DECLINE, essay_id))],
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -834,13 +1152,14 @@ async def finish_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return WAITING_FOR_PARTNER
 
+@track_handler
 async def accept_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Accept finish request"""
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
-    essay_id = query.data.split('_', 2)[2]
+    essay_id = context.args[0]
     
     essay = get_essay(essay_id)
     if not essay:
@@ -859,13 +1178,14 @@ async def accept_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if both accepted
     if len(finish_requests) == 2 and all(finish_requests.values()):
         update_essay(essay_id, status='complete')
+        cancel_turn(essay_id)
         
         # Generate PDF
         try:
             pdf_file = generate_essay_pdf(essay)
-            logger.info(f"✅ PDF generated: {pdf_file}")
+            logger.info("✅ PDF generated: %s", pdf_file)
         except Exception as e:
-            logger.error(f"❌ Error generating PDF: {e}")
+            logger.error("❌ Error generating PDF: %s", e)
             pdf_file = None
         
         await query.edit_message_text(
@@ -908,19 +1228,20 @@ async def accept_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(
             "✅ You accepted the finish request!",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+                [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
             ])
         )
     
     return WAITING_FOR_PARTNER
 
+@track_handler
 async def decline_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Decline finish request"""
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
-    essay_id = query.data.split('_', 2)[2]
+    essay_id = context.args[0]
     
     # Clear finish requests
     update_essay(essay_id, finish_requests='{}')
@@ -929,22 +1250,24 @@ async def decline_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "❌ Finish request declined.\n\n"
         "Continue writing when ready!",
         reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Back to Main", callback_data="back_to_main")],
+            [InlineKeyboardButton("⬅️ Back to Main", callback_data=cb.encode(cb.BACK))],
         ])
     )
     
     return WAITING_FOR_PARTNER
 
+@track_handler
 async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Go back to main menu"""
     query = update.callback_query
     await query.answer()
     
     keyboard = [
-        [InlineKeyboardButton("📝 Create New Essay", callback_data="create_essay")],
-        [InlineKeyboardButton("🔍 Browse Topics", callback_data="browse_essays")],
-        [InlineKeyboardButton("📂 My Created Essays", callback_data="my_essays")],
-        [InlineKeyboardButton("👥 My Joined Essays", callback_data="my_joined_essays")],
+        [InlineKeyboardButton("📝 Create New Essay", callback_data=cb.encode(cb.CREATE))],
+        [InlineKeyboardButton("🎲 Find Me a Partner", callback_data=cb.encode(cb.FIND_PARTNER))],
+        [InlineKeyboardButton("🔍 Browse Topics", callback_data=cb.encode(cb.BROWSE))],
+        [InlineKeyboardButton("📂 My Created Essays", callback_data=cb.encode(cb.MY_ESSAYS))],
+        [InlineKeyboardButton("👥 My Joined Essays", callback_data=cb.encode(cb.MY_JOINED))],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -967,13 +1290,21 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return WAITING_FOR_PARTNER
 
+@track_handler
+async def expired_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Button whose callback data can no longer be decoded (e.g. from before a migration)"""
+    await update.callback_query.answer("⌛ This button has expired - use /start to open the menu again.",
+                                       show_alert=True)
+
+@track_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help"""
     help_text = (
         "📖 Help\n\n"
         "Commands:\n"
         "/start - Main menu\n"
-        "/help - Show this help\n\n"
+        "/help - Show this help\n"
+        "/search <words> - Find open essays by topic\n\n"
         "How to use:\n"
         "1. Create a new essay with a topic\n"
         "2. Write opening paragraph (< 50 words)\n"
@@ -982,6 +1313,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "5. Take turns writing (< 50 words each turn)\n"
         "6. Request to finish when done\n"
         "7. Download as PDF\n\n"
+        "No partner? Tap 🎲 Find Me a Partner to be paired automatically.\n\n"
         "Rules:\n"
         "• Max 50 words per contribution\n"
         "• Alternating turns only\n"
@@ -989,103 +1321,255 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(help_text)
 
+@track_handler
+async def memstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show in-memory user_data/chat_data stats (admins only)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    stats = data_stats(context.application)
+    await update.message.reply_text(
+        "🧠 Memory\n\n"
+        f"user_data: {stats['user_entries']} entries ({stats['user_nonempty']} non-empty), "
+        f"~{stats['user_bytes'] / 1024:.1f} KB\n"
+        f"chat_data: {stats['chat_entries']} entries, ~{stats['chat_bytes'] / 1024:.1f} KB\n"
+        f"Tracked: {stats['tracked_users']} users, {stats['tracked_chats']} chats"
+    )
+
+@track_handler
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Profile the bot for N seconds and reply with the hottest functions (admins only)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    try:
+        seconds = min(max(int(context.args[0]), 1), MAX_PROFILE_SECONDS) if context.args else 10
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+    
+    await update.message.reply_text(f"🔬 Profiling for {seconds}s...")
+    try:
+        report = await profile_for(seconds)
+    except RuntimeError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    
+    await update.message.reply_text(f"🔬 Hottest functions ({seconds}s):\n\n{report[:3900]}")
+
+change_listener = None
+
+def offer_foreign_essay(application, event):
+    """Change subscriber: pair an essay opened on another worker with a writer queued on this one"""
+    if (event.get("local") or event["op"] != "update" or event.get("status") != "waiting_partner"
+            or not event.get("creator") or not matchmaker.waiting_writers):
+        return
+    # match_new_essay indexes it again if nobody here can take it
+    matchmaker.discard_essay(event["id"])
+    application.create_task(match_new_essay(CallbackContext(application), event["id"], event["creator"]))
+
+async def post_init(application):
+    """Rebuild in-memory state from the database and report how long startup took"""
+    matchmaker.load(get_waiting_essays(), get_queued_writers())
+    if workers.runs_singleton_jobs():
+        load_turns(get_open_turns())
+    else:
+        reminders.disable()
+    
+    # Follow writes made by other bot processes
+    subscribe(matchmaking.on_essay_change)
+    subscribe(inline_search.on_essay_change)
+    subscribe(reminders.on_essay_change)
+    if workers.WORKERS:
+        subscribe(lambda event: offer_foreign_essay(application, event))
+    global change_listener
+    change_listener = asyncio.create_task(listen_for_changes())
+    
+    total = time.perf_counter() - STARTED_AT
+    STARTUP_SECONDS.labels("total").set(total)
+    logger.info("🚀 Ready in %.0f ms", total * 1000)
+
+async def post_shutdown(application):
+    """Stop the change listener and flush the traces"""
+    if change_listener:
+        change_listener.cancel()
+    shutdown_tracing()
+
 def main():
     """Main function to start the bot"""
-    # Initialize database
+    STARTUP_SECONDS.labels("imports").set(time.perf_counter() - STARTED_AT)
+    setup_tracing()
+    
+    # Initialize database: one schema_version lookup unless migrations are pending
+    schema_started = time.perf_counter()
     try:
-        init_db()
+        init_db(auto_migrate=MIGRATE_ON_BOOT)
     except Exception as e:
-        logger.error(f"❌ Failed to initialize database: {e}")
+        logger.error("❌ Failed to initialize database: %s", e)
         logger.error("Make sure PostgreSQL is running and configured correctly in .env")
         exit(1)
-    
-    app = Application.builder().token(TOKEN).build()
+    STARTUP_SECONDS.labels("schema").set(time.perf_counter() - schema_started)
+    
+    builder = (
+        Application.builder()
+        .application_class(TracedApplication)
+        .token(TOKEN)
+        .request(InstrumentedRequest())
+        .persistence(PostgresPersistence())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if API_BASE_URL:
+        builder.base_url(API_BASE_URL)
+    app = builder.build()
+    
+    # Callback data is parsed once per update and dispatched by action code;
+    # each state only routes the buttons it accepts
+    menu_router = cb.CallbackRouter({
+        cb.CREATE: create_essay,
+        cb.BROWSE: browse_essays,
+        cb.MY_ESSAYS: my_essays,
+        cb.MY_JOINED: my_joined_essays,
+        cb.BACK: back_to_main,
+        cb.JOIN: join_essay_callback,
+        cb.CONTINUE: continue_writing,
+        cb.CONFIRM: confirm_write,
+        cb.FINISH: finish_request,
+        cb.ACCEPT: accept_finish,
+        cb.DECLINE: decline_finish,
+        cb.FIND_PARTNER: find_partner,
+        cb.MATCH: queue_for_partner,
+        cb.LEAVE_QUEUE: leave_queue,
+        cb.SEARCH: search_prompt,
+        cb.SEARCH_PAGE: search_page,
+    })
+    anonymity_router = cb.CallbackRouter({
+        cb.ANON: choose_anonymity,
+        cb.BACK: back_to_main,
+    })
+    join_anonymity_router = cb.CallbackRouter({
+        cb.JOIN_ANON: choose_join_anonymity,
+        cb.BACK: back_to_main,
+    })
+    search_router = cb.CallbackRouter({
+        cb.SEARCH: search_prompt,
+        cb.SEARCH_PAGE: search_page,
+        cb.JOIN: join_essay_callback,
+        cb.BACK: back_to_main,
+    })
+    first_write_router = cb.CallbackRouter({
+        cb.BACK: back_to_main,
+        cb.CREATE: create_essay,
+    })
+    development_router = cb.CallbackRouter({
+        cb.CONFIRM: confirm_write,
+        cb.CONTINUE: continue_writing,
+        cb.BACK: back_to_main,
+    })
     
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        entry_points=[CommandHandler("start", start), CommandHandler("search", search_command)],
         states={
-            WAITING_FOR_PARTNER: [
-                CallbackQueryHandler(create_essay, pattern="^create_essay$"),
-                CallbackQueryHandler(browse_essays, pattern="^browse_essays$"),
-                CallbackQueryHandler(my_essays, pattern="^my_essays$"),
-                CallbackQueryHandler(my_joined_essays, pattern="^my_joined_essays$"),
-                CallbackQueryHandler(back_to_main, pattern="^back_to_main$"),
-                CallbackQueryHandler(join_essay_callback, pattern="^join_essay_"),
-                CallbackQueryHandler(continue_writing, pattern="^continue_"),
-                CallbackQueryHandler(confirm_write, pattern="^confirm_write_"),
-                CallbackQueryHandler(finish_request, pattern="^finish_request_"),
-                CallbackQueryHandler(accept_finish, pattern="^accept_finish_"),
-                CallbackQueryHandler(decline_finish, pattern="^decline_finish_"),
-            ],
-            CHOOSE_ANONYMITY: [
-                CallbackQueryHandler(choose_anonymity, pattern="^anon_"),
-                CallbackQueryHandler(back_to_main, pattern="^back_to_main$"),
-            ],
-            CHOOSE_JOIN_ANONYMITY: [
-                CallbackQueryHandler(choose_join_anonymity, pattern="^join_anon_"),
-                CallbackQueryHandler(back_to_main, pattern="^back_to_main$"),
+            WAITING_FOR_PARTNER: [menu_router],
+            CHOOSE_ANONYMITY: [anonymity_router],
+            CHOOSE_JOIN_ANONYMITY: [join_anonymity_router],
+            SEARCHING: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_search_text),
+                search_router,
             ],
             WRITING_FIRST: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_first_write),
-                CallbackQueryHandler(back_to_main, pattern="^back_to_main$"),
-                CallbackQueryHandler(create_essay, pattern="^create_essay$"),
+                first_write_router,
             ],
             WRITING_DEVELOPMENT: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_development),
-                CallbackQueryHandler(confirm_write, pattern="^confirm_write_"),
-                CallbackQueryHandler(continue_writing, pattern="^continue_"),
-                CallbackQueryHandler(back_to_main, pattern="^back_to_main$"),
+                development_router,
             ],
         },
-        fallbacks=[CommandHandler("help", help_command)],
+        fallbacks=[CommandHandler("help", help_command), CommandHandler("search", search_command)],
+        name="essay_conversation",
+        persistent=True,
     )
     
+    # Stamp activity before any other handler so idle user_data can be evicted
+    app.add_handler(TypeHandler(Update, track_activity), group=-1)
+    # Drop a pending search prompt once the user does anything else (own group: one handler per group runs)
+    app.add_handler(TypeHandler(Update, clear_search_prompt), group=-2)
+    app.job_queue.run_repeating(sweep_idle_data, interval=SWEEP_INTERVAL, first=SWEEP_INTERVAL)
+    # With several workers only the first one runs the jobs that act on every essay
+    if workers.runs_singleton_jobs():
+        app.job_queue.run_repeating(turn_timer_tick, interval=TURN_TIMER_TICK, first=TURN_TIMER_TICK)
+        app.job_queue.run_repeating(expire_stale_essays, interval=EXPIRY_SWEEP_INTERVAL, first=60)
+        app.job_queue.run_repeating(ensure_partitions_job, interval=24 * 3600, first=30)
+    
     app.add_handler(conv_handler)
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("join", join_essay))
-    
-    # External handlers for notification flow - these work outside conversation state
-    # These are added AFTER the ConversationHandler, so they only fire if ConversationHandler doesn't handle the update
-    app.add_handler(CallbackQueryHandler(back_to_main, pattern="^back_to_main$"))
-    app.add_handler(CallbackQueryHandler(join_essay_callback, pattern="^join_essay_"))
-    app.add_handler(CallbackQueryHandler(choose_join_anonymity, pattern="^join_anon_"))
-    app.add_handler(CallbackQueryHandler(continue_writing, pattern="^continue_"))
-    app.add_handler(CallbackQueryHandler(confirm_write, pattern="^confirm_write_"))
-    app.add_handler(CallbackQueryHandler(finish_request, pattern="^finish_request_"))
-    app.add_handler(CallbackQueryHandler(accept_finish, pattern="^accept_finish_"))
-    app.add_handler(CallbackQueryHandler(decline_finish, pattern="^decline_finish_"))
-    
-    # External handlers for menu buttons that work when pressed outside conversation state
-    app.add_handler(CallbackQueryHandler(create_essay, pattern="^create_essay$"))
-    app.add_handler(CallbackQueryHandler(my_essays, pattern="^my_essays$"))
-    app.add_handler(CallbackQueryHandler(my_joined_essays, pattern="^my_joined_essays$"))
-    app.add_handler(CallbackQueryHandler(browse_essays, pattern="^browse_essays$"))
-    app.add_handler(CallbackQueryHandler(choose_anonymity, pattern="^anon_"))
+    app.add_handler(CommandHandler("search", search_command))
+    app.add_handler(InlineQueryHandler(track_handler(inline_query)))
+    app.add_handler(CommandHandler("memstats", memstats_command))
+    # Non-blocking, otherwise the profiling window would stall all other updates
+    app.add_handler(CommandHandler("profile", profile_command, block=False))
+    
+    # Buttons pressed outside conversation state (e.g. notifications after a restart)
+    # This is added AFTER the ConversationHandler, so it only fires if ConversationHandler doesn't handle the update
+    app.add_handler(cb.CallbackRouter({
+        cb.BACK: back_to_main,
+        cb.JOIN: join_essay_callback,
+        cb.JOIN_ANON: choose_join_anonymity,
+        cb.CONTINUE: continue_writing,
+        cb.CONFIRM: confirm_write,
+        cb.FINISH: finish_request,
+        cb.ACCEPT: accept_finish,
+        cb.DECLINE: decline_finish,
+        # Menu buttons, including those rendered by back_to_main and create_essay above
+        cb.CREATE: create_essay,
+        cb.MY_ESSAYS: my_essays,
+        cb.MY_JOINED: my_joined_essays,
+        cb.BROWSE: browse_essays,
+        cb.ANON: choose_anonymity,
+        cb.FIND_PARTNER: find_partner,
+        cb.MATCH: queue_for_partner,
+        cb.LEAVE_QUEUE: leave_queue,
+        cb.SEARCH: search_prompt,
+        cb.SEARCH_PAGE: search_page,
+    }, expired=expired_button))
     
     # External message handler for text messages when not in conversation
+    @track_handler
     async def handle_external_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages outside conversation state"""
         user_id = update.effective_user.id
         
+        # Search words typed after a search prompt shown outside the conversation
+        if context.user_data.get('awaiting_search'):
+            await handle_search_text(update, context)
+            return
+        
         # Check if user is in essay creation flow (waiting for topic/first paragraph)
         if 'is_anonymous' in context.user_data:
             # User is in creation flow, route to first write handler
             await handle_first_write(update, context)
             return
         
-        # Check if user has active session (for development flow)
-        essay_id = get_user_session(user_id)
+        # Check if user has an essay in progress (for development flow)
+        essay_id = context.user_data.get('current_essay_id')
         if essay_id:
-            logger.info(f"📝 External message handler: user_id={user_id}, essay_id={essay_id}")
-            context.user_data['current_essay_id'] = essay_id
+            logger.info("📝 External message handler: user_id=%s, essay_id=%s", user_id, essay_id)
             await handle_development(update, context)
     
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_external_text))
     
+    start_metrics_server(app)
+    
     logger.info("✅ Bot started successfully!")
     logger.info("🤖 Using PostgreSQL database")
-    app.run_polling()
+    if workers.WORKER_NAME:
+        # Updates arrive from the webhook ingress (ingress.py) instead of getUpdates
+        asyncio.run(workers.run_worker(app))
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
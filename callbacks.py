@@ -0,0 +1,166 @@
+"""
+Compact callback_data encoding and O(1) dispatch for inline keyboard buttons.
+
+Callback data is encoded as ``<action>[:<arg>...]`` where ``action`` is a short
+code and every argument has a fixed type per action.  The data is parsed once
+in ``CallbackRouter.check_update`` and the handler is picked with a single
+dict lookup; handlers read the typed arguments from ``context.args``.  Data
+that can't be decoded (e.g. pre-migration buttons with string essay ids) goes
+to the router's ``expired`` handler, if it has one.
+"""
+from telegram import Update
+from telegram.ext import CallbackQueryHandler
+
+SEP = ":"
+MAX_CALLBACK_BYTES = 64  # Telegram limit for callback_data
+
+# Action codes
+CREATE = "c"
+BROWSE = "b"
+MY_ESSAYS = "m"
+MY_JOINED = "mj"
+BACK = "h"
+JOIN = "j"
+JOIN_ANON = "ja"
+ANON = "an"
+CONTINUE = "w"
+CONFIRM = "ok"
+FINISH = "f"
+ACCEPT = "a"
+DECLINE = "d"
+SHARE = "s"
+FIND_PARTNER = "fp"
+MATCH = "mm"
+LEAVE_QUEUE = "mx"
+SEARCH = "sq"
+SEARCH_PAGE = "sp"
+
+
+def _flag(value):
+    return value == "1"
+
+
+# Argument converters per action
+ARG_TYPES = {
+    CREATE: (),
+    BROWSE: (),
+    MY_ESSAYS: (),
+    MY_JOINED: (),
+    BACK: (),
+    JOIN: (int,),
+    JOIN_ANON: (_flag,),
+    ANON: (_flag,),
+    CONTINUE: (int,),
+    CONFIRM: (int,),
+    FINISH: (int,),
+    ACCEPT: (int,),
+    DECLINE: (int,),
+    SHARE: (int,),
+    FIND_PARTNER: (),
+    MATCH: (_flag,),
+    LEAVE_QUEUE: (),
+    SEARCH: (),
+    SEARCH_PAGE: (int,),
+}
+
+# Callback data produced before the compact format, still present on buttons in chat history
+_LEGACY_EXACT = {
+    "create_essay": (CREATE, ()),
+    "browse_essays": (BROWSE, ()),
+    "my_essays": (MY_ESSAYS, ()),
+    "my_joined_essays": (MY_JOINED, ()),
+    "back_to_main": (BACK, ()),
+    "anon_yes": (ANON, (True,)),
+    "anon_no": (ANON, (False,)),
+    "join_anon_yes": (JOIN_ANON, (True,)),
+    "join_anon_no": (JOIN_ANON, (False,)),
+}
+_LEGACY_PREFIXES = (
+    ("join_essay_", JOIN),
+    ("confirm_write_", CONFIRM),
+    ("finish_request_", FINISH),
+    ("accept_finish_", ACCEPT),
+    ("decline_finish_", DECLINE),
+    ("continue_", CONTINUE),
+    ("share_", SHARE),
+)
+
+
+def encode(action, *args):
+    """Encode an action code and its arguments as callback_data"""
+    parts = [action]
+    for arg in args:
+        if isinstance(arg, bool):
+            parts.append("1" if arg else "0")
+        else:
+            parts.append(str(arg))
+    data = SEP.join(parts)
+    if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data exceeds {MAX_CALLBACK_BYTES} bytes: {data!r}")
+    return data
+
+
+def _decode_legacy(data):
+    legacy = _LEGACY_EXACT.get(data)
+    if legacy:
+        return legacy
+    for prefix, action in _LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            try:
+                return action, (ARG_TYPES[action][0](data[len(prefix):]),)
+            except ValueError:
+                # Pre-migration string essay ids no longer resolve
+                return None
+    return None
+
+
+def decode(data):
+    """Parse callback_data into ``(action, args)``, or None if it is not recognised"""
+    if not isinstance(data, str):
+        return None
+    parts = data.split(SEP)
+    types = ARG_TYPES.get(parts[0])
+    if types is None or len(types) != len(parts) - 1:
+        return _decode_legacy(data)
+    try:
+        if not types:
+            return parts[0], ()
+        if len(types) == 1:
+            return parts[0], (types[0](parts[1]),)
+        return parts[0], tuple([convert(value) for convert, value in zip(types, parts[1:])])
+    except ValueError:
+        return None
+
+
+class CallbackRouter(CallbackQueryHandler):
+    """Single callback query handler dispatching on the action code"""
+
+    __slots__ = ("routes", "expired")
+
+    def __init__(self, routes, expired=None):
+        super().__init__(self._unrouted)
+        self.routes = dict(routes)
+        self.expired = expired
+
+    @staticmethod
+    async def _unrouted(update, context):
+        return None
+
+    def check_update(self, update):
+        """Decode the callback data once and return ``(handler, args)`` if it is routed here"""
+        if not isinstance(update, Update) or not update.callback_query:
+            return None
+        parsed = decode(update.callback_query.data)
+        if parsed is None:
+            return (self.expired, ()) if self.expired else None
+        handler = self.routes.get(parsed[0])
+        if handler is None:
+            return None
+        return handler, parsed[1]
+
+    def collect_additional_context(self, context, update, application, check_result):
+        context.args = list(check_result[1])
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        return await check_result[0](update, context)
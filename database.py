@@ -1,27 +1,85 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime
+import heapq
+import json
 import os
+import re
+import socket
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 import logging
+from ids import new_essay_id, new_join_code
+from shards import (
+    SHARDED, SHARD_DATABASE_URLS, all_databases, creator_shard, database_of_shard, database_of_essay,
+    databases_for_join_code,
+)
+from models import Essay, Partner, ESSAY_COLUMNS
+import unit_of_work
+import migrations
+from metrics import (
+    track_query, DB_CONNECTIONS_OPEN, DB_CONNECTIONS_OPENED, DB_STATEMENTS, DB_READS, DB_REPLICA_LAG,
+)
 
-load_dotenv(override=True)
+# ENV_FILE points at an alternative .env (e.g. os.devnull to use only the process environment)
+load_dotenv(os.getenv("ENV_FILE"), override=True)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_statements_executed = 0
+_counting_cursors = {}
+
+def statements_executed():
+    """Total number of SQL statements executed by this process"""
+    return _statements_executed
+
+def _counting_cursor(factory):
+    """Subclass of a cursor factory that counts every execute()"""
+    cls = _counting_cursors.get(factory)
+    if cls is None:
+        def execute(self, query, vars=None):
+            global _statements_executed
+            _statements_executed += 1
+            DB_STATEMENTS.inc()
+            work = unit_of_work.current()
+            if work is not None:
+                work.statements += 1
+            return factory.execute(self, query, vars)
+        cls = type(f"Counting{factory.__name__}", (factory,), {"execute": execute})
+        _counting_cursors[factory] = cls
+    return cls
+
+class TrackedConnection(psycopg2.extensions.connection):
+    """Connection that keeps the connection and statement metrics up to date"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        DB_CONNECTIONS_OPENED.inc()
+        DB_CONNECTIONS_OPEN.inc()
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.pop('cursor_factory', None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=_counting_cursor(factory), **kwargs)
+
+    def close(self):
+        if not self.closed:
+            DB_CONNECTIONS_OPEN.dec()
+        super().close()
+
 # Database configuration - Support Railway and local development
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if DATABASE_URL:
     # Railway environment - use DATABASE_URL
-    def get_connection():
-        """Get database connection from Railway"""
+    def get_connection(**options):
+        """Get database connection from Railway (options: extra libpq parameters)"""
         try:
-            conn = psycopg2.connect(DATABASE_URL)
+            conn = psycopg2.connect(DATABASE_URL, connection_factory=TrackedConnection, **options)
             return conn
         except psycopg2.Error as e:
-            logger.error(f"Database connection error: {e}")
+            logger.error("Database connection error: %s", e)
             raise
 else:
     # Try Railway individual variables (PGHOST, PGUSER, etc.)
@@ -33,19 +91,21 @@ else:
     
     if PGHOST:
         # Railway individual variables
-        def get_connection():
-            """Get database connection from Railway PG variables"""
+        def get_connection(**options):
+            """Get database connection from Railway PG variables (options: extra libpq parameters)"""
             try:
                 conn = psycopg2.connect(
                     host=PGHOST,
                     port=PGPORT,
                     database=PGDATABASE,
                     user=PGUSER,
-                    password=PGPASSWORD
+                    password=PGPASSWORD,
+                    connection_factory=TrackedConnection,
+                    **options
                 )
                 return conn
             except psycopg2.Error as e:
-                logger.error(f"Database connection error: {e}")
+                logger.error("Database connection error: %s", e)
                 raise
     else:
         # Local development - use individual environment variables
@@ -55,131 +115,295 @@ else:
         DB_USER = os.getenv("DB_USER", "postgres")
         DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
 
-        def get_connection():
-            """Get database connection from local .env"""
+        def get_connection(**options):
+            """Get database connection from local .env (options: extra libpq parameters)"""
             try:
                 conn = psycopg2.connect(
                     host=DB_HOST,
                     port=DB_PORT,
                     database=DB_NAME,
                     user=DB_USER,
-                    password=DB_PASSWORD
+                    password=DB_PASSWORD,
+                    connection_factory=TrackedConnection,
+                    **options
                 )
                 return conn
             except psycopg2.Error as e:
-                logger.error(f"Database connection error: {e}")
+                logger.error("Database connection error: %s", e)
                 raise
 
-def init_db():
-    """Initialize database schema"""
-    conn = get_connection()
+# Optional streaming replica for the read-only screens (browse, my essays, search).
+# Anything read around a write (get_essay and friends) stays on the primary.
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))  # seconds; beyond it reads go to the primary
+REPLICA_LAG_CHECK = float(os.getenv("REPLICA_LAG_CHECK", "5"))  # seconds between lag measurements
+
+_replica_lag = None  # last measured lag, None while unknown or unreachable
+_replica_checked_at = float("-inf")
+_recent_writers = OrderedDict()  # user id -> monotonic time of their last write, oldest first
+
+def _note_write(*user_ids):
+    """Keep the reads of these users on the primary until the replica has caught up with this write"""
+    if not REPLICA_DATABASE_URL:
+        return
+    now = time.monotonic()
+    for user_id in user_ids:
+        _recent_writers[user_id] = now
+        _recent_writers.move_to_end(user_id)
+    while _recent_writers and next(iter(_recent_writers.values())) < now - REPLICA_MAX_LAG:
+        _recent_writers.popitem(last=False)
+
+def _measure_replica_lag(conn):
+    """Seconds the replica is behind; 0 once it has replayed everything it received, infinite when not streaming"""
     cur = conn.cursor()
-    
     try:
-        # Create essays table
+        # replay_timestamp alone keeps growing while the primary is idle, so compare positions first -
+        # but only while the WAL receiver streams, otherwise receive = replay just means nothing arrives.
+        # status is only visible to pg_read_all_stats; other roles just see whether a receiver runs.
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS essays (
-                id VARCHAR(255) PRIMARY KEY,
-                creator_id BIGINT NOT NULL,
-                creator_name VARCHAR(255) NOT NULL,
-                topic TEXT NOT NULL,
-                first_content TEXT,
-                second_content TEXT,
-                status VARCHAR(50) DEFAULT 'waiting_first',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_writer_id BIGINT,
-                finish_requests JSONB DEFAULT '{}'::jsonb,
-                is_anonymous BOOLEAN DEFAULT FALSE
-            )
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN NOT EXISTS (
+                    SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming'
+                ) THEN 'Infinity'::float8
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
         """)
-        
-        # Create partners table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS partners (
-                id SERIAL PRIMARY KEY,
-                essay_id VARCHAR(255) NOT NULL REFERENCES essays(id) ON DELETE CASCADE,
-                partner_id BIGINT NOT NULL,
-                partner_name VARCHAR(255) NOT NULL,
-                is_anonymous BOOLEAN DEFAULT FALSE,
-                UNIQUE(essay_id, partner_id)
-            )
-        """)
-        
-        # Create user_session table to track which essay a user is currently working on
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_session (
-                user_id BIGINT PRIMARY KEY,
-                current_essay_id VARCHAR(255) NOT NULL REFERENCES essays(id) ON DELETE CASCADE,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create indexes
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_essays_creator ON essays(creator_id)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_essays_status ON essays(status)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_partners_partner ON partners(partner_id)")
-        
-        conn.commit()
-        logger.info("✅ Database initialized successfully")
-    except psycopg2.Error as e:
-        conn.rollback()
-        logger.error(f"Error initializing database: {e}")
-        raise
+        return float(cur.fetchone()[0])
     finally:
         cur.close()
+
+def get_read_connection(user_id=None):
+    """Connection for a read-only query: the replica, unless it lags too far or user_id just wrote"""
+    global _replica_lag, _replica_checked_at
+    if not REPLICA_DATABASE_URL:
+        return get_connection()
+    now = time.monotonic()
+    due = now - _replica_checked_at >= REPLICA_LAG_CHECK
+    fresh_write = user_id is not None and _recent_writers.get(user_id, float("-inf")) >= now - REPLICA_MAX_LAG
+    if fresh_write or (not due and (_replica_lag is None or _replica_lag > REPLICA_MAX_LAG)):
+        DB_READS.labels("primary").inc()
+        return get_connection()
+
+    conn = None
+    try:
+        conn = psycopg2.connect(REPLICA_DATABASE_URL, connection_factory=TrackedConnection)
+        if due:
+            lag = _measure_replica_lag(conn)
+            if lag > REPLICA_MAX_LAG and (_replica_lag is None or _replica_lag <= REPLICA_MAX_LAG):
+                logger.warning("⚠️ Replica is %.1f s behind, reading from the primary", lag)
+            _replica_lag, _replica_checked_at = lag, now
+            DB_REPLICA_LAG.set(lag)
+    except psycopg2.Error as e:
+        # Retried after REPLICA_LAG_CHECK seconds
+        logger.warning("⚠️ Replica unavailable, reading from the primary: %s", e)
+        if conn is not None:
+            conn.close()
+        _replica_lag, _replica_checked_at = None, now
+        DB_READS.labels("primary").inc()
+        return get_connection()
+    if _replica_lag > REPLICA_MAX_LAG:
         conn.close()
+        DB_READS.labels("primary").inc()
+        return get_connection()
+    DB_READS.labels("replica").inc()
+    return conn
 
-def create_essay(essay_id, creator_id, creator_name, topic):
-    """Create a new essay"""
-    conn = get_connection()
+def get_shard_connection(db, **options):
+    """Connection to essay database db (see shards.py); the main database when not sharded"""
+    if not SHARDED:
+        return get_connection(**options)
+    try:
+        return psycopg2.connect(SHARD_DATABASE_URLS[db], connection_factory=TrackedConnection, **options)
+    except psycopg2.Error as e:
+        logger.error("Database connection error (shard database %s): %s", db, e)
+        raise
+
+def schema_databases():
+    """(name, connect) of every database that needs the schema: the main one and each shard database"""
+    databases = [("main", get_connection)]
+    if SHARDED:
+        # Shard databases get the full schema too; their user-scoped tables just stay empty
+        databases += [(f"shard {db}", lambda db=db: get_shard_connection(db)) for db in all_databases()]
+    return databases
+
+def _essay_connection(essay_id):
+    return get_shard_connection(database_of_essay(essay_id))
+
+def _scatter_connection(db, user_id=None):
+    """Connection for one database of a read-only scatter-gather (the replica logic applies unsharded)"""
+    return get_shard_connection(db) if SHARDED else get_read_connection(user_id)
+
+def _by_database(essay_ids, key=lambda item: item):
+    """Group essay ids (or items keyed by essay id) by the database storing them"""
+    groups = {}
+    for item in essay_ids:
+        groups.setdefault(database_of_essay(key(item)), []).append(item)
+    return groups
+
+_ESSAY_SELECT = ", ".join(f"e.{column}" for column in ESSAY_COLUMNS)
+
+NOTIFY_CHANNEL = "essay_changes"
+NOTIFY_CHANGES = os.getenv("NOTIFY_CHANGES", "1") == "1"
+_HOSTNAME = socket.gethostname()
+
+def process_origin():
+    """Identifies this process in change notifications"""
+    return f"{_HOSTNAME}:{os.getpid()}"
+
+def _notify(cur, op, essay_ids, **extra):
+    """Queue a change notification per essay, delivered to listeners (see invalidation.py) on commit"""
+    if not NOTIFY_CHANGES or not essay_ids:
+        return
+    origin = process_origin()
+    payloads = [json.dumps({"op": op, "id": essay_id, "origin": origin, **extra}) for essay_id in essay_ids]
+    cur.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload", (NOTIFY_CHANNEL, payloads))
+
+def _tracked(essay_id):
+    """The essay as already loaded in this update, or None"""
+    work = unit_of_work.current()
+    return None if work is None else work.get(essay_id)
+
+def _track(essay):
+    """Keep essay in this update's identity map"""
+    work = unit_of_work.current()
+    return essay if work is None else work.add(essay)
+
+def _with_partners(cur, rows):
+    """Essays for tuple rows in ESSAY_COLUMNS order, with their partners loaded in one query"""
+    essays = [Essay.from_row(row) for row in rows]
+    if essays:
+        by_id = {essay.id: essay for essay in essays}
+        cur.execute("""
+            SELECT essay_id, partner_id, partner_name, is_anonymous FROM partners
+            WHERE essay_id = ANY(%s) ORDER BY essay_id, id
+        """, (list(by_id),))
+        for essay_id, partner_id, partner_name, is_anonymous in cur.fetchall():
+            by_id[essay_id].partners.append(Partner(partner_id, partner_name, is_anonymous))
+    return essays
+
+@track_query
+def init_db(auto_migrate=True):
+    """Check the schema version of every database, applying pending migrations if allowed (see migrations/)"""
+    for name, connect in schema_databases():
+        conn = connect()
+        
+        try:
+            # A single query on the normal boot path: schema_version already matches the code
+            version = migrations.current_version(conn)
+            latest = migrations.latest_version()
+            if version == latest:
+                logger.info("✅ Database schema (%s) is at version %s", name, version)
+                continue
+            if version > latest:
+                # A newer release has migrated the database - keep running, the migrations are additive
+                logger.warning("⚠️ Database schema (%s) version %s is newer than this release (%s)", name, version, latest)
+                continue
+            if not auto_migrate:
+                raise RuntimeError(f"Database schema ({name}) is at version {version}, expected {latest} - run migrate.py")
+            applied = migrations.migrate(conn)
+            logger.info("✅ Database (%s) migrated to version %s (applied %s)", name, latest, applied)
+        except psycopg2.Error as e:
+            logger.error("Error initializing database (%s): %s", name, e)
+            raise
+        finally:
+            conn.close()
+
+@track_query
+def create_essay(creator_id, creator_name, topic, attempts=3):
+    """Create a new essay on its creator's shard and return its (id, join_code)"""
+    shard = creator_shard(creator_id)
+    conn = get_shard_connection(database_of_shard(shard))
     cur = conn.cursor()
     
     try:
-        cur.execute("""
-            INSERT INTO essays (id, creator_id, creator_name, topic, status)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (essay_id, creator_id, creator_name, topic, 'waiting_first'))
+        essay_id = new_essay_id(shard)
+        for attempt in range(attempts):
+            # join_codes is only unique per database, so sharded codes name their shard
+            join_code = new_join_code(shard=shard) if SHARDED else new_join_code()
+            try:
+                # join_codes keeps the codes unique across all essays partitions
+                cur.execute("INSERT INTO join_codes (join_code, essay_id) VALUES (%s, %s)", (join_code, essay_id))
+                cur.execute("""
+                    INSERT INTO essays (id, join_code, creator_id, creator_name, topic, status)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (essay_id, join_code, creator_id, creator_name, topic, 'waiting_first'))
+                _notify(cur, "create", [essay_id], creator=creator_id)
+                break
+            except errors.UniqueViolation:
+                # Join code collision - roll back and draw a new one
+                conn.rollback()
+                if attempt == attempts - 1:
+                    raise
         
         conn.commit()
-        logger.info(f"✅ Essay created: {essay_id}")
+        _note_write(creator_id)
+        logger.info("✅ Essay created: %s (code %s)", essay_id, join_code)
+        return essay_id, join_code
     except psycopg2.Error as e:
         conn.rollback()
-        logger.error(f"Error creating essay: {e}")
+        logger.error("Error creating essay: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
+@track_query
 def get_essay(essay_id):
-    """Get essay by ID"""
-    conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    """Get essay by ID (once per update: later calls return the same object)"""
+    work = unit_of_work.current()
+    if work is not None and work.get(essay_id) is not None:
+        return work.get(essay_id)
+    conn = _essay_connection(essay_id)
+    cur = conn.cursor()
     
     try:
-        cur.execute("SELECT * FROM essays WHERE id = %s", (essay_id,))
-        essay = cur.fetchone()
+        cur.execute(f"SELECT {_ESSAY_SELECT} FROM essays e WHERE e.id = %s", (essay_id,))
+        row = cur.fetchone()
         
-        if essay:
-            # Get partners with anonymity info
-            cur.execute("""
-                SELECT partner_id as id, partner_name as name, is_anonymous FROM partners 
-                WHERE essay_id = %s
-            """, (essay_id,))
-            partners = cur.fetchall()
-            essay['partners'] = [dict(p) for p in partners]
-            
-            return dict(essay)
+        if row:
+            return _track(_with_partners(cur, [row])[0])
         return None
     except psycopg2.Error as e:
-        logger.error(f"Error getting essay: {e}")
+        logger.error("Error getting essay: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
+@track_query
+def get_essay_by_join_code(join_code):
+    """Get essay by its short join code"""
+    work = unit_of_work.current()
+    if work is not None and work.get_by_join_code(join_code) is not None:
+        return work.get_by_join_code(join_code)
+    # Sharded codes end in their shard's character; codes from before sharding may be anywhere
+    for db in databases_for_join_code(join_code):
+        conn = get_shard_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute(f"""
+                SELECT {_ESSAY_SELECT} FROM join_codes j JOIN essays e ON e.id = j.essay_id
+                WHERE j.join_code = %s
+            """, (join_code,))
+            row = cur.fetchone()
+            
+            if row:
+                return _track(_with_partners(cur, [row])[0])
+        except psycopg2.Error as e:
+            logger.error("Error getting essay by join code: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    return None
+
+@track_query
 def update_essay(essay_id, **kwargs):
     """Update essay fields"""
-    conn = get_connection()
+    conn = _essay_connection(essay_id)
     cur = conn.cursor()
     
     try:
@@ -196,21 +420,237 @@ def update_essay(essay_id, **kwargs):
             return
         
         values.append(essay_id)
-        query = f"UPDATE essays SET {', '.join(updates)} WHERE id = %s"
+        # The update may be made by the creator or a partner, so both are returned to stay on the primary
+        query = f"""
+            UPDATE essays SET {', '.join(updates)} WHERE id = %s
+            RETURNING creator_id, ARRAY(SELECT partner_id FROM partners WHERE essay_id = essays.id)
+        """
         cur.execute(query, values)
+        row = cur.fetchone()
+        if row:
+            _notify(cur, "update", [essay_id], creator=row[0], status=kwargs.get('status'))
+        conn.commit()
+        if row:
+            _note_write(row[0], *row[1])
+        logger.info("✅ Essay updated: %s", essay_id)
+        
+        essay = _tracked(essay_id)
+        if essay is not None:
+            for field, value in kwargs.items():
+                if field in allowed_fields:
+                    # finish_requests is passed as JSON text but read back as a dict
+                    essay[field] = json.loads(value) if field == 'finish_requests' and isinstance(value, str) else value
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error("Error updating essay: %s", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+@track_query
+def start_turn(essay_id, last_writer_id):
+    """Record a submitted turn: the other writer's clock starts now and pending finish requests reset"""
+    conn = _essay_connection(essay_id)
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            UPDATE essays
+            SET last_writer_id = %s, finish_requests = '{}', turn_started_at = CURRENT_TIMESTAMP, reminders_sent = 0
+            WHERE id = %s
+            RETURNING turn_started_at
+        """, (last_writer_id, essay_id))
+        row = cur.fetchone()
+        if row:
+            _notify(cur, "turn", [essay_id])
         conn.commit()
-        logger.info(f"✅ Essay updated: {essay_id}")
+        _note_write(last_writer_id)
+        
+        essay = _tracked(essay_id)
+        if essay is not None and row:
+            essay.last_writer_id = last_writer_id
+            essay.finish_requests = {}
+            essay.turn_started_at = row[0]
+            essay.reminders_sent = 0
     except psycopg2.Error as e:
         conn.rollback()
-        logger.error(f"Error updating essay: {e}")
+        logger.error("Error starting turn: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
+@track_query
+def get_open_turns():
+    """(essay_id, seconds since the turn started, reminders sent) for every essay in progress"""
+    turns = []
+    for db in all_databases():
+        conn = get_shard_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute("""
+                SELECT id, EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - turn_started_at)::FLOAT8, reminders_sent
+                FROM essays WHERE status = 'in_progress' AND turn_started_at IS NOT NULL
+            """)
+            turns.extend(cur.fetchall())
+        except psycopg2.Error as e:
+            logger.error("Error getting open turns: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    return turns
+
+@track_query
+def get_turn_states(essay_ids):
+    """Who is due to write in each of essay_ids, in one query per database: essay id -> dict"""
+    states = {}
+    for db, ids in _by_database(essay_ids).items():
+        conn = get_shard_connection(db)
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        try:
+            cur.execute("""
+                SELECT e.id, e.topic, e.status, e.creator_id, e.creator_name, e.is_anonymous, e.last_writer_id,
+                       e.reminders_sent, EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - e.turn_started_at)::FLOAT8 AS turn_age,
+                       p.partner_id, p.partner_name, p.is_anonymous AS partner_anonymous
+                FROM essays e
+                LEFT JOIN LATERAL (
+                    SELECT partner_id, partner_name, is_anonymous FROM partners
+                    WHERE essay_id = e.id ORDER BY id LIMIT 1
+                ) p ON TRUE
+                WHERE e.id = ANY(%s)
+            """, (ids,))
+            states.update((row['id'], dict(row)) for row in cur.fetchall())
+        except psycopg2.Error as e:
+            logger.error("Error getting turn states: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    return states
+
+@track_query
+def set_reminders_sent(updates):
+    """Record reminder progress for many essays at once from (essay_id, reminders_sent) pairs"""
+    for db, db_updates in _by_database(updates, key=lambda update: update[0]).items():
+        conn = get_shard_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            execute_values(cur, """
+                UPDATE essays SET reminders_sent = v.sent
+                FROM (VALUES %s) AS v(id, sent)
+                WHERE essays.id = v.id
+            """, db_updates, page_size=1000)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.error("Error recording reminders: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+@track_query
+def forfeit_turn(essay_id, stalled_writer_id, after_seconds):
+    """Skip a turn that has been open for after_seconds; False if the turn moved on in the meantime"""
+    conn = _essay_connection(essay_id)
+    cur = conn.cursor()
+    
+    try:
+        # Passing the turn means recording the stalled writer as the last writer
+        cur.execute("""
+            UPDATE essays
+            SET last_writer_id = %s, turn_started_at = CURRENT_TIMESTAMP, reminders_sent = 0
+            WHERE id = %s AND status = 'in_progress'
+              AND turn_started_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (stalled_writer_id, essay_id, after_seconds))
+        forfeited = cur.rowcount > 0
+        if forfeited:
+            _notify(cur, "turn", [essay_id])
+        conn.commit()
+        return forfeited
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error("Error forfeiting turn: %s", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+@track_query
+def expire_waiting_essays(before_id, limit):
+    """Expire up to limit essays per database waiting for a partner with ids below before_id (ids are time ordered)"""
+    expired = []
+    for db in all_databases():
+        conn = get_shard_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute("""
+                UPDATE essays SET status = 'expired'
+                WHERE id IN (
+                    SELECT id FROM essays
+                    WHERE status = 'waiting_partner' AND id < %s
+                    ORDER BY id LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, creator_id, topic
+            """, (before_id, limit))
+            rows = cur.fetchall()
+            _notify(cur, "update", [row[0] for row in rows], status='expired')
+            conn.commit()
+            expired.extend(rows)
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.error("Error expiring waiting essays: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    return expired
+
+@track_query
+def expire_stalled_essays(idle_seconds, limit):
+    """Expire up to limit essays (per database) in progress whose current turn has been open for idle_seconds"""
+    expired = []
+    for db in all_databases():
+        conn = get_shard_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute("""
+                UPDATE essays SET status = 'expired'
+                WHERE id IN (
+                    SELECT id FROM essays
+                    WHERE status = 'in_progress'
+                      AND COALESCE(turn_started_at, created_at) < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    ORDER BY id LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, creator_id, topic,
+                          (SELECT partner_id FROM partners WHERE essay_id = essays.id ORDER BY id LIMIT 1)
+            """, (idle_seconds, limit))
+            rows = cur.fetchall()
+            _notify(cur, "update", [row[0] for row in rows], status='expired')
+            conn.commit()
+            expired.extend(rows)
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.error("Error expiring stalled essays: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    return expired
+
+@track_query
 def add_partner(essay_id, partner_id, partner_name, is_anonymous=False):
     """Add a partner to an essay"""
-    conn = get_connection()
+    conn = _essay_connection(essay_id)
     cur = conn.cursor()
     
     try:
@@ -218,85 +658,195 @@ def add_partner(essay_id, partner_id, partner_name, is_anonymous=False):
             INSERT INTO partners (essay_id, partner_id, partner_name, is_anonymous)
             VALUES (%s, %s, %s, %s)
         """, (essay_id, partner_id, partner_name, is_anonymous))
+        _notify(cur, "join", [essay_id], partner=partner_id)
         
         conn.commit()
-        logger.info(f"✅ Partner added to essay: {essay_id}")
+        _note_write(partner_id)
+        logger.info("✅ Partner added to essay: %s", essay_id)
+        
+        essay = _tracked(essay_id)
+        if essay is not None:
+            essay.partners.append(Partner(partner_id, partner_name, is_anonymous))
     except psycopg2.Error as e:
         conn.rollback()
-        logger.error(f"Error adding partner: {e}")
+        logger.error("Error adding partner: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
-def get_user_essays(creator_id):
-    """Get all essays created by a user"""
-    conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+@track_query
+def claim_essay(essay_id, partner_id, partner_name, is_anonymous=False):
+    """Atomically take an essay that is still waiting for a partner; returns the essay or None"""
+    conn = _essay_connection(essay_id)
+    cur = conn.cursor()
     
     try:
+        # The status check in the UPDATE locks the row, so two joiners can't both win
+        cur.execute(f"""
+            UPDATE essays SET status = 'in_progress', turn_started_at = CURRENT_TIMESTAMP, reminders_sent = 0
+            WHERE id = %s AND status = 'waiting_partner' AND creator_id <> %s
+            RETURNING {", ".join(ESSAY_COLUMNS)}
+        """, (essay_id, partner_id))
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            return None
         cur.execute("""
-            SELECT * FROM essays WHERE creator_id = %s ORDER BY created_at DESC
-        """, (creator_id,))
-        essays = cur.fetchall()
-        
-        result = []
-        for essay in essays:
-            essay_dict = dict(essay)
-            # Get partners with anonymity info
-            cur.execute("""
-                SELECT partner_id as id, partner_name as name, is_anonymous FROM partners 
-                WHERE essay_id = %s
-            """, (essay_dict['id'],))
-            partners = cur.fetchall()
-            essay_dict['partners'] = [dict(p) for p in partners]
-            result.append(essay_dict)
+            INSERT INTO partners (essay_id, partner_id, partner_name, is_anonymous)
+            VALUES (%s, %s, %s, %s)
+        """, (essay_id, partner_id, partner_name, is_anonymous))
+        _notify(cur, "join", [essay_id], partner=partner_id)
         
-        return result
+        conn.commit()
+        _note_write(partner_id)
+        logger.info("✅ Essay %s claimed by partner %s", essay_id, partner_id)
+        return _track(Essay.from_row(row, [Partner(partner_id, partner_name, is_anonymous)]))
     except psycopg2.Error as e:
-        logger.error(f"Error getting user essays: {e}")
+        conn.rollback()
+        logger.error("Error claiming essay: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
-def get_user_joined_essays(partner_id):
-    """Get all essays a user joined as a partner"""
+@track_query
+def get_waiting_essays():
+    """(id, creator_id) of every essay waiting for a partner, oldest first"""
+    waiting = []
+    for db in all_databases():
+        conn = get_shard_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute("SELECT id, creator_id FROM essays WHERE status = 'waiting_partner' ORDER BY id")
+            waiting.extend(cur.fetchall())
+        except psycopg2.Error as e:
+            logger.error("Error getting waiting essays: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    if SHARDED:
+        waiting.sort()
+    return waiting
+
+@track_query
+def enqueue_writer(user_id, username, is_anonymous=False, queued_at=None):
+    """Add a writer to the matchmaking queue (at queued_at, default now), keeping their place if already queued"""
     conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     try:
         cur.execute("""
-            SELECT e.* FROM essays e
-            JOIN partners p ON e.id = p.essay_id
-            WHERE p.partner_id = %s
-            ORDER BY e.created_at DESC
-        """, (partner_id,))
-        essays = cur.fetchall()
-        
-        result = []
-        for essay in essays:
-            essay_dict = dict(essay)
-            # Get all partners with anonymity info
-            cur.execute("""
-                SELECT partner_id as id, partner_name as name, is_anonymous FROM partners 
-                WHERE essay_id = %s
-            """, (essay_dict['id'],))
-            partners = cur.fetchall()
-            essay_dict['partners'] = [dict(p) for p in partners]
-            result.append(essay_dict)
-        
-        return result
+            INSERT INTO match_queue (user_id, username, is_anonymous, queued_at)
+            VALUES (%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+            ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username, is_anonymous = EXCLUDED.is_anonymous
+            RETURNING queued_at
+        """, (user_id, username, is_anonymous, queued_at))
+        queued_at = cur.fetchone()[0]
+        conn.commit()
+        return queued_at
     except psycopg2.Error as e:
-        logger.error(f"Error getting joined essays: {e}")
+        conn.rollback()
+        logger.error("Error queueing writer: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
+@track_query
+def dequeue_writer(user_id):
+    """Remove a writer from the matchmaking queue; their queued_at if they were queued, else None"""
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("DELETE FROM match_queue WHERE user_id = %s RETURNING queued_at", (user_id,))
+        row = cur.fetchone()
+        conn.commit()
+        return row[0] if row else None
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error("Error dequeueing writer: %s", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+@track_query
+def get_queued_writers():
+    """(user_id, username, is_anonymous, queued_at) of every queued writer, oldest first"""
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("SELECT user_id, username, is_anonymous, queued_at FROM match_queue ORDER BY queued_at")
+        return cur.fetchall()
+    except psycopg2.Error as e:
+        logger.error("Error getting queued writers: %s", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+@track_query
+def get_user_essays(creator_id):
+    """Get all essays created by a user (from the replica unless they just wrote)"""
+    if SHARDED:
+        # A creator's essays all live on their shard
+        conn = get_shard_connection(database_of_shard(creator_shard(creator_id)))
+    else:
+        conn = get_read_connection(creator_id)
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(f"""
+            SELECT {_ESSAY_SELECT} FROM essays e WHERE e.creator_id = %s ORDER BY e.created_at DESC
+        """, (creator_id,))
+        return _with_partners(cur, cur.fetchall())
+    except psycopg2.Error as e:
+        logger.error("Error getting user essays: %s", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+@track_query
+def get_user_joined_essays(partner_id):
+    """Get all essays a user joined as a partner (from the replica unless they just wrote)"""
+    essays = []
+    # Partners can join essays on any shard
+    for db in all_databases():
+        conn = _scatter_connection(db, partner_id)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute(f"""
+                SELECT {_ESSAY_SELECT} FROM essays e
+                JOIN partners p ON e.id = p.essay_id
+                WHERE p.partner_id = %s
+                ORDER BY e.created_at DESC
+            """, (partner_id,))
+            essays.extend(_with_partners(cur, cur.fetchall()))
+        except psycopg2.Error as e:
+            logger.error("Error getting joined essays: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    if SHARDED:
+        essays.sort(key=lambda essay: essay.created_at, reverse=True)
+    return essays
+
+@track_query
 def check_partner_exists(essay_id, partner_id):
     """Check if a partner already exists for an essay"""
-    conn = get_connection()
+    # The partners of an essay loaded in this update answer it without a query
+    essay = _tracked(essay_id)
+    if essay is not None:
+        return any(partner.id == partner_id for partner in essay.partners)
+    conn = _essay_connection(essay_id)
     cur = conn.cursor()
     
     try:
@@ -307,44 +857,93 @@ def check_partner_exists(essay_id, partner_id):
         count = cur.fetchone()[0]
         return count > 0
     except psycopg2.Error as e:
-        logger.error(f"Error checking partner: {e}")
+        logger.error("Error checking partner: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
-def get_all_essays():
-    """Get all essays (for admin purposes)"""
-    conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+ITERSIZE = int(os.getenv("DB_ITERSIZE", "2000"))
+
+
+def iter_essays(statuses=None, creator_id=None, after_id=None, itersize=ITERSIZE):
+    """Yield Essays (oldest first) with their partners, fetching itersize rows at a time from a server-side cursor
+    
+    Memory stays constant however many essays there are, so this is the way to read the whole table
+    (exports, backups, analytics).  The connection is held until the generator is exhausted or closed.
+    """
+    conditions, params = [], []
+    if statuses:
+        conditions.append("e.status IN %s")
+        params.append(tuple(statuses))
+    if creator_id is not None:
+        conditions.append("e.creator_id = %s")
+        params.append(creator_id)
+    if after_id is not None:
+        conditions.append("e.id > %s")
+        params.append(after_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    if not SHARDED:
+        yield from _iter_essays_in(0, where, params, itersize)
+    elif creator_id is not None:
+        yield from _iter_essays_in(database_of_shard(creator_shard(creator_id)), where, params, itersize)
+    else:
+        # One cursor per database, merged back into id order
+        yield from heapq.merge(*(_iter_essays_in(db, where, params, itersize) for db in all_databases()),
+                               key=lambda essay: essay.id)
+
+def _iter_essays_in(db, where, params, itersize):
+    conn = get_shard_connection(db)
+    # A named cursor is a server-side cursor: rows arrive in batches of itersize as the loop advances
+    cur = conn.cursor(name="iter_essays")
+    cur.itersize = itersize
     
     try:
-        cur.execute("SELECT * FROM essays ORDER BY created_at DESC")
-        essays = cur.fetchall()
-        
-        result = []
-        for essay in essays:
-            essay_dict = dict(essay)
-            # Get partners with anonymity info
-            cur.execute("""
-                SELECT partner_id as id, partner_name as name, is_anonymous FROM partners 
-                WHERE essay_id = %s
-            """, (essay_dict['id'],))
-            partners = cur.fetchall()
-            essay_dict['partners'] = [dict(p) for p in partners]
-            result.append(essay_dict)
-        
-        return result
+        cur.execute(f"""
+            SELECT {_ESSAY_SELECT},
+                   COALESCE((
+                       SELECT jsonb_agg(jsonb_build_array(p.partner_id, p.partner_name, p.is_anonymous) ORDER BY p.id)
+                       FROM partners p WHERE p.essay_id = e.id
+                   ), '[]'::jsonb) AS partners
+            FROM essays e
+            {where}
+            ORDER BY e.id
+        """, params)
+        for row in cur:
+            yield Essay.from_row(row[:-1], [Partner(*partner) for partner in row[-1]])
     except psycopg2.Error as e:
-        logger.error(f"Error getting all essays: {e}")
+        logger.error("Error streaming essays: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
+def iter_essay_batches(batch_size=ITERSIZE, **filters):
+    """iter_essays grouped into lists of up to batch_size essays"""
+    batch = []
+    for essay in iter_essays(itersize=batch_size, **filters):
+        batch.append(essay)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@track_query
+def get_all_essays():
+    """Get all essays (for admin purposes) - prefer iter_essays() for large tables"""
+    essays = list(iter_essays())
+    essays.reverse()  # newest first, as before
+    return essays
+
+@track_query
 def set_user_session(user_id, essay_id):
-    """Set user's current essay session"""
-    conn = get_connection()
+    """Set user's current essay session (stored next to the essay, on its shard)"""
+    if SHARDED:
+        # A row on another shard would still point at the previous essay
+        _delete_user_session(user_id, keep_db=database_of_essay(essay_id))
+    conn = _essay_connection(essay_id)
     cur = conn.cursor()
     
     try:
@@ -353,80 +952,170 @@ def set_user_session(user_id, essay_id):
             VALUES (%s, %s)
             ON CONFLICT (user_id) DO UPDATE SET current_essay_id = EXCLUDED.current_essay_id, updated_at = CURRENT_TIMESTAMP
         """, (user_id, essay_id))
+        _notify(cur, "session", [essay_id], user=user_id)
         
         conn.commit()
-        logger.info(f"✅ User session set: user_id={user_id}, essay_id={essay_id}")
+        logger.info("✅ User session set: user_id=%s, essay_id=%s", user_id, essay_id)
     except psycopg2.Error as e:
         conn.rollback()
-        logger.error(f"Error setting user session: {e}")
+        logger.error("Error setting user session: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
+@track_query
 def get_user_session(user_id):
     """Get user's current essay session"""
-    conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    try:
-        cur.execute("SELECT current_essay_id FROM user_session WHERE user_id = %s", (user_id,))
-        result = cur.fetchone()
-        return result['current_essay_id'] if result else None
-    except psycopg2.Error as e:
-        logger.error(f"Error getting user session: {e}")
-        return None
-    finally:
-        cur.close()
-        conn.close()
+    for db in all_databases():
+        conn = get_shard_connection(db)
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        try:
+            cur.execute("SELECT current_essay_id FROM user_session WHERE user_id = %s", (user_id,))
+            result = cur.fetchone()
+            if result:
+                return result['current_essay_id']
+        except psycopg2.Error as e:
+            logger.error("Error getting user session: %s", e)
+            return None
+        finally:
+            cur.close()
+            conn.close()
+    return None
 
+def _delete_user_session(user_id, keep_db=None):
+    for db in all_databases():
+        if db == keep_db:
+            continue
+        conn = get_shard_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute("DELETE FROM user_session WHERE user_id = %s RETURNING current_essay_id", (user_id,))
+            _notify(cur, "session", [row[0] for row in cur.fetchall()], user=user_id)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.error("Error clearing user session: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+@track_query
 def clear_user_session(user_id):
     """Clear user's session"""
+    _delete_user_session(user_id)
+    logger.info("✅ User session cleared: user_id=%s", user_id)
+
+def search_terms(text, max_terms=8):
+    """Words of a search string, lower-cased, as used by search_open_essays (max_terms=None for all)"""
+    return re.findall(r"[^\W_]+", text.lower())[:max_terms]
+
+@track_query
+def search_open_essays(text, limit=5, offset=0):
+    """Ranked essays waiting for a partner whose topic or opening match every word of text (last word as prefix)"""
+    terms = search_terms(text)
+    if not terms:
+        return []
+    # Terms are letters and digits only, so they can't inject tsquery operators
+    tsquery = " & ".join(terms[:-1] + [terms[-1] + ":*"])
+    # Sharded, every database returns its best limit + offset rows and the page is cut from the merged ranking
+    db_limit, db_offset = (limit + offset, 0) if SHARDED else (limit, offset)
+    results = []
+    for db in all_databases():
+        conn = _scatter_connection(db)
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        try:
+            cur.execute("""
+                SELECT id, join_code, topic, creator_id, creator_name, is_anonymous, first_content,
+                       ts_rank(search_vector, q) AS rank
+                FROM essays, to_tsquery('simple', %s) AS q
+                WHERE status = 'waiting_partner' AND search_vector @@ q
+                ORDER BY rank DESC, id DESC
+                LIMIT %s OFFSET %s
+            """, (tsquery, db_limit, db_offset))
+            results.extend(dict(row) for row in cur.fetchall())
+        except psycopg2.Error as e:
+            logger.error("Error searching essays: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    if SHARDED:
+        results.sort(key=lambda row: (row['rank'], row['id']), reverse=True)
+        results = results[offset:offset + limit]
+    return results
+
+@track_query
+def get_available_essays():
+    """Get all essays waiting for partners (status: waiting_partner), from the replica if there is one"""
+    essays = []
+    for db in all_databases():
+        conn = _scatter_connection(db)
+        cur = conn.cursor()
+        
+        try:
+            cur.execute(f"""
+                SELECT {_ESSAY_SELECT} FROM essays e
+                WHERE e.status = 'waiting_partner'
+                ORDER BY e.created_at DESC
+            """)
+            essays.extend(_with_partners(cur, cur.fetchall()))
+        except psycopg2.Error as e:
+            logger.error("Error getting available essays: %s", e)
+            raise
+        finally:
+            cur.close()
+            conn.close()
+    if SHARDED:
+        essays.sort(key=lambda essay: essay.created_at, reverse=True)
+    return essays
+
+@track_query
+def load_persisted(kind):
+    """Get all persisted entries of a kind as a {key: data} dict"""
     conn = get_connection()
     cur = conn.cursor()
     
     try:
-        cur.execute("DELETE FROM user_session WHERE user_id = %s", (user_id,))
-        conn.commit()
-        logger.info(f"✅ User session cleared: user_id={user_id}")
+        cur.execute("SELECT key, data FROM bot_persistence WHERE kind = %s", (kind,))
+        return dict(cur.fetchall())
     except psycopg2.Error as e:
-        conn.rollback()
-        logger.error(f"Error clearing user session: {e}")
+        logger.error("Error loading persisted %s: %s", kind, e)
         raise
     finally:
         cur.close()
         conn.close()
 
-def get_available_essays():
-    """Get all essays waiting for partners (status: waiting_partner)"""
+@track_query
+def save_persisted(upserts, deletes):
+    """Write a batch of persisted entries in one transaction
+
+    upserts is a list of (kind, key, data_json) and deletes a list of (kind, key).
+    """
     conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     try:
-        cur.execute("""
-            SELECT * FROM essays 
-            WHERE status = 'waiting_partner'
-            ORDER BY created_at DESC
-        """)
-        essays = cur.fetchall()
-        
-        result = []
-        for essay in essays:
-            essay_dict = dict(essay)
-            # Get partners with anonymity info
-            cur.execute("""
-                SELECT partner_id as id, partner_name as name, is_anonymous FROM partners 
-                WHERE essay_id = %s
-            """, (essay_dict['id'],))
-            partners = cur.fetchall()
-            essay_dict['partners'] = [dict(p) for p in partners]
-            result.append(essay_dict)
-        
-        return result
+        if upserts:
+            execute_values(cur, """
+                INSERT INTO bot_persistence (kind, key, data)
+                VALUES %s
+                ON CONFLICT (kind, key) DO UPDATE SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+            """, upserts, template="(%s, %s, %s::jsonb)")
+        if deletes:
+            execute_values(cur, """
+                DELETE FROM bot_persistence WHERE (kind, key) IN (VALUES %s)
+            """, deletes)
+        conn.commit()
+        logger.info("✅ Persistence flushed: %s written, %s deleted", len(upserts), len(deletes))
     except psycopg2.Error as e:
-        logger.error(f"Error getting available essays: {e}")
+        conn.rollback()
+        logger.error("Error saving persisted entries: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
-
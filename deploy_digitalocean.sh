@@ -84,8 +84,7 @@ fi
 # Step 9: Run migrations
 echo "🗄️ Running database migrations..."
 source venv/bin/activate
-python migrate_db.py
-python migrate_partners_db.py
+python migrate.py
 
 # Step 10: Set up supervisor
 echo "👀 Setting up Supervisor..."
@@ -0,0 +1,113 @@
+"""
+Idle eviction for user_data/chat_data and per-user memory accounting.
+
+user_data is normally only cleared on the successful paths of a flow, so users
+who abandon a draft keep ``topic``/``pending_text`` in memory for the life of
+the process.  Every update stamps the user and chat as active; a job on the
+application's job queue drops entries that have been idle for longer than
+``USER_DATA_IDLE_TTL`` seconds (this also removes them from persistence).
+An evicted user's conversation is ended as well: its state would otherwise
+point at data that is gone (e.g. WRITING_DEVELOPMENT without current_essay_id).
+"""
+import logging
+import os
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+IDLE_TTL = float(os.getenv("USER_DATA_IDLE_TTL", str(7 * 24 * 3600)))
+SWEEP_INTERVAL = float(os.getenv("USER_DATA_SWEEP_INTERVAL", "600"))
+
+_last_seen_users = {}
+_last_seen_chats = {}
+
+
+async def track_activity(update: Update, context):
+    """Stamp the user and chat of every update as active"""
+    now = time.monotonic()
+    if update.effective_user:
+        _last_seen_users[update.effective_user.id] = now
+    if update.effective_chat:
+        _last_seen_chats[update.effective_chat.id] = now
+
+
+def approx_size(obj, _seen=None):
+    """Approximate deep size in bytes of a user_data/chat_data value"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, _seen) + approx_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, _seen) for item in obj)
+    return size
+
+
+def data_stats(application):
+    """Entry counts and approximate bytes held in user_data and chat_data"""
+    user_data = application.user_data
+    chat_data = application.chat_data
+    return {
+        'user_entries': len(user_data),
+        'user_nonempty': sum(1 for data in user_data.values() if data),
+        'user_bytes': sum(approx_size(data) for data in user_data.values()),
+        'chat_entries': len(chat_data),
+        'chat_bytes': sum(approx_size(data) for data in chat_data.values()),
+        'tracked_users': len(_last_seen_users),
+        'tracked_chats': len(_last_seen_chats),
+    }
+
+
+def _evict(data, last_seen, drop, cutoff, now):
+    evicted = 0
+    for key in list(data):
+        # Entries loaded from persistence have no activity yet; their idle clock starts now
+        if last_seen.setdefault(key, now) < cutoff:
+            drop(key)
+            del last_seen[key]
+            evicted += 1
+    # Forget activity stamps for entries that are already gone
+    for key in [key for key in last_seen if key not in data]:
+        del last_seen[key]
+    return evicted
+
+
+def _end_conversations(application, user_id):
+    """Forget every conversation state of user_id; the change reaches persistence on its next flush"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if not isinstance(handler, ConversationHandler) or not handler.per_user or handler.per_message:
+                continue
+            # No public API for this; keys are (chat_id, user_id) or (user_id,)
+            conversations = handler._conversations
+            for key in [key for key in conversations if key[-1] == user_id]:
+                del conversations[key]
+
+
+async def sweep_idle_data(context):
+    """Job callback: drop user_data/chat_data idle for longer than IDLE_TTL"""
+    application = context.application
+    now = time.monotonic()
+    cutoff = now - IDLE_TTL
+
+    def drop_user(user_id):
+        _end_conversations(application, user_id)
+        application.drop_user_data(user_id)
+
+    users = _evict(application.user_data, _last_seen_users, drop_user, cutoff, now)
+    chats = _evict(application.chat_data, _last_seen_chats, application.drop_chat_data, cutoff, now)
+    stats = data_stats(application)
+    logger.info(
+        "🧹 Evicted %s idle users, %s idle chats; "
+        "user_data: %s entries (~%s KB), chat_data: %s entries (~%s KB)",
+        users, chats,
+        stats['user_entries'], stats['user_bytes'] // 1024,
+        stats['chat_entries'], stats['chat_bytes'] // 1024,
+    )
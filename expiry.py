@@ -0,0 +1,78 @@
+"""
+Expiry of abandoned open essays.
+
+Essays nobody joins stay in ``waiting_partner`` and essays both writers walked
+away from stay in ``in_progress`` forever, so browse, matchmaking and the turn
+timers keep carrying them.  A job on the application's job queue moves them
+to the ``expired`` status in bounded batches and tells the writers; expired
+essays drop out of the partial ``idx_essays_open`` index, so the hot working
+set only holds essays that can still move.
+
+    ESSAY_OPEN_TTL      seconds an essay may wait for a partner (default 30 days)
+    ESSAY_STALL_TTL     seconds a turn may stay open (default 60 days, 0 disables)
+    EXPIRY_BATCH_SIZE   essays per UPDATE (default 500)
+    EXPIRY_MAX_BATCHES  batches per status and sweep (default 20)
+"""
+import logging
+import os
+import time
+
+from database import expire_waiting_essays, expire_stalled_essays
+from ids import compose_id
+from matchmaking import matchmaker
+from metrics import ESSAYS_EXPIRED
+from reminders import cancel_turn
+
+logger = logging.getLogger(__name__)
+
+OPEN_TTL = float(os.getenv("ESSAY_OPEN_TTL", str(30 * 24 * 3600)))
+STALL_TTL = float(os.getenv("ESSAY_STALL_TTL", str(60 * 24 * 3600)))
+BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+MAX_BATCHES = int(os.getenv("EXPIRY_MAX_BATCHES", "20"))
+SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", "3600"))
+
+
+def _days(seconds):
+    return f"{seconds / 86400:.0f} days"
+
+
+async def _notify(bot, chat_id, text):
+    try:
+        await bot.send_message(chat_id=chat_id, text=text)
+    except Exception as e:
+        logger.warning("⚠️ Could not message %s: %s: %s", chat_id, type(e).__name__, e)
+
+
+async def expire_stale_essays(context):
+    """Job callback: expire essays waiting or stalled for longer than their TTL"""
+    waiting = stalled = 0
+
+    # Essay ids are time ordered, so "created before the cutoff" is an id range scan
+    before_id = compose_id(int((time.time() - OPEN_TTL) * 1000), 0, 0)
+    for _ in range(MAX_BATCHES):
+        expired = expire_waiting_essays(before_id, BATCH_SIZE)
+        for essay_id, creator_id, topic in expired:
+            matchmaker.discard_essay(essay_id)
+            await _notify(context.bot, creator_id,
+                          f"⌛ Your essay \"{topic}\" expired after {_days(OPEN_TTL)} without a partner.\n\n"
+                          "Post it again with /start whenever you like!")
+        waiting += len(expired)
+        if len(expired) < BATCH_SIZE:
+            break
+
+    for _ in range(MAX_BATCHES if STALL_TTL else 0):
+        expired = expire_stalled_essays(STALL_TTL, BATCH_SIZE)
+        for essay_id, creator_id, topic, partner_id in expired:
+            cancel_turn(essay_id)
+            for user_id in (creator_id, partner_id):
+                if user_id:
+                    await _notify(context.bot, user_id,
+                                  f"⌛ The essay \"{topic}\" expired after {_days(STALL_TTL)} without a new turn.")
+        stalled += len(expired)
+        if len(expired) < BATCH_SIZE:
+            break
+
+    ESSAYS_EXPIRED.labels("waiting_partner").inc(waiting)
+    ESSAYS_EXPIRED.labels("in_progress").inc(stalled)
+    if waiting or stalled:
+        logger.info("⌛ Expired %s essays without a partner and %s stalled essays", waiting, stalled)
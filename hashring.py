@@ -0,0 +1,64 @@
+"""
+Consistent hashing of integer keys (user ids, creator ids) onto named nodes.
+
+Each node owns ``replicas`` points on a 64-bit ring and a key belongs to the
+first point at or after its own hash.  Adding or removing a node only moves
+the keys of the ring segments that node gains or loses, about 1/N of them,
+instead of reshuffling almost every key the way ``key % N`` would.
+"""
+import bisect
+import hashlib
+
+DEFAULT_REPLICAS = 160
+
+
+def stable_hash(value):
+    """64-bit hash of value that is the same in every process (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Map keys to nodes so that membership changes remap as few keys as possible"""
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self._points = []  # sorted hashes
+        self._owners = []  # node of each point
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    @property
+    def nodes(self):
+        return sorted(self._nodes)
+
+    def add(self, node):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self.replicas):
+            point = stable_hash(f"{node}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def node_for(self, key):
+        """The node owning key; raises LookupError on an empty ring"""
+        if not self._points:
+            raise LookupError("hash ring has no nodes")
+        index = bisect.bisect(self._points, stable_hash(key)) % len(self._points)
+        return self._owners[index]
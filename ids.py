@@ -0,0 +1,90 @@
+"""
+Essay identifiers: 64-bit time-ordered numeric IDs and short base62 join codes.
+
+An essay ID is laid out like a snowflake ID so it fits a signed BIGINT and
+sorts by creation time:
+
+    41 bits milliseconds since ID_EPOCH_MS | 10 bits node | 12 bits sequence
+
+With sharded storage (shards.py) the top ESSAY_ID_SHARD_BITS bits of the node
+field hold the essay's logical shard, leaving the rest for ESSAY_ID_NODE, and
+the last character of a join code names the shard too.
+"""
+import os
+import secrets
+import string
+import threading
+import time
+
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+BASE62_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+JOIN_CODE_LENGTH = 8
+
+SHARD_BITS = int(os.getenv("ESSAY_ID_SHARD_BITS", "0"))
+if not 0 <= SHARD_BITS <= 5:
+    # Up to 32 shards, so that a join code character can name any of them
+    raise ValueError("ESSAY_ID_SHARD_BITS must be between 0 and 5")
+SHARD_COUNT = 1 << SHARD_BITS
+NODE_ID = int(os.getenv("ESSAY_ID_NODE", "0")) & (MAX_NODE >> SHARD_BITS)
+# The highest node is reserved for essays imported by legacy_import.py
+LEGACY_NODE = MAX_NODE
+if NODE_ID == MAX_NODE >> SHARD_BITS:
+    raise ValueError(f"ESSAY_ID_NODE {NODE_ID} is reserved for imported legacy essays - use 0 to {NODE_ID - 1}")
+
+_lock = threading.Lock()
+_last_ms = -1
+_sequence = 0
+
+
+def compose_id(timestamp_ms, node=NODE_ID, sequence=0):
+    """Build an essay ID from its parts"""
+    return ((timestamp_ms - ID_EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | (node << SEQUENCE_BITS) | sequence
+
+
+def id_timestamp_ms(essay_id):
+    """Creation time of an essay ID in milliseconds since the Unix epoch"""
+    return (essay_id >> (NODE_BITS + SEQUENCE_BITS)) + ID_EPOCH_MS
+
+
+def id_shard(essay_id):
+    """Logical shard encoded in an essay ID (0 without sharding)"""
+    return (essay_id >> (SEQUENCE_BITS + NODE_BITS - SHARD_BITS)) & (SHARD_COUNT - 1)
+
+
+def new_essay_id(shard=0):
+    """Generate a new, strictly increasing essay ID for this node, on the given logical shard"""
+    global _last_ms, _sequence
+    with _lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_ms:
+            now_ms = _last_ms
+            _sequence = (_sequence + 1) & MAX_SEQUENCE
+            if _sequence == 0:
+                # Sequence exhausted for this millisecond, borrow the next one
+                now_ms += 1
+        else:
+            _sequence = 0
+        _last_ms = now_ms
+        return compose_id(now_ms, (shard << (NODE_BITS - SHARD_BITS)) | NODE_ID, _sequence)
+
+
+def new_join_code(length=JOIN_CODE_LENGTH, shard=None):
+    """Generate a random base62 join code, ending in the shard's character if a shard is given"""
+    if shard is None:
+        return "".join(secrets.choice(BASE62_ALPHABET) for _ in range(length))
+    return "".join(secrets.choice(BASE62_ALPHABET) for _ in range(length - 1)) + BASE62_ALPHABET[shard]
+
+
+def join_code_shard(join_code):
+    """Logical shard named by the last character of a join code (codes from before sharding may name any)"""
+    return max(BASE62_ALPHABET.find(join_code[-1:]), 0) % SHARD_COUNT
+
+
+def is_join_code(text):
+    """Check whether text looks like a join code"""
+    return 0 < len(text) <= 16 and all(char in BASE62_ALPHABET for char in text)
@@ -0,0 +1,129 @@
+"""
+Webhook ingress for several bot workers (see workers.py).
+
+Receives Telegram's webhook calls and forwards each update to the worker that
+owns its user on the consistent hash ring.  An update is acknowledged to
+Telegram only once its worker has accepted it, so while a worker is down
+Telegram keeps retrying instead of the update being lost.
+
+    INGRESS_PORT    port to listen on (default 8080)
+    WEBHOOK_SECRET  secret_token given to setWebhook; calls without it are rejected
+    WORKERS         the same name=url list the workers get
+
+Usage:
+    python ingress.py [--port 8080] [--set-webhook https://example.com/telegram]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from http import HTTPStatus
+
+from dotenv import load_dotenv
+
+# ENV_FILE points at an alternative .env (e.g. os.devnull to use only the process environment)
+load_dotenv(os.getenv("ENV_FILE"), override=True)
+
+import httpx  # noqa: E402
+from prometheus_client import start_http_server  # noqa: E402
+
+import workers  # noqa: E402
+from logging_setup import setup_logging  # noqa: E402
+from metrics import INGRESS_UPDATES, INGRESS_FORWARD_SECONDS, METRICS_PORT  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+INGRESS_PORT = int(os.getenv("INGRESS_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+TELEGRAM_SECRET_HEADER = "x-telegram-bot-api-secret-token"
+FORWARD_TIMEOUT = float(os.getenv("INGRESS_FORWARD_TIMEOUT", "10"))
+
+
+def make_handler(client):
+    """HTTP handler forwarding webhook updates through client"""
+    forward_headers = {"Content-Type": "application/json"}
+    if workers.INGRESS_SECRET:
+        forward_headers[workers.SECRET_HEADER] = workers.INGRESS_SECRET
+
+    async def handle(method, path, headers, body):
+        if method == "GET" and path == "/healthz":
+            return HTTPStatus.OK, b'{"ok": true}'
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, b"{}"
+        if WEBHOOK_SECRET and headers.get(TELEGRAM_SECRET_HEADER) != WEBHOOK_SECRET:
+            return HTTPStatus.FORBIDDEN, b"{}"
+        try:
+            key = workers.routing_key(json.loads(body))
+        except (ValueError, AttributeError):
+            return HTTPStatus.BAD_REQUEST, b"{}"
+
+        worker = workers.ring.node_for(key)
+        started = time.perf_counter()
+        try:
+            response = await client.post(workers.WORKERS[worker], content=body, headers=forward_headers)
+            accepted = response.status_code == HTTPStatus.OK
+        except httpx.HTTPError as e:
+            logger.warning("⚠️ Worker %s unreachable: %s: %s", worker, type(e).__name__, e)
+            accepted = False
+        INGRESS_FORWARD_SECONDS.labels(worker).observe(time.perf_counter() - started)
+        INGRESS_UPDATES.labels(worker, "forwarded" if accepted else "failed").inc()
+        # A non-2xx answer makes Telegram deliver the update again later
+        return (HTTPStatus.OK, b'{"ok": true}') if accepted else (HTTPStatus.BAD_GATEWAY, b"{}")
+
+    return handle
+
+
+async def set_webhook(url):
+    """Point the bot's webhook at url (with WEBHOOK_SECRET as its secret_token)"""
+    token = os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("TELEGRAM_TOKEN")
+    base_url = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+    params = {"url": url, "max_connections": 100}
+    if WEBHOOK_SECRET:
+        params["secret_token"] = WEBHOOK_SECRET
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{base_url}{token}/setWebhook", json=params)
+    result = response.json()
+    if not result.get("ok"):
+        raise RuntimeError(f"setWebhook failed: {result.get('description')}")
+    logger.info("🔗 Webhook set to %s", url)
+
+
+async def serve(port):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with httpx.AsyncClient(timeout=FORWARD_TIMEOUT, limits=httpx.Limits(max_connections=None)) as client:
+        server = await workers.serve_http(make_handler(client), "0.0.0.0", port)
+        logger.info("🚦 Ingress on :%s routing to %s workers: %s", port, len(workers.WORKERS),
+                    ", ".join(workers.ring.nodes))
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+def main():
+    setup_logging()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=INGRESS_PORT)
+    parser.add_argument("--set-webhook", metavar="URL", help="register URL (this ingress) with Telegram first")
+    args = parser.parse_args()
+
+    if not workers.WORKERS:
+        raise SystemExit("WORKERS is not set (name=url,name=url,...)")
+    if args.set_webhook:
+        asyncio.run(set_webhook(args.set_webhook))
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        logger.info("📈 Metrics served on :%s/metrics", METRICS_PORT)
+    asyncio.run(serve(args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Inline-mode discovery of open essays (``@bot climate`` in any chat).
+
+Telegram sends an inline query on nearly every keystroke, from every user
+typing, so answers come from a small in-process cache of search results keyed
+by the normalized query.  Search words are ANDed and the last one matches as
+a prefix, so the results for a query are always a subset of the results for
+any prefix of it: when "clim" was fetched in full, "climat" and "climate ch"
+are answered by filtering those rows in memory instead of asking Postgres.
+Entries live ``INLINE_CACHE_TTL`` seconds and are evicted early when any
+bot process opens, joins or expires an essay (``on_essay_change``); the
+join itself is checked against the database in any case.
+
+    INLINE_CACHE_TTL    seconds a result set is reused (default 30)
+    INLINE_CACHE_SIZE   result sets kept, least recently used dropped (default 1000)
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
+
+from database import search_open_essays, search_terms
+from metrics import INLINE_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = float(os.getenv("INLINE_CACHE_TTL", "30"))
+CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "1000"))
+CACHE_ROWS = 100  # rows fetched per query; fewer means the result set is complete
+PAGE_SIZE = 20    # results per inline answer (Telegram allows up to 50)
+JOIN_LINK_PREFIX = "join_"
+
+
+def _matches(essay, terms):
+    """In-memory equivalent of the search_vector @@ tsquery test"""
+    words = set(search_terms(f"{essay['topic']} {essay.get('first_content') or ''}", max_terms=None))
+    *whole, prefix = terms
+    return all(term in words for term in whole) and any(word.startswith(prefix) for word in words)
+
+
+class SearchCache:
+    """TTL + LRU cache of search_open_essays result sets, answering longer queries from complete shorter ones"""
+
+    def __init__(self, ttl=CACHE_TTL, size=CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries = OrderedDict()  # key -> (expires_at, rows, complete)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, rows, complete, now):
+        self._entries[key] = (now + self.ttl, rows, complete)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def search(self, text):
+        """(rows, complete) for text: up to CACHE_ROWS ranked open essays"""
+        terms = search_terms(text)
+        if not terms:
+            return [], True
+        key = " ".join(terms)
+        now = time.monotonic()
+
+        entry = self._get(key, now)
+        if entry is not None:
+            INLINE_CACHE_LOOKUPS.labels("hit").inc()
+            return entry[1], entry[2]
+
+        # Every prefix of the key matches a superset of essays
+        for end in range(len(key) - 1, 0, -1):
+            entry = self._get(key[:end].rstrip(), now)
+            if entry is not None and entry[2]:
+                INLINE_CACHE_LOOKUPS.labels("prefix").inc()
+                rows = [essay for essay in entry[1] if _matches(essay, terms)]
+                self._put(key, rows, True, now)
+                return rows, True
+
+        INLINE_CACHE_LOOKUPS.labels("miss").inc()
+        rows = search_open_essays(key, limit=CACHE_ROWS + 1)
+        complete = len(rows) <= CACHE_ROWS
+        rows = rows[:CACHE_ROWS]
+        self._put(key, rows, complete, now)
+        return rows, complete
+
+    def evict_essay(self, essay_id):
+        """Drop the result sets that contain essay_id"""
+        stale = [key for key, (_, rows, _) in self._entries.items() if any(essay['id'] == essay_id for essay in rows)]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+
+search_cache = SearchCache()
+
+
+def on_essay_change(event):
+    """Change subscriber (see invalidation.py): drop result sets the change makes stale"""
+    op = event["op"]
+    if op == "reset" or (op == "update" and event.get("status") == "waiting_partner"):
+        # A newly opened essay can match any cached query
+        search_cache.clear()
+    elif op == "join" or (op == "update" and event.get("status")):
+        search_cache.evict_essay(event["id"])
+
+
+def _result(essay, bot_username):
+    opening = essay.get('first_content') or ''
+    creator_info = "🔐 Anonymous" if essay.get('is_anonymous') else f"by {essay['creator_name']}"
+    link = f"https://t.me/{bot_username}?start={JOIN_LINK_PREFIX}{essay['join_code']}"
+    return InlineQueryResultArticle(
+        id=str(essay['id']),
+        title=f"📝 {essay['topic'][:60]}",
+        description=f"{creator_info} · {opening[:80]}",
+        input_message_content=InputTextMessageContent(
+            f"📝 Looking for a writing partner!\n\n"
+            f"Topic: {essay['topic']}\n"
+            f"Opening: {opening}\n\n"
+            f"Join code: {essay['join_code']}"
+        ),
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("✍️ Join this essay", url=link)],
+        ]),
+    )
+
+
+async def inline_query(update, context):
+    """Answer an inline query with a page of matching open essays"""
+    query = update.inline_query
+    user_id = update.effective_user.id
+    offset = int(query.offset) if query.offset.isdigit() else 0
+
+    rows, complete = search_cache.search(query.query)
+    if offset + PAGE_SIZE > len(rows) and not complete:
+        # Past the cached rows of a very broad query: page straight from the database
+        rows = search_open_essays(query.query, limit=PAGE_SIZE + 1, offset=offset)
+        page, has_next = rows[:PAGE_SIZE], len(rows) > PAGE_SIZE
+    else:
+        page, has_next = rows[offset:offset + PAGE_SIZE], offset + PAGE_SIZE < len(rows)
+    # Cached rows are shared by everyone, so the user's own essays are dropped per answer
+    page = [essay for essay in page if essay['creator_id'] != user_id]
+
+    await query.answer(
+        [_result(essay, context.bot.username) for essay in page],
+        cache_time=int(CACHE_TTL),
+        is_personal=True,
+        next_offset=str(offset + PAGE_SIZE) if has_next else "",
+    )
@@ -0,0 +1,129 @@
+"""
+Cross-process cache invalidation over Postgres LISTEN/NOTIFY.
+
+database.py writes (create_essay, update_essay, start_turn, add_partner,
+claim_essay, expiry, user sessions) queue a NOTIFY on the ``essay_changes``
+channel in their own transaction, so every bot process connected to the
+database hears about a change exactly when it commits.  Each process runs
+``listen_for_changes`` on its event loop: one extra connection waiting on
+LISTEN, with no polling.  Subscribers get the decoded event:
+
+    {"op": "create|update|turn|join|session", "id": essay_id,
+     "origin": "host:pid", "local": bool, ...}
+
+``local`` is True for changes made by this process, which usually updated
+its own caches already.  After the listener (re)connects, notifications may
+have been missed, so subscribers get ``{"op": "reset"}`` and should drop
+everything they cache.  NOTIFY_CHANGES=0 turns the notifications off.
+The listener checks a quiet connection from a worker thread, and TCP
+keepalives make a half-open connection fail instead of hanging.
+With sharded storage (shards.py) there is one listener per essay database.
+"""
+import asyncio
+import json
+import logging
+
+import psycopg2
+
+from database import get_shard_connection, process_origin, NOTIFY_CHANNEL
+from shards import all_databases
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 60
+MAX_RECONNECT_DELAY = 60
+# TCP keepalives for the LISTEN connection, so a half-open connection fails within ~a minute
+LISTEN_CONNECTION_OPTIONS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+    "tcp_user_timeout": 60000,
+}
+
+_subscribers = []
+
+
+def subscribe(callback):
+    """Call callback(event) for every change notification"""
+    _subscribers.append(callback)
+    return callback
+
+
+def dispatch(event):
+    for callback in _subscribers:
+        try:
+            callback(event)
+        except Exception:
+            logger.exception("❌ Change subscriber %s failed on %s", getattr(callback, "__name__", callback), event)
+
+
+def _dispatch_payload(payload, origin):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        logger.warning("⚠️ Ignoring malformed change notification: %r", payload[:200])
+        return
+    event["local"] = event.get("origin") == origin
+    dispatch(event)
+
+
+def _ping(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT 1")
+    cur.close()
+
+
+async def _listen(conn, origin):
+    """Dispatch notifications from conn until it fails"""
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    loop.add_reader(conn.fileno(), ready.set)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Quiet channel: make sure the connection is still alive, off the event loop
+                await asyncio.to_thread(_ping, conn)
+            ready.clear()
+            conn.poll()
+            while conn.notifies:
+                _dispatch_payload(conn.notifies.pop(0).payload, origin)
+    finally:
+        loop.remove_reader(conn.fileno())
+
+
+async def listen_for_changes():
+    """Long-running task: LISTEN for changes on every essay database and dispatch them"""
+    await asyncio.gather(*(_listen_to_database(db) for db in all_databases()))
+
+
+async def _listen_to_database(db):
+    """LISTEN on one database, reconnecting with backoff"""
+    origin = process_origin()
+    delay = 1
+    connected_before = False
+    while True:
+        conn = None
+        try:
+            conn = get_shard_connection(db, **LISTEN_CONNECTION_OPTIONS)
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            cur.close()
+            logger.info("📡 Listening for changes on %s (database %s)", NOTIFY_CHANNEL, db)
+            if connected_before:
+                dispatch({"op": "reset", "local": True})
+            connected_before = True
+            delay = 1
+            await _listen(conn, origin)
+        except asyncio.CancelledError:
+            raise
+        except (psycopg2.Error, OSError) as e:
+            logger.warning("⚠️ Change listener disconnected (%s), retrying in %s s", e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        finally:
+            if conn is not None:
+                conn.close()
@@ -0,0 +1,305 @@
+"""
+One-shot import of a legacy essays.json store (bot_old.py) into Postgres.
+
+bot_old.py kept every essay in one JSON object keyed by its string id
+(``essay_<user id>_<timestamp>``).  The file is parsed incrementally, one
+essay at a time, so even very large stores are read in constant memory, and
+essays are inserted in batches with execute_values.
+
+Imported essays get ids and join codes derived from the legacy id, so running
+the import again skips what is already there instead of duplicating it.  The
+ids use ids.LEGACY_NODE, which ids.py refuses to give a live bot, and a hash
+of the legacy id as sequence.  Essays from before ids.ID_EPOCH_MS (most of
+them - bot_old.py predates it) or without a usable date are spread by that
+hash over the first LEGACY_SPREAD_MS of the epoch.  Derived ids or join codes
+can still collide, rarely: an essay whose id or join code is already taken by
+another essay is reported as a conflict and left out, never imported over
+it.  Partners come from the ``partners`` list or, for the oldest files, the
+single ``partner_id``/``partner_name`` pair that pdf_generator still falls
+back to.
+
+Usage:
+    python legacy_import.py essays.json [--batch-size 500] [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from database import get_connection
+from ids import compose_id, ID_EPOCH_MS, LEGACY_NODE, SEQUENCE_BITS, MAX_SEQUENCE, BASE62_ALPHABET, JOIN_CODE_LENGTH
+from logging_setup import setup_logging
+from partitions import ensure_partitions_since
+from shards import SHARDED
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# Undated and pre-epoch essays share January 2024 (and its partition): 28 days x 4096 sequences
+LEGACY_SPREAD_MS = 28 * 24 * 3600 * 1000
+CHUNK_SIZE = 1 << 16
+STATUSES = ('waiting_first', 'waiting_partner', 'in_progress', 'complete')
+
+_LEGACY_ID = re.compile(r"^essay_\d+_(\d+(?:\.\d+)?)$")
+
+
+def iter_legacy_essays(f, chunk_size=CHUNK_SIZE):
+    """Yield (legacy id, essay dict) from a file holding one JSON object, without loading it whole"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip(*separators):
+        # Skip whitespace and at most one of separators; returns the separator found, "" if none
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos < len(buffer) and buffer[pos] in separators:
+            pos += 1
+            return buffer[pos - 1]
+        return ""
+
+    def value():
+        nonlocal pos
+        while True:
+            try:
+                result, pos = decoder.raw_decode(buffer, pos)
+                return result
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+
+    fill()
+    if skip("{") != "{":
+        raise ValueError("expected a JSON object of essays")
+    if skip("}") == "}":
+        return
+    while True:
+        skip()
+        key = value()
+        if skip(":") != ":":
+            raise ValueError(f"expected ':' after {key!r}")
+        skip()
+        yield key, value()
+        separator = skip(",", "}")
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"expected ',' or '}}' after {key!r}")
+
+
+def _user_id(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _created_ms(legacy_id, essay):
+    created_at = essay.get('created_at')
+    if created_at:
+        try:
+            created = datetime.fromisoformat(created_at)
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            return int(created.timestamp() * 1000)
+        except ValueError:
+            pass
+    match = _LEGACY_ID.match(legacy_id)
+    if match:
+        return int(float(match.group(1)) * 1000)
+    return None
+
+
+def legacy_essay_id(legacy_id, created_ms):
+    """Stable essay id for a legacy essay: its creation time, LEGACY_NODE and a hash of the legacy id"""
+    digest = int.from_bytes(hashlib.sha256(legacy_id.encode()).digest()[8:16], "big")
+    if created_ms is None or created_ms < ID_EPOCH_MS:
+        # Too old for the id's clock: the hash picks the millisecond as well as the sequence
+        created_ms = ID_EPOCH_MS + (digest >> SEQUENCE_BITS) % LEGACY_SPREAD_MS
+    return compose_id(created_ms, LEGACY_NODE, digest & MAX_SEQUENCE)
+
+
+def legacy_join_code(legacy_id):
+    digest = int.from_bytes(hashlib.sha256(legacy_id.encode()).digest()[:8], "big")
+    code = []
+    for _ in range(JOIN_CODE_LENGTH):
+        digest, index = divmod(digest, len(BASE62_ALPHABET))
+        code.append(BASE62_ALPHABET[index])
+    return "".join(code)
+
+
+def map_essay(legacy_id, essay):
+    """(essay row, partner rows) in the current schema, or None if the essay can't be imported"""
+    creator_id = _user_id(essay.get('creator_id'))
+    if creator_id is None or not essay.get('topic'):
+        return None
+    created_ms = _created_ms(legacy_id, essay)
+    essay_id = legacy_essay_id(legacy_id, created_ms)
+    if created_ms is None:
+        created_ms = ID_EPOCH_MS
+    last_writer_id = _user_id(essay.get('last_writer_id'))
+
+    partners = []
+    for partner in essay.get('partners') or []:
+        partner_id = _user_id(partner.get('id'))
+        if partner_id is not None:
+            partners.append((essay_id, partner_id, partner.get('name') or 'Unknown',
+                             bool(partner.get('is_anonymous'))))
+    if not partners and essay.get('partner_name'):
+        # Oldest format: a single partner_name (and maybe partner_id) on the essay itself
+        partner_id = _user_id(essay.get('partner_id'))
+        if partner_id is None and last_writer_id not in (None, creator_id):
+            partner_id = last_writer_id
+        if partner_id is not None:
+            partners.append((essay_id, partner_id, essay['partner_name'], False))
+    # One partner per essay, as the bot enforces
+    partners = partners[:1]
+
+    status = essay.get('status')
+    if status not in STATUSES:
+        status = 'complete' if essay.get('second_content') else 'waiting_partner'
+    row = (
+        essay_id, legacy_join_code(legacy_id), creator_id, essay.get('creator_name') or 'Unknown',
+        essay['topic'], essay.get('first_content') or None, essay.get('second_content') or None, status,
+        datetime.fromtimestamp(created_ms / 1000, timezone.utc).replace(tzinfo=None),
+        last_writer_id, Json(essay.get('finish_requests') or {}), bool(essay.get('is_anonymous')),
+    )
+    return row, partners
+
+
+def load_batch(conn, batch):
+    """Insert one batch of (legacy id, essay row, partner rows); returns (new essays, conflicting legacy ids)"""
+    cur = conn.cursor()
+    try:
+        # An id or join code owned by another essay means two legacy ids hashed alike - don't import over it
+        cur.execute("SELECT id, join_code FROM essays WHERE id = ANY(%s)", ([row[0] for _, row, _ in batch],))
+        codes_by_id = dict(cur.fetchall())
+        cur.execute("SELECT join_code, essay_id FROM join_codes WHERE join_code = ANY(%s)",
+                    ([row[1] for _, row, _ in batch],))
+        ids_by_code = dict(cur.fetchall())
+        essays, partners, conflicts = [], [], []
+        for legacy_id, row, essay_partners in batch:
+            essay_id, join_code = row[0], row[1]
+            if codes_by_id.setdefault(essay_id, join_code) != join_code \
+                    or ids_by_code.setdefault(join_code, essay_id) != essay_id:
+                conflicts.append(legacy_id)
+                continue
+            essays.append(row)
+            partners.extend(essay_partners)
+        if not essays:
+            conn.commit()
+            return 0, conflicts
+
+        execute_values(cur, """
+            INSERT INTO join_codes (join_code, essay_id) VALUES %s
+            ON CONFLICT (join_code) DO NOTHING
+        """, [(row[1], row[0]) for row in essays])
+        inserted = execute_values(cur, """
+            INSERT INTO essays (id, join_code, creator_id, creator_name, topic, first_content, second_content,
+                                status, created_at, last_writer_id, finish_requests, is_anonymous)
+            VALUES %s
+            ON CONFLICT (id) DO NOTHING
+            RETURNING id
+        """, essays, page_size=len(essays), fetch=True)
+        if partners:
+            execute_values(cur, """
+                INSERT INTO partners (essay_id, partner_id, partner_name, is_anonymous) VALUES %s
+                ON CONFLICT (essay_id, partner_id) DO NOTHING
+            """, partners, page_size=len(partners))
+        conn.commit()
+        return len(inserted), conflicts
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error("❌ Importing a batch of %s essays failed: %s", len(batch), e)
+        raise
+    finally:
+        cur.close()
+
+
+def import_file(path, batch_size=BATCH_SIZE, dry_run=False):
+    """Import a legacy essays.json; returns (read, imported, skipped, conflicts) counts"""
+    size = os.path.getsize(path)
+    read = imported = skipped = conflicts = 0
+    oldest_ensured = None
+    batch = []
+    started = time.perf_counter()
+    conn = None if dry_run else get_connection()
+
+    def flush():
+        nonlocal imported, conflicts, oldest_ensured
+        if conn and batch:
+            # Old essays need their monthly partitions, not the DEFAULT one
+            oldest = max(min(row[8] for _, row, _ in batch).replace(tzinfo=timezone.utc).timestamp() * 1000,
+                         ID_EPOCH_MS)
+            if oldest_ensured is None or oldest < oldest_ensured:
+                ensure_partitions_since(oldest)
+                oldest_ensured = oldest
+            new, conflicting = load_batch(conn, batch)
+            imported += new
+            conflicts += len(conflicting)
+            for legacy_id in conflicting:
+                logger.error("❌ Legacy essay %s not imported: its id or join code belongs to another essay",
+                             legacy_id)
+        batch.clear()
+        logger.info("📥 %s essays read (%.0f%%), %s imported, %s skipped, %s conflicts, %.0f essays/s",
+                    read, f.tell() * 100 / size if size else 100, imported, skipped, conflicts,
+                    read / (time.perf_counter() - started))
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            for legacy_id, essay in iter_legacy_essays(f):
+                read += 1
+                mapped = map_essay(legacy_id, essay) if isinstance(essay, dict) else None
+                if mapped is None:
+                    skipped += 1
+                    logger.warning("⚠️ Skipping legacy essay %s: no creator or topic", legacy_id)
+                    continue
+                batch.append((legacy_id, *mapped))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+    finally:
+        if conn:
+            conn.close()
+    return read, imported, skipped, conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="the legacy essays.json")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="parse and map only, don't write")
+    args = parser.parse_args()
+    if SHARDED and not args.dry_run:
+        # Legacy ids use the LEGACY_NODE bits, which would name a shard unrelated to the creator
+        parser.error("sharded storage (SHARD_DATABASE_URLS) is not supported - import before sharding")
+
+    setup_logging()
+    read, imported, skipped, conflicts = import_file(args.path, args.batch_size, args.dry_run)
+    logger.info("✅ %s legacy essays read: %s imported, %s already present, %s skipped, %s conflicts",
+                read, imported, read - imported - skipped - conflicts if not args.dry_run else 0, skipped, conflicts)
+    if conflicts:
+        raise SystemExit(f"{conflicts} legacy essays collided with other essays and were not imported")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Local stand-in for the Telegram Bot API used by the load test.
+
+Serves the methods bot.py needs (getMe, getUpdates, sendMessage,
+editMessageText, answerCallbackQuery, sendDocument, ...) over plain HTTP at
+``http://<host>:<port>/bot<token>/<method>``.  Updates injected with
+``push_update`` are handed out through getUpdates long polling, or POSTed to
+``webhook_url`` (the ingress) the way Telegram delivers webhooks, and every
+message the bot sends or edits is passed to the ``on_bot_message`` callback.
+"""
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 999000, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+WEBHOOK_CONNECTIONS = 40  # Telegram's default max_connections
+WEBHOOK_RETRIES = 5
+
+
+class FakeBotAPI:
+    """In-memory Bot API state shared by the HTTP handler threads"""
+
+    def __init__(self, on_bot_message=None, webhook_url=None):
+        self.on_bot_message = on_bot_message
+        self.webhook_url = webhook_url
+        self._webhook_pool = ThreadPoolExecutor(WEBHOOK_CONNECTIONS) if webhook_url else None
+        self.webhook_failures = 0
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._cond = threading.Condition()
+        self.calls = {}
+        self.document_bytes = 0
+        self._server = None
+
+    # Update side (simulated users -> bot)
+
+    def push_update(self, update):
+        """Queue an update for the bot's next getUpdates call (or its webhook) and return its update_id"""
+        with self._cond:
+            update["update_id"] = self._next_update_id
+            self._next_update_id += 1
+            if self.webhook_url is None:
+                self._updates.append(update)
+                self._cond.notify_all()
+                return update["update_id"]
+        self._webhook_pool.submit(self._deliver, update)
+        return update["update_id"]
+
+    def _deliver(self, update):
+        """POST update to the webhook, retrying like Telegram does when it is not accepted"""
+        request = urllib.request.Request(
+            self.webhook_url, data=json.dumps(update).encode(), headers={"Content-Type": "application/json"},
+        )
+        for attempt in range(WEBHOOK_RETRIES):
+            try:
+                urllib.request.urlopen(request, timeout=30).read()
+                return
+            except OSError:
+                time.sleep(0.5 * (attempt + 1))
+        self.webhook_failures += 1
+
+    def new_message_id(self):
+        with self._cond:
+            self._next_message_id += 1
+            return self._next_message_id
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # Updates below the offset are confirmed by the bot
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return list(self._updates[:100])
+
+    # Bot side (bot -> simulated users)
+
+    def _message(self, params, text_key="text"):
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"]) if "message_id" in params else self.new_message_id()
+        markup = params.get("reply_markup")
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get(text_key, ""),
+        }
+        if markup:
+            message["reply_markup"] = json.loads(markup) if isinstance(markup, str) else markup
+        if self.on_bot_message:
+            self.on_bot_message(chat_id, message)
+        return message
+
+    def call(self, method, params):
+        """Execute a Bot API method and return its result"""
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        if method == "sendDocument":
+            return self._message(params, text_key="caption")
+        # answerCallbackQuery, deleteWebhook, setMyCommands, ...
+        return True
+
+    # HTTP server
+
+    def serve(self, host="127.0.0.1", port=0):
+        """Start serving in a background thread and return the base_url for the bot"""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                content_type = self.headers.get("Content-Type", "")
+                method = self.path.rsplit("/", 1)[-1]
+                if content_type.startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                elif content_type.startswith("multipart/form-data"):
+                    params = _parse_multipart(body, content_type)
+                    api.document_bytes += len(body)
+                else:
+                    params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                payload = json.dumps({"ok": True, "result": api.call(method, params)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}/bot"
+
+    def shutdown(self):
+        if self._server:
+            self._server.shutdown()
+        if self._webhook_pool:
+            self._webhook_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_multipart(body, content_type):
+    """Extract the plain form fields of a multipart body (file parts are skipped)"""
+    boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+    params = {}
+    for part in body.split(b"--" + boundary):
+        head, _, value = part.partition(b"\r\n\r\n")
+        if b"filename=" in head or b'name="' not in head:
+            continue
+        name = head.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+        params[name] = value.rstrip(b"\r\n").decode(errors="replace")
+    return params
@@ -0,0 +1,379 @@
+"""
+Load test: N synthetic user pairs running the real flows against bot.py.
+
+Starts the fake Bot API (fake_bot_api.py), runs ``bot.py`` as a subprocess
+pointed at it and at a local Postgres, then drives every pair through
+create -> browse or /join -> alternating turns -> finish -> accept.
+Reports throughput, p50/p99 latency per handler and the DB connections used.
+
+With ``--workers N`` the bot runs sharded (see workers.py): N bot.py workers
+behind ingress.py, with the fake API delivering updates as webhooks.  Running
+the same load with --workers 1, 2, 4 shows how throughput scales.
+
+Usage:
+    python loadtest/run.py --pairs 50 --turns 4 --dsn postgresql://localhost/essay_bot_loadtest
+    python loadtest/run.py --pairs 200 --workers 4 --reset
+
+Never point --dsn at a production database: --reset truncates all tables.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import callbacks as cb  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+FAKE_TOKEN = "123456:LOADTEST"
+JOIN_CODE_RE = re.compile(r"/join (\w+)")
+
+
+class StepTimeout(Exception):
+    pass
+
+
+class Harness:
+    """Routes bot messages to simulated users and collects latencies"""
+
+    def __init__(self, loop, step_timeout, webhook_url=None):
+        self.loop = loop
+        self.step_timeout = step_timeout
+        self.api = FakeBotAPI(on_bot_message=self._on_bot_message, webhook_url=webhook_url)
+        self.inboxes = {}
+        self.latencies = {}
+        self.updates_sent = 0
+        self.failures = {}
+
+    def _on_bot_message(self, chat_id, message):
+        inbox = self.inboxes.get(chat_id)
+        if inbox is not None:
+            self.loop.call_soon_threadsafe(inbox.put_nowait, message)
+
+    def record(self, step, seconds):
+        self.latencies.setdefault(step, []).append(seconds)
+
+    def fail(self, step):
+        self.failures[step] = self.failures.get(step, 0) + 1
+
+
+class SimUser:
+    """A synthetic Telegram user talking to the bot through the fake API"""
+
+    def __init__(self, harness, user_id, name):
+        self.harness = harness
+        self.user = {"id": user_id, "is_bot": False, "first_name": name, "username": name}
+        self.chat = {"id": user_id, "type": "private"}
+        self.inbox = asyncio.Queue()
+        self.last_message = None
+        harness.inboxes[user_id] = self.inbox
+
+    async def expect(self, predicate, step, started, record=True):
+        """Wait for a bot message matching predicate and record the latency of step"""
+        deadline = started + self.harness.step_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.harness.fail(step)
+                raise StepTimeout(f"{self.user['username']}: no reply for {step}")
+            try:
+                message = await asyncio.wait_for(self.inbox.get(), remaining)
+            except asyncio.TimeoutError:
+                continue
+            if predicate(message):
+                if record:
+                    self.harness.record(step, time.monotonic() - started)
+                self.last_message = message
+                return message
+
+    def _push(self, update):
+        self.harness.updates_sent += 1
+        self.harness.api.push_update(update)
+        return time.monotonic()
+
+    async def send(self, text, step, predicate=lambda m: True):
+        message = {
+            "message_id": self.harness.api.new_message_id(),
+            "date": int(time.time()),
+            "chat": self.chat,
+            "from": self.user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        started = self._push({"message": message})
+        return await self.expect(predicate, step, started)
+
+    async def press(self, data, step, predicate=lambda m: True, message=None):
+        message = message or self.last_message
+        query = {
+            "id": str(self.harness.api.new_message_id()),
+            "from": self.user,
+            "chat_instance": "loadtest",
+            "data": data,
+            "message": {k: message[k] for k in ("message_id", "date", "chat", "text")},
+        }
+        started = self._push({"callback_query": query})
+        return await self.expect(predicate, step, started)
+
+
+def button(message, action, label_prefix=None):
+    """Return the callback_data of the first button in message with the given action"""
+    for row in (message.get("reply_markup") or {}).get("inline_keyboard", []):
+        for btn in row:
+            parsed = cb.decode(btn.get("callback_data"))
+            if parsed and parsed[0] == action and (label_prefix is None or btn["text"].startswith(label_prefix)):
+                return btn["callback_data"]
+    return None
+
+
+def has_button(action, label_prefix=None):
+    return lambda message: button(message, action, label_prefix) is not None
+
+
+def text_contains(fragment):
+    return lambda message: fragment in message.get("text", "")
+
+
+async def run_pair(index, creator, partner, turns, use_browse):
+    topic = f"Load test topic {index} {random.randrange(10**6)}"
+
+    # Creator: menu -> create -> public -> topic -> opening
+    menu = await creator.send("/start", "start", has_button(cb.CREATE))
+    await creator.press(button(menu, cb.CREATE), "create_essay", has_button(cb.ANON), message=menu)
+    await creator.press(cb.encode(cb.ANON, False), "choose_anonymity", text_contains("topic"))
+    await creator.send(topic, "handle_first_write", text_contains("opening paragraph"))
+    created = await creator.send("An opening line about the topic.", "handle_first_write", text_contains("Join Code"))
+    join_code = JOIN_CODE_RE.search(created["text"]).group(1)
+
+    # Partner: browse and press the Join button, or use the join code
+    if use_browse:
+        menu = await partner.send("/start", "start", has_button(cb.BROWSE))
+        label = f"Join: {topic[:30]}"
+        listing = await partner.press(button(menu, cb.BROWSE), "browse_essays", has_button(cb.JOIN, label), message=menu)
+        await partner.press(button(listing, cb.JOIN, label), "join_essay_callback", has_button(cb.JOIN_ANON))
+        await partner.press(cb.encode(cb.JOIN_ANON, False), "choose_join_anonymity", text_contains("Current Essay"))
+    else:
+        await partner.send(f"/join {join_code}", "join_essay", text_contains("Current Essay"))
+    await creator.expect(text_contains("PARTNER JOINED"), "partner_joined_notice", time.monotonic(), record=False)
+
+    # Alternating turns, partner first
+    writer, other = partner, creator
+    confirmed = None
+    for turn in range(turns):
+        if turn > 0:
+            your_turn = await writer.expect(has_button(cb.CONTINUE), "turn_notice", time.monotonic(), record=False)
+            await writer.press(button(your_turn, cb.CONTINUE), "continue_writing", text_contains("Current Essay"), message=your_turn)
+        preview = await writer.send(f"Turn {turn} adds a few more words.", "handle_development", has_button(cb.CONFIRM))
+        confirmed = await writer.press(button(preview, cb.CONFIRM), "confirm_write", has_button(cb.FINISH), message=preview)
+        writer, other = other, writer
+
+    # The last writer requests to finish, the other accepts and both get the PDF
+    finisher, accepter = other, writer
+    await finisher.press(button(confirmed, cb.FINISH), "finish_request", text_contains("Finish Request Sent"), message=confirmed)
+    request = await accepter.expect(has_button(cb.ACCEPT), "finish_notice", time.monotonic(), record=False)
+    await accepter.press(button(request, cb.ACCEPT), "accept_finish", text_contains("Your essay PDF"), message=request)
+
+
+async def sample_connections(dsn, stop, samples):
+    """Poll pg_stat_activity for the number of connections to the test database"""
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        while not stop.is_set():
+            cur.execute("""
+                SELECT count(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND pid <> pg_backend_pid()
+            """)
+            samples.append(cur.fetchone()[0])
+            try:
+                await asyncio.wait_for(stop.wait(), 0.25)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        cur.close()
+        conn.close()
+
+
+def reset_database(dsn):
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('essays') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute("TRUNCATE essays, partners, join_codes, user_session, bot_persistence, match_queue CASCADE")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def scrape_metric(ports, name):
+    """Sum all samples of a metric from the /metrics endpoint of every bot process"""
+    total = 0.0
+    for port in ports:
+        try:
+            body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+        except OSError:
+            return None
+        for line in body.splitlines():
+            if line.startswith(name) and not line.startswith("#"):
+                total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+def is_healthy(port):
+    try:
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1).read()
+        return True
+    except OSError:
+        return False
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def start_bot(base_url, dsn, metrics_port, log_path, script="bot.py", args=(), **extra_env):
+    env = dict(os.environ)
+    env.update({
+        "ENV_FILE": os.devnull,  # never pick up the production .env
+        "TELEGRAM_BOT_TOKEN": FAKE_TOKEN,
+        "TELEGRAM_TOKEN": FAKE_TOKEN,
+        "TELEGRAM_API_BASE_URL": base_url,
+        "DATABASE_URL": dsn,
+        "METRICS_PORT": str(metrics_port),
+    }, **extra_env)
+    log = open(log_path, "w")
+    return subprocess.Popen([sys.executable, script, *args], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def start_workers(base_url, dsn, count, metrics_port, worker_port, ingress_port, log_path):
+    """Start count bot.py workers and the ingress in front of them; returns (processes, metrics ports)"""
+    names = [f"w{i}" for i in range(count)]
+    workers_env = ",".join(f"{name}=http://127.0.0.1:{worker_port + i}/" for i, name in enumerate(names))
+    stem, ext = os.path.splitext(log_path)
+    processes = {
+        name: start_bot(base_url, dsn, metrics_port + i, f"{stem}.{name}{ext}", WORKERS=workers_env,
+                        WORKER_NAME=name, WORKER_PORT=str(worker_port + i))
+        for i, name in enumerate(names)
+    }
+    processes["ingress"] = start_bot(base_url, dsn, metrics_port + count, f"{stem}.ingress{ext}", script="ingress.py",
+                                     args=("--port", str(ingress_port)), WORKERS=workers_env)
+    return processes, [metrics_port + i for i in range(count)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--browse-ratio", type=float, default=0.5, help="share of partners that join via browse")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which pairs are started")
+    parser.add_argument("--step-timeout", type=float, default=30.0)
+    parser.add_argument("--dsn", default=os.getenv("LOADTEST_DSN", "postgresql://localhost/essay_bot_loadtest"))
+    parser.add_argument("--metrics-port", type=int, default=8001)
+    parser.add_argument("--reset", action="store_true", help="truncate the test database first")
+    parser.add_argument("--bot-log", default="loadtest_bot.log")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run N sharded workers behind the webhook ingress instead of one polling bot")
+    parser.add_argument("--worker-port", type=int, default=8450, help="first worker port (--workers)")
+    parser.add_argument("--ingress-port", type=int, default=8440)
+    parser.add_argument("--external-bot", action="store_true",
+                        help="don't spawn bot.py; print the base URL and wait for a bot started by hand")
+    args = parser.parse_args()
+
+    if args.reset:
+        reset_database(args.dsn)
+
+    webhook_url = f"http://127.0.0.1:{args.ingress_port}/" if args.workers else None
+    harness = Harness(asyncio.get_running_loop(), args.step_timeout, webhook_url)
+    base_url = harness.api.serve()
+
+    processes = {}
+    metrics_ports = [args.metrics_port]
+    if args.external_bot:
+        print(f"Start the bot with TELEGRAM_API_BASE_URL={base_url} TELEGRAM_BOT_TOKEN={FAKE_TOKEN}")
+    elif args.workers:
+        processes, metrics_ports = start_workers(base_url, args.dsn, args.workers, args.metrics_port,
+                                                 args.worker_port, args.ingress_port, args.bot_log)
+    else:
+        processes = {"bot": start_bot(base_url, args.dsn, args.metrics_port, args.bot_log)}
+
+    def ready():
+        if not args.workers:
+            return harness.api.calls.get("getUpdates")
+        ports = [args.ingress_port] + [args.worker_port + i for i in range(args.workers)]
+        return all(is_healthy(port) for port in ports)
+
+    try:
+        # Wait for the bot to start polling, or every worker and the ingress to accept updates
+        while not ready():
+            for name, process in processes.items():
+                if process.poll() is not None:
+                    sys.exit(f"{name} exited with {process.returncode}, see the logs next to {args.bot_log}")
+            await asyncio.sleep(0.2)
+        opened_before = scrape_metric(metrics_ports, "essaybot_db_connections_opened_total")
+
+        stop = asyncio.Event()
+        samples = []
+        sampler = asyncio.create_task(sample_connections(args.dsn, stop, samples))
+
+        base_id = random.randrange(10**9, 2 * 10**9)
+
+        async def delayed_pair(i):
+            await asyncio.sleep(args.ramp * i / max(args.pairs, 1))
+            creator = SimUser(harness, base_id + 2 * i, f"creator{i}")
+            partner = SimUser(harness, base_id + 2 * i + 1, f"partner{i}")
+            await run_pair(i, creator, partner, args.turns, random.random() < args.browse_ratio)
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(delayed_pair(i) for i in range(args.pairs)), return_exceptions=True)
+        elapsed = time.monotonic() - started
+        stop.set()
+        await sampler
+        opened_after = scrape_metric(metrics_ports, "essaybot_db_connections_opened_total")
+    finally:
+        for process in processes.values():
+            process.send_signal(signal.SIGINT)
+        for process in processes.values():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        harness.api.shutdown()
+
+    completed = sum(1 for r in results if r is None)
+    errors = [r for r in results if isinstance(r, Exception)]
+
+    print(f"\nPairs: {completed}/{args.pairs} completed in {elapsed:.1f}s"
+          + (f" on {args.workers} workers" if args.workers else ""))
+    print(f"Updates: {harness.updates_sent} sent, {harness.updates_sent / elapsed:.1f} updates/s")
+    print(f"Bot API calls: {dict(sorted(harness.api.calls.items()))}")
+    if harness.api.webhook_failures:
+        print(f"Webhook deliveries given up: {harness.api.webhook_failures}")
+    print(f"\n{'step':<24} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'fail':>5}")
+    for step, values in sorted(harness.latencies.items()):
+        print(f"{step:<24} {len(values):>6} {percentile(values, 0.5) * 1000:>8.1f} "
+              f"{percentile(values, 0.99) * 1000:>8.1f} {max(values) * 1000:>8.1f} "
+              f"{harness.failures.get(step, 0):>5}")
+    if samples:
+        print(f"\nDB connections: peak {max(samples)}, mean {statistics.mean(samples):.1f}")
+    if opened_before is not None and opened_after is not None:
+        print(f"DB connections opened by the bot: {opened_after - opened_before:.0f}")
+    for error in errors[:5]:
+        print(f"❌ {type(error).__name__}: {error}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Structured, non-blocking logging.
+
+Log calls build the record and enqueue it: a QueueHandler hands it to a
+QueueListener thread that renders JSON and writes to stderr, so stream I/O
+stays off the event loop.  The caller still pays for the LogRecord itself,
+for merging arguments that could change later and for exception tracebacks;
+merging immutable arguments and all formatting happen in the listener, which
+competes with the caller for the GIL.  Messages use %-style arguments so
+nothing is formatted for records that are filtered out.
+
+Environment:
+    LOG_FORMAT   json (default) or text
+    LOG_LEVEL    root level, default INFO
+    LOG_LEVELS   per-module levels, e.g. "database=WARNING,pdf_generator=WARNING"
+    LOG_SAMPLE   keep 1 in N INFO records per module, e.g. "database=10,pdf_generator=5";
+                 WARNING and above are never sampled (bot.py logs as "__main__")
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep every Nth INFO-or-lower record of the configured loggers"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._counters = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        if not rate or rate <= 1:
+            return True
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        return count % rate == 0
+
+
+# Argument types whose value can't change after the log call
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting, and merging immutable arguments, to the listener thread"""
+
+    def prepare(self, record):
+        # Arguments that may be mutated later (lists, dicts, objects) are merged now, the rest by the listener
+        if record.args and not (isinstance(record.args, tuple)
+                                and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, setting = item.partition("=")
+        pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+def setup_logging():
+    """Route all logging through a queue to a background JSON/text writer"""
+    global _listener
+    if _listener is not None:
+        return
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    else:
+        formatter = JsonFormatter()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    rates = {name: int(rate) for name, rate in _parse_pairs(os.getenv("LOG_SAMPLE", "")).items()}
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    # Neither format shows the caller, thread or process, so don't collect them on every log call
+    # (the switches from the logging docs' "Optimization" section)
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # httpx logs every Bot API request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    for name, level in _parse_pairs(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,151 @@
+"""
+In-memory matchmaking between open essays and writers looking for a partner.
+
+Two min-heaps hold the waiting essays (keyed by essay id, which is time
+ordered, so the oldest essay is matched first) and the queued writers (keyed
+by when they queued).  Pairing pops the head of the opposite heap, so both a
+new writer and a new essay are matched in O(log n) without scanning the open
+essays the way browse does.
+
+The heaps are only an index: the database stays authoritative.  Essays are
+taken with ``claim_essay`` (a conditional UPDATE), so an essay joined through
+/join or browse in the meantime is simply skipped, and queued writers live in
+the ``match_queue`` table so the queue survives a restart (``load``).
+Removed entries are dropped lazily when they reach the top of a heap, and a
+heap is rebuilt once most of it is stale, so essays joined by code or
+expired while nobody is queued don't pile up.
+Essays opened, joined or expired by other bot processes reach the heaps
+through ``on_essay_change`` (see invalidation.py).  With several workers
+(workers.py) every worker indexes all waiting essays but only the writers it
+owns, since pairing a writer touches their user_data.
+"""
+import heapq
+import logging
+
+from database import get_waiting_essays, get_queued_writers
+from metrics import MATCHMAKING_WAITING
+from workers import owns_user
+
+logger = logging.getLogger(__name__)
+
+COMPACT_MIN = 64  # stale heap entries tolerated before considering a rebuild
+
+
+class Matchmaker:
+    """Heaps of waiting essays and waiting writers"""
+
+    def __init__(self):
+        self._essays = []           # heap of essay ids
+        self._essay_creators = {}   # essay id -> creator id, for essays still waiting
+        self._writers = []          # heap of (queued_at, user_id)
+        self._writer_entries = {}   # user id -> (queued_at, username, is_anonymous)
+
+    @property
+    def waiting_essays(self):
+        return len(self._essay_creators)
+
+    @property
+    def waiting_writers(self):
+        return len(self._writer_entries)
+
+    def load(self, essays, writers):
+        """Rebuild from (essay_id, creator_id) and (user_id, username, is_anonymous, queued_at) rows"""
+        self._essay_creators = dict(essays)
+        self._essays = list(self._essay_creators)
+        heapq.heapify(self._essays)
+        self._writer_entries = {
+            user_id: (queued_at.timestamp(), username, is_anonymous)
+            for user_id, username, is_anonymous, queued_at in writers
+            if owns_user(user_id)
+        }
+        self._writers = [(entry[0], user_id) for user_id, entry in self._writer_entries.items()]
+        heapq.heapify(self._writers)
+        logger.info("🎲 Matchmaking loaded: %s waiting essays, %s waiting writers",
+                    self.waiting_essays, self.waiting_writers)
+
+    def add_essay(self, essay_id, creator_id):
+        if essay_id not in self._essay_creators:
+            self._essay_creators[essay_id] = creator_id
+            heapq.heappush(self._essays, essay_id)
+
+    def discard_essay(self, essay_id):
+        self._essay_creators.pop(essay_id, None)
+        if len(self._essays) > 2 * len(self._essay_creators) + COMPACT_MIN:
+            self._essays = list(self._essay_creators)
+            heapq.heapify(self._essays)
+
+    def add_writer(self, user_id, username, is_anonymous, queued_at):
+        if user_id in self._writer_entries:
+            # Keep the original place in the queue
+            queued_at = self._writer_entries[user_id][0]
+            self._writer_entries[user_id] = (queued_at, username, is_anonymous)
+            return
+        key = queued_at.timestamp()
+        self._writer_entries[user_id] = (key, username, is_anonymous)
+        heapq.heappush(self._writers, (key, user_id))
+
+    def remove_writer(self, user_id):
+        removed = self._writer_entries.pop(user_id, None) is not None
+        if len(self._writers) > 2 * len(self._writer_entries) + COMPACT_MIN:
+            self._writers = [(entry[0], writer_id) for writer_id, entry in self._writer_entries.items()]
+            heapq.heapify(self._writers)
+        return removed
+
+    def is_queued(self, user_id):
+        return user_id in self._writer_entries
+
+    def pop_essay_for(self, user_id):
+        """Take the oldest waiting essay not created by user_id, or None"""
+        own = []
+        essay_id = None
+        while self._essays:
+            candidate = heapq.heappop(self._essays)
+            creator_id = self._essay_creators.get(candidate)
+            if creator_id is None:
+                continue  # already joined or expired
+            if creator_id == user_id:
+                own.append(candidate)
+                continue
+            del self._essay_creators[candidate]
+            essay_id = candidate
+            break
+        for candidate in own:
+            heapq.heappush(self._essays, candidate)
+        return essay_id
+
+    def pop_writer_for(self, creator_id):
+        """Take the longest-waiting writer other than creator_id as (user_id, username, is_anonymous)"""
+        skipped = []
+        writer = None
+        while self._writers:
+            key, user_id = heapq.heappop(self._writers)
+            entry = self._writer_entries.get(user_id)
+            if entry is None or entry[0] != key:
+                continue  # left the queue
+            if user_id == creator_id:
+                skipped.append((key, user_id))
+                continue
+            del self._writer_entries[user_id]
+            writer = (user_id, entry[1], entry[2])
+            break
+        for item in skipped:
+            heapq.heappush(self._writers, item)
+        return writer
+
+
+matchmaker = Matchmaker()
+MATCHMAKING_WAITING.labels("essays").set_function(lambda: matchmaker.waiting_essays)
+MATCHMAKING_WAITING.labels("writers").set_function(lambda: matchmaker.waiting_writers)
+
+
+def on_essay_change(event):
+    """Change subscriber (see invalidation.py): follow essays opened or taken by other processes"""
+    op = event["op"]
+    if op == "reset":
+        matchmaker.load(get_waiting_essays(), get_queued_writers())
+    elif event.get("local"):
+        return  # this process already updated the heaps
+    elif op == "update" and event.get("status") == "waiting_partner" and event.get("creator"):
+        matchmaker.add_essay(event["id"], event["creator"])
+    elif op == "join" or (op == "update" and event.get("status")):
+        matchmaker.discard_essay(event["id"])
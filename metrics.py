@@ -0,0 +1,184 @@
+"""
+Prometheus metrics for handlers, database.py, PDF rendering and Bot API calls.
+
+The metrics are served in Prometheus text format from the bot process on
+``METRICS_PORT`` (set it to 0 to disable the endpoint).
+"""
+import functools
+import logging
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from telegram.request import HTTPXRequest
+
+from tracing import tracer
+from unit_of_work import unit_of_work, check_query_budget
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+
+HANDLER_SECONDS = Histogram(
+    "essaybot_handler_seconds", "Handler latency", ["handler"],
+)
+HANDLER_ERRORS = Counter(
+    "essaybot_handler_errors_total", "Handler exceptions", ["handler"],
+)
+HANDLER_DB_STATEMENTS = Histogram(
+    "essaybot_handler_db_statements", "SQL statements run by one handler call", ["handler"],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+)
+DB_QUERY_SECONDS = Histogram(
+    "essaybot_db_query_seconds", "database.py function latency", ["function"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+DB_QUERY_ERRORS = Counter(
+    "essaybot_db_query_errors_total", "database.py function exceptions", ["function"],
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    "essaybot_db_connections_open", "Currently open Postgres connections",
+)
+DB_CONNECTIONS_OPENED = Counter(
+    "essaybot_db_connections_opened_total", "Postgres connections opened",
+)
+DB_STATEMENTS = Counter(
+    "essaybot_db_statements_total", "SQL statements executed",
+)
+DB_READS = Counter(
+    "essaybot_db_reads_total", "Read-only queries by the database they were sent to", ["target"],
+)
+DB_REPLICA_LAG = Gauge(
+    "essaybot_db_replica_lag_seconds", "Last measured replay lag of the read replica",
+)
+PDF_RENDER_SECONDS = Histogram(
+    "essaybot_pdf_render_seconds", "generate_essay_pdf latency",
+)
+PDF_BYTES = Histogram(
+    "essaybot_pdf_bytes", "Generated PDF size",
+    buckets=(2_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 1_000_000),
+)
+BOT_API_SECONDS = Histogram(
+    "essaybot_bot_api_seconds", "Outbound Bot API request latency", ["method"],
+)
+BOT_API_ERRORS = Counter(
+    "essaybot_bot_api_errors_total", "Failed outbound Bot API requests", ["method", "reason"],
+)
+UPDATE_QUEUE_SIZE = Gauge(
+    "essaybot_update_queue_size", "Updates waiting to be processed",
+)
+JOB_QUEUE_JOBS = Gauge(
+    "essaybot_job_queue_jobs", "Jobs scheduled on the job queue",
+)
+MATCHES_MADE = Counter(
+    "essaybot_matches_total", "Essays paired with a writer by matchmaking",
+)
+MATCHMAKING_WAITING = Gauge(
+    "essaybot_matchmaking_waiting", "Essays and writers waiting in matchmaking", ["side"],
+)
+TURN_REMINDERS_SENT = Counter(
+    "essaybot_turn_reminders_total", "Turn reminders sent and turns forfeited", ["kind"],
+)
+TURN_TIMERS = Gauge(
+    "essaybot_turn_timers", "Pending turn deadlines in the timer wheel",
+)
+ESSAYS_EXPIRED = Counter(
+    "essaybot_essays_expired_total", "Abandoned essays moved to the expired status", ["from_status"],
+)
+INLINE_CACHE_LOOKUPS = Counter(
+    "essaybot_inline_cache_lookups_total", "Inline search lookups by cache outcome", ["result"],
+)
+STARTUP_SECONDS = Gauge(
+    "essaybot_startup_seconds", "Time spent in each startup phase", ["phase"],
+)
+PERSISTENCE_PENDING = Gauge(
+    "essaybot_persistence_pending", "Persistence entries buffered but not yet written",
+)
+INGRESS_UPDATES = Counter(
+    "essaybot_ingress_updates_total", "Webhook updates forwarded by the ingress, by worker and outcome",
+    ["worker", "outcome"],
+)
+INGRESS_FORWARD_SECONDS = Histogram(
+    "essaybot_ingress_forward_seconds", "Time to hand an update to its worker", ["worker"],
+)
+
+
+def track_handler(func):
+    """Record latency, exceptions and SQL statements of an async handler under its function name"""
+    name = func.__name__
+    histogram = HANDLER_SECONDS.labels(name)
+    statements_histogram = HANDLER_DB_STATEMENTS.labels(name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with unit_of_work() as work:
+            start = time.perf_counter()
+            statements_before = work.statements
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.labels(name).inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+                statements_histogram.observe(work.statements - statements_before)
+            check_query_budget(name, work.statements - statements_before)
+            return result
+
+    return wrapper
+
+
+def track_query(func):
+    """Record latency, call count and exceptions of a database.py function, inside a trace span"""
+    name = func.__name__
+    histogram = DB_QUERY_SECONDS.labels(name)
+    span_name = f"db.{name}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with tracer.start_as_current_span(span_name):
+                return func(*args, **kwargs)
+        except Exception:
+            DB_QUERY_ERRORS.labels(name).inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records latency, failures and a trace span for every Bot API call"""
+
+    __slots__ = ()
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            with tracer.start_as_current_span(f"bot_api.{api_method}") as span:
+                status_code, payload = await super().do_request(url, method, *args, **kwargs)
+                span.set_attribute("http.status_code", status_code)
+        except Exception as e:
+            BOT_API_ERRORS.labels(api_method, type(e).__name__).inc()
+            raise
+        finally:
+            BOT_API_SECONDS.labels(api_method).observe(time.perf_counter() - start)
+        if status_code >= 400:
+            BOT_API_ERRORS.labels(api_method, str(status_code)).inc()
+        return status_code, payload
+
+
+def start_metrics_server(application):
+    """Register application gauges and serve /metrics on METRICS_PORT"""
+    UPDATE_QUEUE_SIZE.set_function(application.update_queue.qsize)
+    if application.job_queue:
+        JOB_QUEUE_JOBS.set_function(lambda: len(application.job_queue.jobs()))
+    if application.persistence is not None and hasattr(application.persistence, "pending"):
+        PERSISTENCE_PENDING.set_function(lambda: application.persistence.pending)
+
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        logger.info("📈 Metrics served on :%s/metrics", METRICS_PORT)
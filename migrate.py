@@ -0,0 +1,68 @@
+"""
+Apply database migrations (see migrations/).
+
+Replaces the old one-off migrate_db.py, migrate_partners_db.py and
+migrate_essay_ids.py scripts.  The bot also migrates on boot unless
+MIGRATE_ON_BOOT=0, so this is mainly for deploy pipelines and --status.
+With sharded storage (shards.py) every shard database is migrated as well.
+
+Usage:
+    python migrate.py            apply all pending migrations
+    python migrate.py --status   show applied and pending versions
+    python migrate.py --to 2     migrate up to version 2
+"""
+import argparse
+import logging
+
+import migrations
+from database import schema_databases
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def status(conn):
+    """Print applied and pending migrations"""
+    current = migrations.current_version(conn)
+    applied = {}
+    if current:
+        cur = conn.cursor()
+        cur.execute("SELECT version, applied_at, duration_ms FROM schema_version")
+        applied = {version: (applied_at, duration_ms) for version, applied_at, duration_ms in cur.fetchall()}
+        cur.close()
+    for version, name, _ in migrations.load_migrations():
+        if version in applied:
+            applied_at, duration_ms = applied[version]
+            print(f"  {version:04d}_{name:<24} applied {applied_at:%Y-%m-%d %H:%M} ({duration_ms} ms)")
+        else:
+            print(f"  {version:04d}_{name:<24} pending")
+    print(f"Database at version {current}, latest is {migrations.latest_version()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="show migration status and exit")
+    parser.add_argument("--to", type=int, help="target version (default: latest)")
+    args = parser.parse_args()
+
+    setup_logging()
+    databases = schema_databases()
+    for name, connect in databases:
+        conn = connect()
+        try:
+            if args.status:
+                if len(databases) > 1:
+                    print(f"[{name}]")
+                status(conn)
+                continue
+            applied = migrations.migrate(conn, target=args.to)
+            if applied:
+                logger.info("✅ Applied migrations %s (%s)", applied, name)
+            else:
+                logger.info("✅ Database %s is up to date (version %s)", name, migrations.current_version(conn))
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
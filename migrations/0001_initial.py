@@ -0,0 +1,48 @@
+"""
+Original schema: essays with VARCHAR ids, partners and user_session.
+
+Also folds in the old migrate_db.py / migrate_partners_db.py scripts, which
+added is_anonymous to essays and partners created before it existed.
+"""
+
+
+def upgrade(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS essays (
+            id VARCHAR(255) PRIMARY KEY,
+            creator_id BIGINT NOT NULL,
+            creator_name VARCHAR(255) NOT NULL,
+            topic TEXT NOT NULL,
+            first_content TEXT,
+            second_content TEXT,
+            status VARCHAR(50) DEFAULT 'waiting_first',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_writer_id BIGINT,
+            finish_requests JSONB DEFAULT '{}'::jsonb,
+            is_anonymous BOOLEAN DEFAULT FALSE
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS partners (
+            id SERIAL PRIMARY KEY,
+            essay_id VARCHAR(255) NOT NULL REFERENCES essays(id) ON DELETE CASCADE,
+            partner_id BIGINT NOT NULL,
+            partner_name VARCHAR(255) NOT NULL,
+            is_anonymous BOOLEAN DEFAULT FALSE,
+            UNIQUE(essay_id, partner_id)
+        )
+    """)
+    # Track which essay a user is currently working on
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_session (
+            user_id BIGINT PRIMARY KEY,
+            current_essay_id VARCHAR(255) NOT NULL REFERENCES essays(id) ON DELETE CASCADE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("ALTER TABLE essays ADD COLUMN IF NOT EXISTS is_anonymous BOOLEAN DEFAULT FALSE")
+    cur.execute("ALTER TABLE partners ADD COLUMN IF NOT EXISTS is_anonymous BOOLEAN DEFAULT FALSE")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_essays_creator ON essays(creator_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_essays_status ON essays(status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_partners_partner ON partners(partner_id)")
@@ -0,0 +1,87 @@
+"""
+Replace VARCHAR essay ids with 64-bit numeric ids and add short base62 join codes.
+
+Existing essays get time-ordered ids derived from their created_at, and every
+reference in partners and user_session is rewritten in the same transaction.
+"""
+from psycopg2.extras import execute_values
+
+from ids import compose_id, new_join_code, MAX_SEQUENCE
+
+
+def upgrade(cur):
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'essays' AND column_name = 'id'
+    """)
+    if cur.fetchone()[0] == 'bigint':
+        # Already converted by the old migrate_essay_ids.py
+        return
+
+    cur.execute("ALTER TABLE essays ADD COLUMN new_id BIGINT, ADD COLUMN join_code VARCHAR(16)")
+
+    # Assign time-ordered ids from created_at; the sequence bits break ties within a millisecond
+    cur.execute("""
+        SELECT id, (EXTRACT(EPOCH FROM COALESCE(created_at, CURRENT_TIMESTAMP)) * 1000)::BIGINT
+        FROM essays ORDER BY created_at, id
+    """)
+    mapping = []
+    join_codes = set()
+    last_ms, sequence = None, 0
+    for old_id, created_ms in cur.fetchall():
+        if created_ms == last_ms and sequence < MAX_SEQUENCE:
+            sequence += 1
+        else:
+            if last_ms is not None and created_ms <= last_ms:
+                created_ms = last_ms + 1
+            sequence = 0
+        last_ms = created_ms
+        join_code = new_join_code()
+        while join_code in join_codes:
+            join_code = new_join_code()
+        join_codes.add(join_code)
+        mapping.append((old_id, compose_id(created_ms, 0, sequence), join_code))
+
+    execute_values(cur, """
+        UPDATE essays SET new_id = m.new_id, join_code = m.join_code
+        FROM (VALUES %s) AS m(old_id, new_id, join_code)
+        WHERE essays.id = m.old_id
+    """, mapping, page_size=1000)
+
+    # Rewrite references
+    cur.execute("ALTER TABLE partners ADD COLUMN new_essay_id BIGINT")
+    cur.execute("""
+        UPDATE partners SET new_essay_id = e.new_id
+        FROM essays e WHERE partners.essay_id = e.id
+    """)
+    cur.execute("ALTER TABLE user_session ADD COLUMN new_essay_id BIGINT")
+    cur.execute("""
+        UPDATE user_session SET new_essay_id = e.new_id
+        FROM essays e WHERE user_session.current_essay_id = e.id
+    """)
+
+    # Dropping the old columns also drops the primary key, foreign keys and UNIQUE(essay_id, partner_id)
+    cur.execute("ALTER TABLE partners DROP COLUMN essay_id")
+    cur.execute("ALTER TABLE user_session DROP COLUMN current_essay_id")
+    cur.execute("ALTER TABLE essays DROP COLUMN id CASCADE")
+
+    cur.execute("ALTER TABLE essays RENAME COLUMN new_id TO id")
+    cur.execute("ALTER TABLE essays ALTER COLUMN id SET NOT NULL, ALTER COLUMN join_code SET NOT NULL")
+    cur.execute("ALTER TABLE essays ADD PRIMARY KEY (id)")
+    cur.execute("CREATE UNIQUE INDEX idx_essays_join_code ON essays(join_code)")
+
+    cur.execute("ALTER TABLE partners RENAME COLUMN new_essay_id TO essay_id")
+    cur.execute("ALTER TABLE partners ALTER COLUMN essay_id SET NOT NULL")
+    cur.execute("""
+        ALTER TABLE partners
+        ADD FOREIGN KEY (essay_id) REFERENCES essays(id) ON DELETE CASCADE,
+        ADD UNIQUE (essay_id, partner_id)
+    """)
+
+    cur.execute("DELETE FROM user_session WHERE new_essay_id IS NULL")
+    cur.execute("ALTER TABLE user_session RENAME COLUMN new_essay_id TO current_essay_id")
+    cur.execute("ALTER TABLE user_session ALTER COLUMN current_essay_id SET NOT NULL")
+    cur.execute("""
+        ALTER TABLE user_session
+        ADD FOREIGN KEY (current_essay_id) REFERENCES essays(id) ON DELETE CASCADE
+    """)
@@ -0,0 +1,15 @@
+"""
+Conversation states and user_data for persistence.py.
+"""
+
+
+def upgrade(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS bot_persistence (
+            kind VARCHAR(64) NOT NULL,
+            key TEXT NOT NULL,
+            data JSONB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, key)
+        )
+    """)
@@ -0,0 +1,14 @@
+"""
+Writers waiting for matchmaking to pair them with an open essay (see matchmaking.py).
+"""
+
+
+def upgrade(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS match_queue (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255) NOT NULL,
+            is_anonymous BOOLEAN DEFAULT FALSE,
+            queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
@@ -0,0 +1,17 @@
+"""
+Track when the current turn of an essay started and how many reminders went out (see reminders.py).
+
+Essays already in progress start their clock at migration time.
+"""
+
+
+def upgrade(cur):
+    cur.execute("""
+        ALTER TABLE essays
+        ADD COLUMN IF NOT EXISTS turn_started_at TIMESTAMP,
+        ADD COLUMN IF NOT EXISTS reminders_sent SMALLINT NOT NULL DEFAULT 0
+    """)
+    cur.execute("""
+        UPDATE essays SET turn_started_at = CURRENT_TIMESTAMP
+        WHERE status = 'in_progress' AND turn_started_at IS NULL
+    """)
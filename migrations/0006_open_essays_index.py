@@ -0,0 +1,14 @@
+"""
+Index only the open essays, so expired and complete ones stop growing the hot index (see expiry.py).
+
+Every status lookup is for 'waiting_partner' or 'in_progress'; the partial
+index on (status, id) replaces the full idx_essays_status.
+"""
+
+
+def upgrade(cur):
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_essays_open ON essays(status, id)
+        WHERE status IN ('waiting_partner', 'in_progress')
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_essays_status")
@@ -0,0 +1,144 @@
+"""
+Range-partition essays and partners by month (see partitions.py).
+
+Essay ids are time ordered, so each monthly partition is an id range:
+partition pruning then applies to every lookup by essay id, and the primary
+key stays ``id``.  partners is partitioned on essay_id with the same bounds so
+an essay and its partners always live in (and are archived from) the same
+month.  A DEFAULT partition catches ids outside the created months.
+
+Unique constraints on a partitioned table must include the partition key, so
+join codes move to their own ``join_codes`` table to stay globally unique.
+Completed months can later be detached into ``essays_archive``.
+"""
+from datetime import datetime, timezone
+
+import psycopg2
+
+from ids import compose_id
+
+MONTHS_AHEAD = 3
+
+
+def _month_starts(first, months_ahead):
+    year, month = first.year, first.month
+    now = datetime.now(timezone.utc)
+    last = now.year * 12 + now.month - 1 + months_ahead
+    while year * 12 + month - 1 <= last:
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _bound(year, month):
+    return compose_id(int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000), 0, 0)
+
+
+def upgrade(cur):
+    cur.execute("ALTER TABLE essays RENAME TO essays_unpartitioned")
+    cur.execute("ALTER TABLE partners RENAME TO partners_unpartitioned")
+    cur.execute("ALTER SEQUENCE partners_id_seq RENAME TO partners_unpartitioned_id_seq")
+
+    cur.execute("""
+        CREATE TABLE essays (
+            id BIGINT NOT NULL,
+            join_code VARCHAR(16) NOT NULL,
+            creator_id BIGINT NOT NULL,
+            creator_name VARCHAR(255) NOT NULL,
+            topic TEXT NOT NULL,
+            first_content TEXT,
+            second_content TEXT,
+            status VARCHAR(50) DEFAULT 'waiting_first',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_writer_id BIGINT,
+            finish_requests JSONB DEFAULT '{}'::jsonb,
+            is_anonymous BOOLEAN DEFAULT FALSE,
+            turn_started_at TIMESTAMP,
+            reminders_sent SMALLINT NOT NULL DEFAULT 0
+        ) PARTITION BY RANGE (id)
+    """)
+    cur.execute("""
+        CREATE TABLE partners (
+            id BIGSERIAL,
+            essay_id BIGINT NOT NULL,
+            partner_id BIGINT NOT NULL,
+            partner_name VARCHAR(255) NOT NULL,
+            is_anonymous BOOLEAN DEFAULT FALSE
+        ) PARTITION BY RANGE (essay_id)
+    """)
+
+    # One partition per month from the oldest essay until a few months ahead
+    cur.execute("SELECT min(created_at) FROM essays_unpartitioned")
+    oldest = cur.fetchone()[0] or datetime.now(timezone.utc)
+    for year, month in _month_starts(oldest, MONTHS_AHEAD):
+        lower = _bound(year, month)
+        upper = _bound(*((year + 1, 1) if month == 12 else (year, month + 1)))
+        suffix = f"y{year:04d}m{month:02d}"
+        cur.execute(f"CREATE TABLE essays_{suffix} PARTITION OF essays FOR VALUES FROM ({lower}) TO ({upper})")
+        cur.execute(f"CREATE TABLE partners_{suffix} PARTITION OF partners FOR VALUES FROM ({lower}) TO ({upper})")
+    cur.execute("CREATE TABLE essays_default PARTITION OF essays DEFAULT")
+    cur.execute("CREATE TABLE partners_default PARTITION OF partners DEFAULT")
+
+    cur.execute("""
+        INSERT INTO essays (id, join_code, creator_id, creator_name, topic, first_content, second_content, status,
+                            created_at, last_writer_id, finish_requests, is_anonymous, turn_started_at, reminders_sent)
+        SELECT id, join_code, creator_id, creator_name, topic, first_content, second_content, status,
+               created_at, last_writer_id, finish_requests, is_anonymous, turn_started_at, reminders_sent
+        FROM essays_unpartitioned
+    """)
+    cur.execute("""
+        INSERT INTO partners (id, essay_id, partner_id, partner_name, is_anonymous)
+        SELECT id, essay_id, partner_id, partner_name, is_anonymous FROM partners_unpartitioned
+    """)
+    cur.execute("SELECT setval(pg_get_serial_sequence('partners', 'id'), COALESCE(max(id), 0) + 1, false) FROM partners")
+
+    cur.execute("""
+        CREATE TABLE join_codes (
+            join_code VARCHAR(16) PRIMARY KEY,
+            essay_id BIGINT NOT NULL
+        )
+    """)
+    cur.execute("INSERT INTO join_codes (join_code, essay_id) SELECT join_code, id FROM essays")
+
+    # Dropping the old tables also drops user_session's foreign key and the old indexes
+    cur.execute("DROP TABLE partners_unpartitioned")
+    cur.execute("DROP TABLE essays_unpartitioned CASCADE")
+
+    cur.execute("ALTER TABLE essays ADD PRIMARY KEY (id)")
+    cur.execute("ALTER TABLE partners ADD PRIMARY KEY (essay_id, id)")
+    cur.execute("ALTER TABLE partners ADD UNIQUE (essay_id, partner_id)")
+    cur.execute("""
+        ALTER TABLE partners
+        ADD FOREIGN KEY (essay_id) REFERENCES essays(id) ON DELETE CASCADE
+    """)
+    cur.execute("""
+        ALTER TABLE user_session
+        ADD FOREIGN KEY (current_essay_id) REFERENCES essays(id) ON DELETE CASCADE
+    """)
+    cur.execute("CREATE INDEX idx_essays_creator ON essays(creator_id)")
+    cur.execute("""
+        CREATE INDEX idx_essays_open ON essays(status, id)
+        WHERE status IN ('waiting_partner', 'in_progress')
+    """)
+    cur.execute("CREATE INDEX idx_partners_partner ON partners(partner_id)")
+
+    # Cold storage for detached months: one row per essay, partners folded into the document
+    cur.execute("""
+        CREATE TABLE essays_archive (
+            id BIGINT PRIMARY KEY,
+            creator_id BIGINT NOT NULL,
+            status VARCHAR(50),
+            created_at TIMESTAMP,
+            data JSONB NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX idx_essays_archive_creator ON essays_archive(creator_id)")
+    cur.execute("SHOW server_version_num")
+    if int(cur.fetchone()[0]) >= 140000:
+        # lz4 compresses the TOASTed documents faster than the default pglz, when the server has it
+        cur.execute("SAVEPOINT archive_compression")
+        try:
+            cur.execute("ALTER TABLE essays_archive ALTER COLUMN data SET COMPRESSION lz4")
+        except psycopg2.Error:
+            cur.execute("ROLLBACK TO SAVEPOINT archive_compression")
+        else:
+            cur.execute("RELEASE SAVEPOINT archive_compression")
@@ -0,0 +1,22 @@
+"""
+Full-text search over the topic and opening of open essays (/search, browse search box).
+
+search_vector is a stored generated column, so it is maintained by Postgres
+on every insert/update.  It uses the 'simple' configuration (no stemming or
+stop words) because topics are written in many languages.  The GIN index only
+covers essays waiting for a partner, the only ones search returns.
+"""
+
+
+def upgrade(cur):
+    cur.execute("""
+        ALTER TABLE essays ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(topic, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(first_content, '')), 'B')
+        ) STORED
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_essays_search ON essays USING GIN (search_vector)
+        WHERE status = 'waiting_partner'
+    """)
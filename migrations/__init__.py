@@ -0,0 +1,109 @@
+"""
+Versioned schema migrations.
+
+Each ``NNNN_name.py`` module in this package has a docstring and an
+``upgrade(cur)`` function.  Applied versions are recorded in the
+``schema_version`` table; migrate() applies the missing ones in order, each in
+its own transaction, while holding a Postgres advisory lock so replicas that
+boot at the same time don't race.
+
+Migrations must also be safe on databases created before this runner existed
+(tables made by the old init_db and migrate_*.py scripts), so they use
+IF NOT EXISTS and check the current column types where needed.
+"""
+import importlib
+import logging
+import os
+import re
+import time
+
+import psycopg2
+from psycopg2 import errors
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_KEY = 0x65737361795f6d67  # "essay_mg"
+
+_MODULE_PATTERN = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+def load_migrations():
+    """All migrations as a sorted list of (version, name, module)"""
+    migrations = []
+    for filename in os.listdir(os.path.dirname(__file__)):
+        match = _MODULE_PATTERN.match(filename)
+        if match:
+            module = importlib.import_module(f"{__name__}.{filename[:-3]}")
+            migrations.append((int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda migration: migration[0])
+    versions = [version for version, _, _ in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {versions}")
+    return migrations
+
+
+def latest_version():
+    """Version the code expects the database to be at"""
+    migrations = load_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(conn):
+    """Version recorded in schema_version, 0 if nothing has been applied yet"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT max(version) FROM schema_version")
+        version = cur.fetchone()[0] or 0
+        conn.commit()
+        return version
+    except errors.UndefinedTable:
+        conn.rollback()
+        return 0
+    finally:
+        cur.close()
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to target (default: latest); returns the versions applied"""
+    cur = conn.cursor()
+    applied = []
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                duration_ms INTEGER
+            )
+        """)
+        conn.commit()
+
+        # Read the version only once we hold the lock: another replica may have just migrated
+        current = current_version(conn)
+        for version, name, module in load_migrations():
+            if version <= current or (target is not None and version > target):
+                continue
+            started = time.perf_counter()
+            try:
+                module.upgrade(cur)
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                cur.execute(
+                    "INSERT INTO schema_version (version, name, duration_ms) VALUES (%s, %s, %s)",
+                    (version, name, duration_ms),
+                )
+                conn.commit()
+            except psycopg2.Error as e:
+                conn.rollback()
+                logger.error("❌ Migration %04d_%s failed: %s", version, name, e)
+                raise
+            logger.info("🗄️ Applied migration %04d_%s in %s ms", version, name, duration_ms)
+            applied.append(version)
+        return applied
+    finally:
+        if not conn.closed:
+            # The lock is held by the session, so it survives rollbacks; release it explicitly
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+        cur.close()
@@ -0,0 +1,99 @@
+"""
+Compact essay and partner records returned by database.py.
+
+Essay and Partner are plain __slots__ classes built straight from tuple
+cursor rows: no per-row dict, no RealDictRow and no column-name strings
+per value, which matters for list screens and iter_essays() reading
+thousands of rows.  They keep the read side of the dict interface
+(``essay['topic']``, ``essay.get('partners', [])``), so handlers and
+pdf_generator work with them unchanged; ``to_dict()`` gives a real dict.
+"""
+
+# Every essays column except the derived search_vector, in SELECT order
+ESSAY_COLUMNS = (
+    "id", "join_code", "creator_id", "creator_name", "topic", "first_content", "second_content", "status",
+    "created_at", "last_writer_id", "finish_requests", "is_anonymous", "turn_started_at", "reminders_sent",
+)
+PARTNER_COLUMNS = ("id", "name", "is_anonymous")
+
+
+class Record:
+    """Dict-style access to the fields of a __slots__ class"""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={getattr(self, k)!r}' for k in self.__slots__)})"
+
+
+class Partner(Record):
+    __slots__ = PARTNER_COLUMNS
+
+    def __init__(self, id, name, is_anonymous=False):
+        self.id = id
+        self.name = name
+        self.is_anonymous = is_anonymous
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'is_anonymous': self.is_anonymous}
+
+
+class Essay(Record):
+    __slots__ = ESSAY_COLUMNS + ("partners",)
+
+    def __init__(self, id, join_code, creator_id, creator_name, topic, first_content=None, second_content=None,
+                 status='waiting_first', created_at=None, last_writer_id=None, finish_requests=None,
+                 is_anonymous=False, turn_started_at=None, reminders_sent=0, partners=None):
+        self.id = id
+        self.join_code = join_code
+        self.creator_id = creator_id
+        self.creator_name = creator_name
+        self.topic = topic
+        self.first_content = first_content
+        self.second_content = second_content
+        self.status = status
+        self.created_at = created_at
+        self.last_writer_id = last_writer_id
+        self.finish_requests = finish_requests
+        self.is_anonymous = is_anonymous
+        self.turn_started_at = turn_started_at
+        self.reminders_sent = reminders_sent
+        self.partners = [] if partners is None else partners
+
+    @classmethod
+    def from_row(cls, row, partners=None):
+        """Build from a tuple row in ESSAY_COLUMNS order"""
+        return cls(*row, partners=partners)
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in ESSAY_COLUMNS}
+        data['partners'] = [partner.to_dict() for partner in self.partners]
+        return data
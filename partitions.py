@@ -0,0 +1,220 @@
+"""
+Monthly partitions of essays/partners and the cold archive.
+
+essays is range-partitioned on its time-ordered id and partners on essay_id,
+with one pair of partitions per calendar month (UTC), named essays_yYYYYmMM
+and partners_yYYYYmMM (see migrations/0007_partition_essays.py).  The bot
+creates upcoming months once a day; old months whose essays are all complete
+or expired can be detached into ``essays_archive``, one compressed JSONB
+document per essay, to keep the live tables small.  With sharded storage
+(shards.py) every essay database has its own partitions; the commands and the
+daily job go through all of them.
+
+Usage:
+    python partitions.py list
+    python partitions.py ensure [--ahead 3] [--back 0]
+    python partitions.py archive --older-than 12 [--dry-run]
+"""
+import argparse
+import logging
+import re
+from datetime import datetime, timezone
+
+import psycopg2
+
+from database import get_shard_connection
+from ids import compose_id
+from logging_setup import setup_logging
+from shards import all_databases
+
+logger = logging.getLogger(__name__)
+
+MONTHS_AHEAD = 3
+ARCHIVABLE_STATUSES = ('complete', 'expired')
+
+_NAME_PATTERN = re.compile(r"^essays_y(\d{4})m(\d{2})$")
+
+
+def _add_months(year, month, months):
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def month_bounds(year, month):
+    """[lower, upper) essay id range of a calendar month"""
+    def bound(y, m):
+        return compose_id(int(datetime(y, m, 1, tzinfo=timezone.utc).timestamp() * 1000), 0, 0)
+    return bound(year, month), bound(*_add_months(year, month, 1))
+
+
+def partition_suffix(year, month):
+    return f"y{year:04d}m{month:02d}"
+
+
+def list_partitions(db=0):
+    """(year, month) of every monthly essays table, oldest first (including ones detached for archiving)"""
+    conn = get_shard_connection(db)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT relname FROM pg_class WHERE relkind = 'r' AND relname ~ '^essays_y[0-9]{4}m[0-9]{2}$'")
+        months = []
+        for (name,) in cur.fetchall():
+            match = _NAME_PATTERN.match(name)
+            if match:
+                months.append((int(match.group(1)), int(match.group(2))))
+        return sorted(months)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD, months_back=0, db=0):
+    """Create the essays/partners partitions from months_back ago to months_ahead; returns those created"""
+    now = datetime.now(timezone.utc)
+    existing = set(list_partitions(db))
+    conn = get_shard_connection(db)
+    cur = conn.cursor()
+    created = []
+    try:
+        for offset in range(-months_back, months_ahead + 1):
+            year, month = _add_months(now.year, now.month, offset)
+            if (year, month) in existing:
+                continue
+            lower, upper = month_bounds(year, month)
+            suffix = partition_suffix(year, month)
+            try:
+                cur.execute(f"CREATE TABLE IF NOT EXISTS essays_{suffix} PARTITION OF essays "
+                            f"FOR VALUES FROM ({lower}) TO ({upper})")
+                cur.execute(f"CREATE TABLE IF NOT EXISTS partners_{suffix} PARTITION OF partners "
+                            f"FOR VALUES FROM ({lower}) TO ({upper})")
+                conn.commit()
+                created.append((year, month))
+            except psycopg2.Error as e:
+                # Typically rows for that month already sit in the DEFAULT partition
+                conn.rollback()
+                logger.error("❌ Could not create partitions for %s: %s", suffix, e)
+        if created:
+            logger.info("🗂️ Created partitions for %s", ", ".join(partition_suffix(*m) for m in created))
+        return created
+    finally:
+        cur.close()
+        conn.close()
+
+
+def ensure_partitions_since(oldest_ms, months_ahead=MONTHS_AHEAD):
+    """ensure_partitions reaching back to the month of a timestamp (ms), e.g. before loading old essays"""
+    then = datetime.fromtimestamp(oldest_ms / 1000, timezone.utc)
+    now = datetime.now(timezone.utc)
+    return ensure_partitions(months_ahead, max((now.year - then.year) * 12 + now.month - then.month, 0))
+
+
+def _table_exists(cur, name):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    return cur.fetchone()[0]
+
+
+def archive_month(year, month, dry_run=False, db=0):
+    """Move a month of finished essays into essays_archive; returns the number archived, None if skipped"""
+    suffix = partition_suffix(year, month)
+    essays_table, partners_table = f"essays_{suffix}", f"partners_{suffix}"
+    conn = get_shard_connection(db)
+    cur = conn.cursor()
+    try:
+        if not _table_exists(cur, essays_table):
+            return None
+        cur.execute("SELECT relispartition FROM pg_class WHERE oid = %s::regclass", (essays_table,))
+        attached = cur.fetchone()[0]
+        if attached:
+            cur.execute(f"SELECT count(*) FROM {essays_table} WHERE status NOT IN %s", (ARCHIVABLE_STATUSES,))
+            still_open = cur.fetchone()[0]
+            if still_open:
+                logger.info("⏭️ %s still has %s open essays, not archiving", suffix, still_open)
+                return None
+            if dry_run:
+                cur.execute(f"SELECT count(*) FROM {essays_table}")
+                return cur.fetchone()[0]
+
+            # Detaching locks the parent tables, so do it in its own short transaction
+            cur.execute(f"DELETE FROM user_session WHERE current_essay_id IN (SELECT id FROM {essays_table})")
+            cur.execute(f"ALTER TABLE partners DETACH PARTITION {partners_table}")
+            cur.execute(f"ALTER TABLE essays DETACH PARTITION {essays_table}")
+            conn.commit()
+        elif dry_run:
+            return 0
+
+        # A month detached by an interrupted run is picked up here
+        cur.execute(f"""
+            INSERT INTO essays_archive (id, creator_id, status, created_at, data)
+            SELECT e.id, e.creator_id, e.status, e.created_at,
+                   (to_jsonb(e) - 'search_vector') || jsonb_build_object('partners', COALESCE((
+                       SELECT jsonb_agg(jsonb_build_object(
+                           'id', p.partner_id, 'name', p.partner_name, 'is_anonymous', p.is_anonymous
+                       ) ORDER BY p.id)
+                       FROM {partners_table} p WHERE p.essay_id = e.id
+                   ), '[]'::jsonb))
+            FROM {essays_table} e
+            ON CONFLICT (id) DO NOTHING
+        """)
+        archived = cur.rowcount
+        cur.execute(f"DELETE FROM join_codes WHERE essay_id IN (SELECT id FROM {essays_table})")
+        cur.execute(f"DROP TABLE {partners_table}, {essays_table}")
+        conn.commit()
+        logger.info("🧊 Archived %s essays from %s", archived, suffix)
+        return archived
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error("❌ Archiving %s failed: %s", suffix, e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def archive_older_than(months, dry_run=False, db=0):
+    """Archive every finished month that ended more than `months` months ago"""
+    now = datetime.now(timezone.utc)
+    cutoff = _add_months(now.year, now.month, -months)
+    results = {}
+    for year, month in list_partitions(db):
+        if (year, month) < cutoff:
+            results[(year, month)] = archive_month(year, month, dry_run=dry_run, db=db)
+    return results
+
+
+async def ensure_partitions_job(context):
+    """Job callback: keep MONTHS_AHEAD months of partitions ready on every essay database"""
+    for db in all_databases():
+        ensure_partitions(db=db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the monthly partitions")
+    ensure = commands.add_parser("ensure", help="create missing monthly partitions")
+    ensure.add_argument("--ahead", type=int, default=MONTHS_AHEAD)
+    ensure.add_argument("--back", type=int, default=0)
+    archive = commands.add_parser("archive", help="move finished old months to essays_archive")
+    archive.add_argument("--older-than", type=int, required=True, metavar="MONTHS")
+    archive.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    setup_logging()
+
+    databases = all_databases()
+    for db in databases:
+        prefix = f"[database {db}] " if len(databases) > 1 else ""
+        if args.command == "list":
+            for year, month in list_partitions(db):
+                lower, upper = month_bounds(year, month)
+                print(f"{prefix}essays_{partition_suffix(year, month)}  ids [{lower}, {upper})")
+        elif args.command == "ensure":
+            ensure_partitions(args.ahead, args.back, db=db)
+        else:
+            for (year, month), count in archive_older_than(args.older_than, args.dry_run, db=db).items():
+                state = "skipped (open essays)" if count is None else f"{count} essays"
+                print(f"{prefix}{partition_suffix(year, month)}: {state}{' (dry run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
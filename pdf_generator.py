@@ -6,11 +6,16 @@ from reportlab.lib.enums import TA_LEFT, TA_CENTER
 from datetime import datetime
 import os
 import logging
+import time
+from metrics import PDF_RENDER_SECONDS, PDF_BYTES
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+@tracer.start_as_current_span("pdf.generate_essay_pdf")
 def generate_essay_pdf(essay):
     """Generate a PDF file for the essay"""
+    start = time.perf_counter()
     
     filename = f"essays/{essay['id']}.pdf"
     os.makedirs("essays", exist_ok=True)
@@ -100,7 +105,7 @@ def generate_essay_pdf(essay):
             # Hide partner name if they joined anonymously
             # Check for is_anonymous as boolean, integer, or string
             is_anon = partner.get('is_anonymous')
-            logger.info(f"📋 Partner {i}: name={partner.get('name')}, is_anonymous={is_anon} (type: {type(is_anon)})")
+            logger.debug("📋 Partner %s: name=%s, is_anonymous=%s (type: %s)", i, partner.get('name'), is_anon, type(is_anon))
             if is_anon in (True, 1, '1', 'true', 'True', 'TRUE'):
                 partner_name = "Anonymous"
             else:
@@ -113,5 +118,7 @@ def generate_essay_pdf(essay):
     
     doc.build(story)
     
+    PDF_RENDER_SECONDS.observe(time.perf_counter() - start)
+    PDF_BYTES.observe(os.path.getsize(filename))
     return filename
 
@@ -0,0 +1,118 @@
+"""
+Postgres-backed persistence for ConversationHandler states and user_data.
+
+python-telegram-bot hands changed entries to the persistence every
+``update_interval`` seconds.  Entries are serialized into an in-memory buffer
+and written to the ``bot_persistence`` table in one batched transaction, so a
+burst of conversation transitions costs a single round trip.  Whatever is
+still buffered is written by ``flush()`` when the application shuts down.
+With several workers (workers.py) each one loads only the users it owns.
+"""
+import asyncio
+import json
+import logging
+import os
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import load_persisted, save_persisted
+from workers import owns_user
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "10"))
+
+USER_KIND = "user"
+CONVERSATION_KIND = "conv:"
+
+
+class PostgresPersistence(BasePersistence):
+    """Write-batched persistence storing user_data and conversations in Postgres"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=flush_interval,
+        )
+        # (kind, key) -> JSON string, or None for a pending delete
+        self._dirty = {}
+        self._flush_task = None
+
+    @property
+    def pending(self):
+        """Number of buffered entries not yet written"""
+        return len(self._dirty)
+
+    def _mark(self, kind, key, data):
+        self._dirty[(kind, key)] = None if data is None else json.dumps(data)
+        if self._flush_task is None or self._flush_task.done():
+            # Runs after the rest of this update_persistence() batch has been buffered
+            self._flush_task = asyncio.get_running_loop().create_task(self._write_dirty())
+
+    async def _write_dirty(self):
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        upserts = [(kind, key, data) for (kind, key), data in batch.items() if data is not None]
+        deletes = [(kind, key) for (kind, key), data in batch.items() if data is None]
+        try:
+            await asyncio.to_thread(save_persisted, upserts, deletes)
+        except Exception as e:
+            logger.error("❌ Persistence flush failed, will retry: %s", e)
+            # Keep entries that were changed again while writing
+            batch.update(self._dirty)
+            self._dirty = batch
+
+    async def get_user_data(self):
+        rows = await asyncio.to_thread(load_persisted, USER_KIND)
+        return {int(key): data for key, data in rows.items() if owns_user(int(key))}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = await asyncio.to_thread(load_persisted, CONVERSATION_KIND + name)
+        conversations = {tuple(json.loads(key)): state for key, state in rows.items()}
+        # Keys end with the user id (per_user conversations)
+        return {key: state for key, state in conversations.items() if owns_user(key[-1])}
+
+    async def update_conversation(self, name, key, new_state):
+        self._mark(CONVERSATION_KIND + name, json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._mark(USER_KIND, str(user_id), data)
+
+    async def drop_user_data(self, user_id):
+        self._mark(USER_KIND, str(user_id), None)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_dirty()
@@ -0,0 +1,35 @@
+"""
+On-demand cProfile sampling of the running bot.
+
+The profiler is enabled on the event loop thread for a fixed window, so it
+captures every handler, database call and PDF render that runs meanwhile.
+"""
+import asyncio
+import cProfile
+import io
+import pstats
+
+MAX_SECONDS = 120
+
+_running = False
+
+
+async def profile_for(seconds, limit=15, sort="tottime"):
+    """Profile the event loop for ``seconds`` and return the hottest functions as text"""
+    global _running
+    if _running:
+        raise RuntimeError("A profiling session is already running")
+
+    _running = True
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+        await asyncio.sleep(seconds)
+    finally:
+        profile.disable()
+        _running = False
+
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,215 @@
+"""
+Reminders and auto-forfeit for stalled turns.
+
+Every essay in progress has one pending deadline in a hashed timer wheel:
+scheduling and cancelling are O(1) dict operations, and the job queue runs a
+single ``turn_timer_tick`` job that only looks at the slots for the ticks that
+elapsed, so tens of thousands of open turns cost no per-essay jobs or polling.
+The due essays of a tick are checked against the database in one query before
+anyone is messaged.
+
+Deadlines are measured from ``essays.turn_started_at``: the writer whose turn
+it is gets a reminder after each delay in ``TURN_REMINDERS`` (seconds,
+escalating), and if ``TURN_FORFEIT_AFTER`` is set their turn is skipped after
+that long.  The wheel is rebuilt from the database on startup (``load_turns``).
+
+With several workers only one runs the timers (see workers.py): the others
+call ``disable()``, and the timer worker follows turns started elsewhere
+through ``on_essay_change``.
+"""
+import logging
+import math
+import os
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import callbacks as cb
+from database import get_turn_states, set_reminders_sent, forfeit_turn, get_open_turns
+from metrics import TURN_REMINDERS_SENT, TURN_TIMERS
+
+logger = logging.getLogger(__name__)
+
+REMINDER_DELAYS = tuple(sorted(
+    float(delay) for delay in os.getenv("TURN_REMINDERS", "86400,259200").split(",") if delay.strip()
+))
+FORFEIT_AFTER = float(os.getenv("TURN_FORFEIT_AFTER", "0"))  # 0 disables auto-forfeit
+TICK_SECONDS = float(os.getenv("TURN_TIMER_TICK", "60"))
+WHEEL_SLOTS = int(os.getenv("TURN_TIMER_SLOTS", "1440"))  # one revolution per day at 60 s ticks
+
+
+class TimerWheel:
+    """Hashed timing wheel keyed by an id, holding one (deadline, value) per key"""
+
+    def __init__(self, tick, slots, now=None):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}  # key -> slot index
+        self._cursor = int((time.time() if now is None else now) // tick)  # last tick processed
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key, deadline, value=None):
+        """Set the deadline of key, replacing any earlier one"""
+        self.cancel(key)
+        due_tick = max(math.ceil(deadline / self.tick), self._cursor + 1)
+        slot = due_tick % len(self._slots)
+        self._slots[slot][key] = (due_tick, value)
+        self._where[key] = slot
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self, now):
+        """Remove and return (key, value) of every timer due by now"""
+        target = int(now // self.tick)
+        slots = len(self._slots)
+        due = []
+        # Entries further out than one revolution share a slot with nearer ones and stay put;
+        # after a long pause a single pass over the wheel covers every slot
+        for tick in range(max(self._cursor + 1, target - slots + 1), target + 1):
+            bucket = self._slots[tick % slots]
+            if not bucket:
+                continue
+            for key in [key for key, (due_tick, _) in bucket.items() if due_tick <= target]:
+                due.append((key, bucket.pop(key)[1]))
+                del self._where[key]
+        self._cursor = max(self._cursor, target)
+        return due
+
+
+_wheel = TimerWheel(TICK_SECONDS, WHEEL_SLOTS)
+TURN_TIMERS.set_function(lambda: len(_wheel))
+_enabled = True
+
+
+def disable():
+    """Another process runs the turn timers: make scheduling a no-op here"""
+    global _enabled
+    _enabled = False
+
+
+def _stage_offset(stage):
+    """Seconds after the turn started at which stage fires, None after the last stage"""
+    if stage < len(REMINDER_DELAYS):
+        return REMINDER_DELAYS[stage]
+    if FORFEIT_AFTER and stage == len(REMINDER_DELAYS):
+        return max(FORFEIT_AFTER, REMINDER_DELAYS[-1] if REMINDER_DELAYS else 0)
+    return None
+
+
+def _schedule_stage(essay_id, turn_started, stage):
+    if not _enabled:
+        return
+    offset = _stage_offset(stage)
+    if offset is None:
+        _wheel.cancel(essay_id)
+    else:
+        _wheel.schedule(essay_id, turn_started + offset, stage)
+
+
+def schedule_turn(essay_id):
+    """A new turn of essay_id started just now"""
+    _schedule_stage(essay_id, time.time(), 0)
+
+
+def cancel_turn(essay_id):
+    """essay_id no longer has a turn to wait for (e.g. it is complete)"""
+    _wheel.cancel(essay_id)
+
+
+def load_turns(open_turns):
+    """Rebuild the wheel from (essay_id, turn age in seconds, reminders sent) rows"""
+    now = time.time()
+    for essay_id, turn_age, reminders_sent in open_turns:
+        _schedule_stage(essay_id, now - turn_age, reminders_sent)
+    logger.info("⏰ Turn timers loaded: %s pending", len(_wheel))
+
+
+def on_essay_change(event):
+    """Change subscriber (see invalidation.py): follow turns started or ended by other processes"""
+    op = event["op"]
+    if not _enabled:
+        return
+    if op == "reset":
+        load_turns(get_open_turns())
+    elif event.get("local"):
+        return  # scheduled where the change was made
+    elif op in ("turn", "join"):
+        schedule_turn(event["id"])
+    elif op == "update" and event.get("status") in ("complete", "expired"):
+        cancel_turn(event["id"])
+
+
+def _hours(seconds):
+    hours = seconds / 3600
+    return f"{hours:.0f} hours" if hours >= 2 else f"{seconds / 60:.0f} minutes"
+
+
+def _reminder_text(state, stage):
+    text = f"⏰ REMINDER: it's your turn!\n\n📝 Essay: {state['topic']}\n\n"
+    if stage == 0:
+        return text + "Your partner is waiting for your next part."
+    forfeit_in = _stage_offset(len(REMINDER_DELAYS))
+    if forfeit_in and stage == len(REMINDER_DELAYS) - 1:
+        return text + f"⚠️ Last reminder - your turn will be skipped in {_hours(forfeit_in - state['turn_age'])}."
+    return text + f"Your partner has been waiting for {_hours(state['turn_age'])}."
+
+
+async def _send(bot, chat_id, text, essay_id=None):
+    reply_markup = None
+    if essay_id:
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("✍️ Continue Writing", callback_data=cb.encode(cb.CONTINUE, essay_id))],
+        ])
+    try:
+        await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+    except Exception as e:
+        logger.warning("⚠️ Could not message %s: %s: %s", chat_id, type(e).__name__, e)
+
+
+async def turn_timer_tick(context):
+    """Job callback: send the reminders and forfeits that fell due since the last tick"""
+    now = time.time()
+    due = _wheel.advance(now)
+    if not due:
+        return
+
+    states = get_turn_states([essay_id for essay_id, _ in due])
+    reminded = []
+    for essay_id, stage in due:
+        state = states.get(essay_id)
+        # Finished, deleted or the turn moved on - the new turn has its own timer
+        if not state or state['status'] != 'in_progress' or state['turn_age'] is None or state['partner_id'] is None:
+            continue
+        if state['reminders_sent'] != stage or state['turn_age'] + TICK_SECONDS < _stage_offset(stage):
+            # Changed by another process since this timer was set - follow the database
+            _schedule_stage(essay_id, now - state['turn_age'], state['reminders_sent'])
+            continue
+
+        if state['last_writer_id'] == state['partner_id']:
+            waiting_id, other_id = state['creator_id'], state['partner_id']
+        else:
+            waiting_id, other_id = state['partner_id'], state['creator_id']
+
+        if stage < len(REMINDER_DELAYS):
+            await _send(context.bot, waiting_id, _reminder_text(state, stage), essay_id)
+            reminded.append((essay_id, stage + 1))
+            TURN_REMINDERS_SENT.labels("reminder").inc()
+            _schedule_stage(essay_id, now - state['turn_age'], stage + 1)
+        elif forfeit_turn(essay_id, waiting_id, _stage_offset(stage) - TICK_SECONDS):
+            logger.info("⌛ Turn of %s on essay %s skipped after %s", waiting_id, essay_id, _hours(state['turn_age']))
+            TURN_REMINDERS_SENT.labels("forfeit").inc()
+            await _send(context.bot, waiting_id,
+                        f"⌛ Your turn on \"{state['topic']}\" was skipped - your partner writes next.")
+            await _send(context.bot, other_id,
+                        f"🔔 YOUR TURN!\n\n📝 Essay: {state['topic']}\n\n"
+                        "Your partner didn't write in time, so the turn passed back to you.", essay_id)
+            schedule_turn(essay_id)
+
+    if reminded:
+        set_reminders_sent(reminded)
+    logger.info("⏰ Turn timers: %s due, %s reminded, %s pending", len(due), len(reminded), len(_wheel))
@@ -0,0 +1,58 @@
+"""
+Optional sharding of essays across several Postgres databases.
+
+    SHARD_DATABASE_URLS   DSNs of the essay databases, comma separated (unset: one database)
+    ESSAY_ID_SHARD_BITS   log2 of the number of logical shards (see ids.py), e.g. 4 for 16
+
+Every essay lives on the logical shard its creator hashes to, and the shard
+is encoded in the essay id (and its join code), so any essay is found without
+a lookup.  Logical shard s is stored in database s % len(SHARD_DATABASE_URLS):
+start with more logical shards than databases, and when a database gets full,
+double the list - each database then hands half of its logical shards to its
+new partner (copy them, then switch the list), and no id changes.
+
+Essays and their partners, turns and sessions stay together on one database.
+Lists by creator (my essays) read a single database; lists across creators
+(browse, search, joined essays, expiry, matchmaking) are scatter-gathered from
+all of them.  The user-scoped tables (bot_persistence, match_queue) stay on the
+main database (DATABASE_URL), which may also be one of the shards.
+"""
+import os
+
+from hashring import stable_hash
+from ids import SHARD_COUNT, id_shard, join_code_shard
+
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url.strip()]
+SHARDED = bool(SHARD_DATABASE_URLS)
+
+if SHARDED and SHARD_COUNT % len(SHARD_DATABASE_URLS):
+    raise ValueError(f"{len(SHARD_DATABASE_URLS)} shard databases can't split {SHARD_COUNT} logical shards evenly"
+                     " - set ESSAY_ID_SHARD_BITS so that 2**bits is a multiple of the number of databases")
+
+
+def creator_shard(creator_id):
+    """Logical shard of every essay created by creator_id"""
+    return stable_hash(creator_id) % SHARD_COUNT if SHARDED else 0
+
+
+def database_of_shard(shard):
+    """Index in SHARD_DATABASE_URLS of the database storing a logical shard"""
+    return shard % len(SHARD_DATABASE_URLS) if SHARDED else 0
+
+
+def database_of_essay(essay_id):
+    return database_of_shard(id_shard(essay_id))
+
+
+def database_of_creator(creator_id):
+    return database_of_shard(creator_shard(creator_id))
+
+
+def databases_for_join_code(join_code):
+    """Databases to look a join code up in: the one its shard character names first, then the others"""
+    first = database_of_shard(join_code_shard(join_code))
+    return [first] + [db for db in all_databases() if db != first]
+
+
+def all_databases():
+    return list(range(len(SHARD_DATABASE_URLS))) if SHARDED else [0]
@@ -0,0 +1,94 @@
+"""
+Per-update tracing with OpenTelemetry.
+
+TracedApplication opens a root span for every update.  database.py functions,
+generate_essay_pdf and each outbound Bot API request open child spans (see
+metrics.py), so a slow button press can be attributed to Postgres, ReportLab
+or Telegram.
+
+TRACING_EXPORTER selects where spans go: ``file`` appends one JSON span per
+line to TRACING_FILE, ``otlp`` sends them to the OTLP/HTTP collector
+configured by the standard OTEL_EXPORTER_OTLP_* variables.  Anything else
+leaves tracing off, in which case spans are no-ops.  shutdown_tracing()
+exports the spans still queued and closes the file.
+"""
+import logging
+import os
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from telegram.ext import Application
+
+import callbacks as cb
+from unit_of_work import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+
+tracer = trace.get_tracer("essay-bot")
+_provider = None
+
+
+class _FileSpanExporter(ConsoleSpanExporter):
+    """One JSON span per line, appended to a file the exporter owns"""
+
+    def __init__(self, path):
+        super().__init__(out=open(path, "a", encoding="utf-8"),
+                         formatter=lambda span: span.to_json(indent=None) + os.linesep)
+
+    def shutdown(self):
+        self.out.close()
+
+
+def setup_tracing():
+    """Install the span exporter selected by TRACING_EXPORTER"""
+    global _provider
+    if TRACING_EXPORTER == "file":
+        exporter = _FileSpanExporter(TRACING_FILE)
+    elif TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    else:
+        return
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": "essay-bot"}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    logger.info("🔭 Tracing enabled (%s)", TRACING_EXPORTER)
+
+
+def shutdown_tracing():
+    """Export the spans still queued and release the exporter (closes TRACING_FILE)"""
+    global _provider
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+
+
+def _update_name(update):
+    if update.callback_query:
+        parsed = cb.decode(update.callback_query.data)
+        return f"callback {parsed[0] if parsed else 'unknown'}"
+    message = update.effective_message
+    if message and message.text and message.text.startswith("/"):
+        return f"command {message.text.split()[0].split('@')[0]}"
+    return "message"
+
+
+class TracedApplication(Application):
+    """Application that wraps the processing of every update in a root span and a unit of work"""
+
+    __slots__ = ()
+
+    async def process_update(self, update):
+        if not hasattr(update, "update_id"):
+            return await super().process_update(update)
+        with unit_of_work(), tracer.start_as_current_span(f"update {_update_name(update)}") as span:
+            span.set_attribute("telegram.update_id", update.update_id)
+            if update.effective_user:
+                span.set_attribute("telegram.user_id", update.effective_user.id)
+            return await super().process_update(update)
@@ -0,0 +1,209 @@
+"""
+Bulk export and import of essays, partners and user sessions with COPY.
+
+Export streams ``COPY ... TO STDOUT`` straight into one file per table, as
+CSV (with a header) or JSONL (one JSON object per row), gzip-compressed when
+asked, so no table is ever held in memory.  Import loads each file with
+``COPY ... FROM STDIN`` into a temporary staging table and merges it into
+the live table with an upsert, so re-importing the same files is harmless
+and moving data between environments doesn't need an empty database.
+Essays are imported first (creating any missing monthly partitions), then
+partners and sessions whose essay exists.  An essay whose join code already
+belongs to a different essay in the target database stops the import of
+essays, with the clashing codes reported, since /join would find the wrong one.
+
+Usage:
+    python transfer.py export DIR [--format jsonl|csv] [--gzip] [--tables essays partners user_session]
+    python transfer.py import DIR [--tables ...]
+"""
+import argparse
+import gzip
+import logging
+import os
+import time
+
+import psycopg2
+
+from database import get_connection
+from ids import id_timestamp_ms
+from logging_setup import setup_logging
+from models import ESSAY_COLUMNS
+from partitions import ensure_partitions_since
+from shards import SHARDED
+
+logger = logging.getLogger(__name__)
+
+# table -> (columns, conflict key); partners.id is a local sequence value and is not carried over
+TABLES = {
+    "essays": (ESSAY_COLUMNS, ("id",)),
+    "partners": (("essay_id", "partner_id", "partner_name", "is_anonymous"), ("essay_id", "partner_id")),
+    "user_session": (("user_id", "current_essay_id", "updated_at"), ("user_id",)),
+}
+FORMATS = ("jsonl", "csv")
+MAX_CLASHES_SHOWN = 20
+
+# CSV with quote and delimiter bytes that never occur in JSON text: each line passes through verbatim
+_RAW_LINES = "FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02'"
+
+
+def _path(directory, table, fmt, compressed):
+    return os.path.join(directory, f"{table}.{fmt}{'.gz' if compressed else ''}")
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def _find_file(directory, table):
+    """(path, format) of the export of table in directory, or None"""
+    for fmt in FORMATS:
+        for compressed in (False, True):
+            path = _path(directory, table, fmt, compressed)
+            if os.path.exists(path):
+                return path, fmt
+    return None
+
+
+def _report(action, table, rows, started):
+    elapsed = time.perf_counter() - started
+    logger.info("📦 %s %s: %s rows in %.1f s (%.0f rows/s)", action, table, rows, elapsed, rows / elapsed if elapsed else 0)
+
+
+def export_table(conn, table, directory, fmt="jsonl", compressed=False):
+    """COPY one table into directory; returns the number of rows"""
+    columns, key = TABLES[table]
+    select = f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(key)}"
+    if fmt == "csv":
+        sql = f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    else:
+        sql = f"COPY (SELECT row_to_json(t) FROM ({select}) t) TO STDOUT WITH ({_RAW_LINES})"
+
+    started = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        with _open(_path(directory, table, fmt, compressed), "wb") as f:
+            cur.copy_expert(sql, f)
+        rows = cur.rowcount
+    finally:
+        cur.close()
+    _report("Exported", table, rows, started)
+    return rows
+
+
+def _ensure_essay_partitions(cur):
+    """Create monthly partitions back to the oldest staged essay so rows don't land in the DEFAULT partition"""
+    cur.execute("SELECT min(id) FROM stage_essays")
+    oldest = cur.fetchone()[0]
+    if oldest is not None:
+        ensure_partitions_since(id_timestamp_ms(oldest))
+
+
+def import_table(conn, table, path, fmt):
+    """Load one export file through a staging table and upsert it; returns (staged, merged) row counts"""
+    columns, key = TABLES[table]
+    column_list = ", ".join(columns)
+    stage = f"stage_{table}"
+    started = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DROP TABLE IF EXISTS {stage}, stage_json")
+        cur.execute(f"CREATE TEMP TABLE {stage} AS SELECT {column_list} FROM {table} WITH NO DATA")
+        with _open(path, "rb") as f:
+            if fmt == "csv":
+                cur.copy_expert(f"COPY {stage} ({column_list}) FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+            else:
+                cur.execute("CREATE TEMP TABLE stage_json (doc jsonb)")
+                cur.copy_expert(f"COPY stage_json FROM STDIN WITH ({_RAW_LINES})", f)
+                cur.execute(f"""
+                    INSERT INTO {stage} SELECT {column_list}
+                    FROM stage_json, jsonb_populate_record(NULL::{stage}, doc)
+                """)
+        cur.execute(f"SELECT count(*) FROM {stage}")
+        staged = cur.fetchone()[0]
+        # Release the lock on the live table: creating partitions needs it exclusively
+        conn.commit()
+
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column not in key)
+        source = f"SELECT {column_list} FROM {stage} s"
+        if table == "essays":
+            cur.execute(f"""
+                SELECT s.id, s.join_code, j.essay_id FROM {stage} s
+                JOIN join_codes j ON j.join_code = s.join_code
+                WHERE j.essay_id <> s.id
+            """)
+            clashes = cur.fetchall()
+            if clashes:
+                for essay_id, join_code, owner_id in clashes[:MAX_CLASHES_SHOWN]:
+                    logger.error("❌ Essay %s: join code %s already belongs to essay %s", essay_id, join_code, owner_id)
+                raise RuntimeError(f"{len(clashes)} essays in {path} have join codes of other essays - none imported")
+            _ensure_essay_partitions(cur)
+            cur.execute(f"""
+                INSERT INTO join_codes (join_code, essay_id)
+                SELECT join_code, id FROM {stage}
+                ON CONFLICT (join_code) DO NOTHING
+            """)
+        elif table == "partners":
+            source += " WHERE EXISTS (SELECT 1 FROM essays e WHERE e.id = s.essay_id)"
+        elif table == "user_session":
+            source += " WHERE EXISTS (SELECT 1 FROM essays e WHERE e.id = s.current_essay_id)"
+        cur.execute(f"""
+            INSERT INTO {table} ({column_list})
+            {source}
+            ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}
+        """)
+        merged = cur.rowcount
+        cur.execute(f"DROP TABLE IF EXISTS {stage}, stage_json")
+        conn.commit()
+    except (psycopg2.Error, RuntimeError) as e:
+        conn.rollback()
+        logger.error("❌ Importing %s failed: %s", path, e)
+        raise
+    finally:
+        cur.close()
+    _report("Imported", table, staged, started)
+    if merged < staged:
+        logger.warning("⚠️ %s: %s of %s rows skipped (their essay does not exist)", table, staged - merged, staged)
+    return staged, merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write one file per table into DIR")
+    export.add_argument("directory", metavar="DIR")
+    export.add_argument("--format", choices=FORMATS, default="jsonl")
+    export.add_argument("--gzip", action="store_true", help="compress the files")
+    export.add_argument("--tables", nargs="+", choices=list(TABLES), default=list(TABLES))
+    load = commands.add_parser("import", help="upsert the files found in DIR")
+    load.add_argument("directory", metavar="DIR")
+    load.add_argument("--tables", nargs="+", choices=list(TABLES), default=list(TABLES))
+    args = parser.parse_args()
+    if SHARDED:
+        parser.error("sharded storage (SHARD_DATABASE_URLS) is not supported - this copies one database")
+
+    setup_logging()
+    conn = get_connection()
+    try:
+        if args.command == "export":
+            os.makedirs(args.directory, exist_ok=True)
+            # One snapshot for all tables, so partners and sessions match the exported essays
+            conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+            for table in args.tables:
+                export_table(conn, table, args.directory, args.format, args.gzip)
+            conn.commit()
+        else:
+            # TABLES is in dependency order, whatever order --tables was given in
+            for table in [table for table in TABLES if table in args.tables]:
+                found = _find_file(args.directory, table)
+                if found is None:
+                    logger.warning("⚠️ No export of %s in %s", table, args.directory)
+                    continue
+                import_table(conn, table, *found)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Per-update unit of work: an identity map of essays and a statement counter.
+
+A handler often needs the same essay several times (confirm_write reads it,
+writes it and reads it again to notify the other writer).  While an update is
+processed, database.py keeps every essay it loads in the current UnitOfWork
+and hands back that same object on the next lookup; its own writes
+(update_essay, start_turn, add_partner, claim_essay) update the object in
+place, so each essay is read at most once per update.  Outside an update
+(jobs, scripts) there is no unit of work and every call hits the database.
+
+The statements each handler runs are observed in
+essaybot_handler_db_statements.  With ``QUERY_BUDGET`` (all handlers) or
+``QUERY_BUDGETS`` (``name=limit,...``) set, a handler going over its budget
+is logged, or raises QueryBudgetExceeded when ``QUERY_BUDGET_STRICT=1``
+(meant for tests and load runs).
+"""
+import contextvars
+import logging
+import os
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))  # 0 disables the check
+QUERY_BUDGETS = {
+    name.strip(): int(limit)
+    for name, _, limit in (item.partition("=") for item in os.getenv("QUERY_BUDGETS", "").split(",") if item.strip())
+}
+STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class UnitOfWork:
+    """Essays loaded during one update, by id and join code, and the statements run"""
+
+    __slots__ = ("essays", "join_codes", "statements")
+
+    def __init__(self):
+        self.essays = {}
+        self.join_codes = {}
+        self.statements = 0
+
+    def get(self, essay_id):
+        return self.essays.get(essay_id)
+
+    def get_by_join_code(self, join_code):
+        essay_id = self.join_codes.get(join_code)
+        return None if essay_id is None else self.essays.get(essay_id)
+
+    def add(self, essay):
+        """Track essay (replacing an older copy) and return it"""
+        self.essays[essay.id] = essay
+        self.join_codes[essay.join_code] = essay.id
+        return essay
+
+    def discard(self, essay_id):
+        self.essays.pop(essay_id, None)
+
+
+_current = contextvars.ContextVar("unit_of_work", default=None)
+
+
+def current():
+    """The UnitOfWork of the update being processed, or None"""
+    return _current.get()
+
+
+@contextmanager
+def unit_of_work():
+    """Run the block in a unit of work, joining the current one if there is one"""
+    work = _current.get()
+    if work is not None:
+        yield work
+        return
+    work = UnitOfWork()
+    token = _current.set(work)
+    try:
+        yield work
+    finally:
+        _current.reset(token)
+
+
+def check_query_budget(name, statements):
+    """Report a handler that ran more statements than its budget"""
+    budget = QUERY_BUDGETS.get(name, QUERY_BUDGET)
+    if not budget or statements <= budget:
+        return
+    message = f"{name} ran {statements} SQL statements, over its budget of {budget}"
+    if STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning("⚠️ %s", message)
@@ -0,0 +1,142 @@
+"""
+Sharded deployment: several bot workers behind the webhook ingress (ingress.py).
+
+The ingress receives Telegram's webhook calls and forwards each update to the
+worker that owns its user on a consistent hash ring, so a user's
+conversation state, user_data and pending turn always live in the same
+process; anything shared between users goes through Postgres.  Adding a
+worker to WORKERS only moves about 1/N of the users.
+
+    WORKERS         name=url of every worker, comma separated; identical on the ingress and all workers
+    WORKER_NAME     this worker's name - bot.py runs as a worker (no polling) when it is set
+    WORKER_PORT     port the worker accepts forwarded updates on (default 8443)
+    INGRESS_SECRET  shared secret the ingress sends and workers check (optional)
+
+Process-wide duties are split: the first worker by name runs the singleton
+jobs (expiry, partitions, turn reminders - it follows turns started on other
+workers through invalidation.py), and each worker only pairs the queued
+writers it owns.  Without WORKERS the bot is a single process doing it all.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+from http import HTTPStatus
+
+from telegram import Update
+
+from hashring import HashRing
+
+logger = logging.getLogger(__name__)
+
+WORKERS = {
+    name.strip(): url.strip()
+    for name, _, url in (item.partition("=") for item in os.getenv("WORKERS", "").split(",") if item.strip())
+}
+WORKER_NAME = os.getenv("WORKER_NAME", "")
+WORKER_PORT = int(os.getenv("WORKER_PORT", "8443"))
+INGRESS_SECRET = os.getenv("INGRESS_SECRET", "")
+SECRET_HEADER = "x-ingress-secret"
+MAX_BODY_BYTES = 1 << 20
+
+ring = HashRing(WORKERS) if WORKERS else None
+
+
+def owns_user(user_id):
+    """Whether updates of user_id are routed to this process"""
+    return ring is None or not WORKER_NAME or ring.node_for(user_id) == WORKER_NAME
+
+
+def runs_singleton_jobs():
+    """Whether this process runs the jobs only one process may run"""
+    return ring is None or not WORKER_NAME or WORKER_NAME == ring.nodes[0]
+
+
+def routing_key(update):
+    """The id an update (as decoded JSON) is routed by: its user, else its chat, else the update id"""
+    for field, value in update.items():
+        if field == "update_id" or not isinstance(value, dict):
+            continue
+        for key in ("from", "user"):
+            if isinstance(value.get(key), dict) and "id" in value[key]:
+                return value[key]["id"]
+        if isinstance(value.get("chat"), dict) and "id" in value["chat"]:
+            return value["chat"]["id"]
+    return update.get("update_id", 0)
+
+
+async def serve_http(handler, host, port):
+    """Minimal HTTP/1.1 server (keep-alive, Content-Length bodies) calling handler(method, path, headers, body)"""
+    async def client(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, b"{}"
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await handler(method, path, headers, body)
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(client, host, port)
+
+
+async def run_worker(application, host="0.0.0.0", port=WORKER_PORT):
+    """Run application on updates forwarded by the ingress until SIGINT/SIGTERM (replaces run_polling)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def handle(method, path, headers, body):
+        if method == "GET" and path == "/healthz":
+            return HTTPStatus.OK, b'{"ok": true}'
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, b"{}"
+        if INGRESS_SECRET and headers.get(SECRET_HEADER) != INGRESS_SECRET:
+            return HTTPStatus.FORBIDDEN, b"{}"
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, b"{}"
+        await application.update_queue.put(update)
+        return HTTPStatus.OK, b'{"ok": true}'
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    server = await serve_http(handle, host, port)
+    logger.info("🧩 Worker %s accepting updates on :%s (%s workers)", WORKER_NAME, port, len(WORKERS))
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)